@@ -0,0 +1,7 @@
+def __getattr__(name: str):
+    # Import the importer module only when the class is used.
+    if name == "Importer":
+        from .importer import Importer
+
+        return Importer
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,20 +1,78 @@
 #! Code voor een ASN betaalrekening
 
+from datetime import date
 from os import path
-from typing import Dict, Optional, Tuple
+from typing import Dict, List, NamedTuple, Optional, Tuple
 from beancount.core import data, number, position
 from beangulp.importers import csvbase
+from beangulp_importers import base, identify
 import csv as pycsv
+import os
 import re
 
 pycsv.register_dialect("asnbankdialect", delimiter=",")
 
 
-class Importer(csvbase.Importer):
+# The known investment funds. Maps the fund name in the narration (without spaces) to
+# the sub account of the investment account and the currency of the participations.
+FUNDS: Dict[str, Tuple[str, str]] = {
+    "ASNDuurzaamMixfondsZeerDefensief": (
+        "DuurzaamMixfondsZeerDefensief",
+        "ASN_MIXFONDS_ZEER_DEFENSIEF",
+    ),
+    "ASNDuurzaamMixfondsDefensief": (
+        "DuurzaamMixfondsDefensief",
+        "ASN_MIXFONDS_DEFENSIEF",
+    ),
+    "ASNDuurzaamMixfondsNeutraal": (
+        "DuurzaamMixfondsNeutraal",
+        "ASN_MIXFONDS_NEUTRAAL",
+    ),
+    "ASNDuurzaamMixfondsOffensief": (
+        "DuurzaamMixfondsOffensief",
+        "ASN_MIXFONDS_OFFENSIEF",
+    ),
+    "ASNDuurzaamMixfondsZeerOffensief": (
+        "DuurzaamMixfondsZeerOffensief",
+        "ASN_MIXFONDS_ZEER_OFFENSIEF",
+    ),
+    "ASNMilieu&Waterfonds": ("MilieuEnWaterfonds", "ASN_MILIEU_EN_WATERFONDS"),
+    "ASN-NovibMicrokredietfonds": ("Microkredietfonds", "ASN_MICROKREDIETFONDS"),
+    "ASNDuurzaamObligatiefonds": ("Obligatiefonds", "ASN_OBLIGATIEFONDS"),
+    "ASNMicrokredietfonds": ("Microkredietfonds", "ASN_MICROKREDIETFONDS"),
+    "ASNGroenprojectenfonds": ("Groenprojectenfonds", "ASN_GROENPROJECTENFONDS"),
+}
+
+
+class UnknownFund(NamedTuple):
+    """An investment transaction for a fund that is not in the fund table."""
+
+    share_type: str
+    date: date
+    filename: Optional[str]
+    lineno: Optional[int]
+
+
+class FileInfo(NamedTuple):
+    """What is known about a file after parsing it."""
+
+    # The IBAN of the account the file belongs to.
+    own_account: str
+
+
+class Importer(base.Importer):
     encoding = "utf8"
     names = False
     dialect = "asnbankdialect"
+    profile_column = "booking_code"
+
+    investment_regex = re.compile(
+        r"^Voor\s+u\s+([a-z]+kocht)\s+via\s+Euronext\s+Fund\s+Services:\s+(\d+ \d+)\s+Participaties\s+(.*)\s+a\s+EUR\s+(\d+ \d+)."
+    )
 
+    #! - funds: Extra or changed entries for the fund table, see FUNDS.
+    #! - daily_balances: Add a balance assertion for every date in the file, instead of
+    #!   only for the last one.
     def __init__(
         self,
         known_accounts: Dict[str, str],
@@ -22,11 +80,19 @@ class Importer(csvbase.Importer):
         interest_account: Optional[str] = None,
         investment_account: Optional[str] = None,
         profit_loss_account: Optional[str] = None,
+        funds: Optional[Dict[str, Tuple[str, str]]] = None,
+        daily_balances: bool = False,
     ) -> None:
         self.known_accounts = known_accounts
+        self.daily_balances = daily_balances
         self.interest_account = interest_account
         self.investment_account = investment_account
         self.profit_loss_account = profit_loss_account
+        self.funds = dict(FUNDS)
+        if funds is not None:
+            self.funds.update(funds)
+        # Investment transactions that were skipped because the fund is not known.
+        self.unknown_funds: List[UnknownFund] = []
         self.columns = {
             "date": csvbase.Date(0, "%d-%m-%Y"),
             "own_account": csvbase.Column(1),
@@ -37,48 +103,131 @@ class Importer(csvbase.Importer):
             "balance_before": csvbase.Amount(8),
             "booking_code": csvbase.Column(14),
         }
+        # Per-file information, keyed by path, modification time and size.
+        self.file_info: Dict[Tuple[str, int, int], FileInfo] = {}
         super().__init__("ACCOUNT_PLACEHOLDER", currency)
 
     def filename(self, filepath) -> str:
         return "asnbank." + path.basename(filepath)
 
+    def file_key(self, filepath: str) -> Tuple[str, int, int]:
+        stat = os.stat(filepath)
+        return (path.abspath(filepath), stat.st_mtime_ns, stat.st_size)
+
+    def read(self, filepath):
+        """Read the rows and remember the account of the file along the way."""
+        key = self.file_key(filepath)
+        for row in super().read(filepath):
+            if row and key not in self.file_info:
+                self.file_info[key] = FileInfo(row.own_account)
+            yield row
+
     def account(self, filepath: str) -> str:
-        for row in self.read(filepath):
-            return self.known_accounts[row.own_account]
+        key = self.file_key(filepath)
+        if key not in self.file_info:
+            # Reading the first row is enough to find the account.
+            next(iter(self.read(filepath)), None)
+        info = self.file_info.get(key)
+        if info is not None:
+            return self.known_accounts[info.own_account]
 
-    def identify(remap, file) -> bool:
-        with open(file) as fd:
-            head = fd.read(1024)
-        return not re.search("^\d\d-\d\d-\d\d\d\d,", head) is None
+    def identify(self, file) -> bool:
+        return identify.matches("asnbank", file)
 
     def extract(self, filepath, existing) -> data.Entries:
-        entries = super().extract(filepath, existing)
-
-        # Build a balance entry. The balance is not after but before, so this requires custom code.
-        if len(entries) != 0:
-            date = entries[-1].date
-            (row, lineno) = next(
-                (row, lineno)
-                for lineno, row in enumerate(self.read(filepath))
-                if row.date == date
-            )
-            units = data.Amount(row.balance_before, self.currency)
-            meta = data.new_metadata(filepath, lineno)
-            balance = data.Balance(
-                meta, date, self.known_accounts[row.own_account], units, None, None
-            )
+        checkpoint = self.resume(filepath)
+        # The balance of the date the previous extraction ended on was already added then.
+        extracted_date = None
+        if checkpoint is not None:
+            extracted_date = date.fromisoformat(checkpoint.state["date"])
+
+        own_account = None
+        balances = []
+        entries = []
+        last = None
+        for transaction, row, lineno, span in self.transactions(filepath, checkpoint):
+            if own_account is None:
+                own_account = row.own_account
+            # The rows are ordered by date, remember the first and last row of a date.
+            if row.date != extracted_date:
+                balance = (lineno, row.date, row.balance_before)
+                if len(balances) == 0 or balances[-1][0][1] != row.date:
+                    balances.append([balance, balance])
+                else:
+                    balances[-1][1] = balance
+            entries.append(transaction)
+            last = (lineno, span, row.date)
 
-            # Now insert at the correct location
-            found_index = 0
-            for index, value in enumerate(entries):
-                if value.date == date:
-                    found_index = index
-                    break
+        if own_account is None:
+            self.finish_profile(filepath)
+            return []
+        self.file_info[self.file_key(filepath)] = FileInfo(own_account)
+        lineno, span, last_date = last
+        self.commit(filepath, lineno, span, {"date": last_date.isoformat()})
 
-            entries.insert(found_index, balance)
+        # Reverse the list if the file is in descending order.
+        descending = not entries[0].date <= entries[-1].date
+        if descending:
+            entries.reverse()
+        # The balance before a date is that of its first transaction, which is the
+        # last row of the date in a descending file.
+        balances = [last if descending else first for first, last in balances]
 
+        insert_balances = self.timed("post", self.insert_balances)
+        entries = insert_balances(filepath, entries, own_account, balances)
+        entries = self.categorize(entries, existing)
+        self.finish_profile(filepath)
         return entries
 
+    def insert_balances(
+        self, filepath: str, entries: data.Entries, own_account: str, balances: list
+    ) -> data.Entries:
+        """Add balance entries in front of the first transaction of their date.
+
+        The balance is not after but before, so this requires custom code.
+        """
+        # The entries are in ascending order, even if the file is not.
+        balances = sorted(balances, key=lambda balance: balance[1])
+        if not self.daily_balances:
+            balances = balances[-1:]
+
+        account = self.known_accounts[own_account]
+        result = []
+        index = 0
+        for entry in entries:
+            while index < len(balances) and balances[index][1] <= entry.date:
+                lineno, date, balance_before = balances[index]
+                units = data.Amount(balance_before, self.currency)
+                meta = data.new_metadata(filepath, lineno)
+                result.append(data.Balance(meta, date, account, units, None, None))
+                index += 1
+            result.append(entry)
+
+        return result
+
+    def metadata(self, filepath: str, lineno: int, row):
+        meta = super().metadata(filepath, lineno, row)
+        # The IBAN of the other party, for categorization rules.
+        if row.other_account:
+            meta["iban"] = row.other_account
+        return meta
+
+    @staticmethod
+    def duplicate_keys(entry):
+        # The date, amount, other party and description on any of the accounts. The
+        # same transfer between two known accounts shows up in the statements of both
+        # accounts. The narration is often just "GEEN", so the payee tells apart
+        # transfers of the same amount to different parties.
+        for posting in entry.postings:
+            if posting.units is not None:
+                yield (
+                    entry.date,
+                    posting.account,
+                    posting.units,
+                    entry.payee,
+                    entry.narration,
+                )
+
     def finalize(self, transaction, row):
         # Set the account number
         transaction.postings[0] = transaction.postings[0]._replace(
@@ -121,18 +270,27 @@ class Importer(csvbase.Importer):
             and self.profit_loss_account != None
             and row.booking_code == "EFF"
         ):
-            regex = "^Voor\s+u\s+([a-z]+kocht)\s+via\s+Euronext\s+Fund\s+Services:\s+(\d+ \d+)\s+Participaties\s+(.*)\s+a\s+EUR\s+(\d+ \d+)."
-            result = re.match(regex, transaction.narration)
+            result = self.investment_regex.match(transaction.narration)
             profit_loss = False
+            investment = None
             if result != None:
+                share_type = result.group(3).replace(" ", "")
+                investment = self.get_investment_account_and_currency(share_type)
+                if investment is None:
+                    print("Warning: Unknown share type: " + share_type)
+                    self.unknown_funds.append(
+                        UnknownFund(
+                            share_type,
+                            transaction.date,
+                            transaction.meta.get("filename"),
+                            transaction.meta.get("lineno"),
+                        )
+                    )
+            if investment != None:
                 transaction_type = result.group(1)
                 share_amount = number.D(result.group(2).replace(" ", "."))
-                share_type = result.group(3).replace(" ", "")
                 share_cost = number.D(result.group(4).replace(" ", "."))
-                (
-                    other_account,
-                    share_currency,
-                ) = self.get_investment_account_and_currency(share_type)
+                other_account, share_currency = investment
                 price = None
                 cost = None
                 if transaction_type == "verkocht":
@@ -159,37 +317,11 @@ class Importer(csvbase.Importer):
 
         return transaction
 
-    def get_investment_account_and_currency(self, share_type: str) -> Tuple[str, str]:
-        if share_type == "ASNDuurzaamMixfondsZeerDefensief":
-            other_account = self.investment_account + ":DuurzaamMixfondsZeerDefensief"
-            share_currency = "ASN_MIXFONDS_ZEER_DEFENSIEF"
-        elif share_type == "ASNDuurzaamMixfondsDefensief":
-            other_account = self.investment_account + ":DuurzaamMixfondsDefensief"
-            share_currency = "ASN_MIXFONDS_DEFENSIEF"
-        elif share_type == "ASNDuurzaamMixfondsNeutraal":
-            other_account = self.investment_account + ":DuurzaamMixfondsNeutraal"
-            share_currency = "ASN_MIXFONDS_NEUTRAAL"
-        elif share_type == "ASNDuurzaamMixfondsOffensief":
-            other_account = self.investment_account + ":DuurzaamMixfondsOffensief"
-            share_currency = "ASN_MIXFONDS_OFFENSIEF"
-        elif share_type == "ASNDuurzaamMixfondsZeerOffensief":
-            other_account = self.investment_account + ":DuurzaamMixfondsZeerOffensief"
-            share_currency = "ASN_MIXFONDS_ZEER_OFFENSIEF"
-        elif share_type == "ASNMilieu&Waterfonds":
-            other_account = self.investment_account + ":MilieuEnWaterfonds"
-            share_currency = "ASN_MILIEU_EN_WATERFONDS"
-        elif share_type == "ASN-NovibMicrokredietfonds":
-            other_account = self.investment_account + ":Microkredietfonds"
-            share_currency = "ASN_MICROKREDIETFONDS"
-        elif share_type == "ASNDuurzaamObligatiefonds":
-            other_account = self.investment_account + ":Obligatiefonds"
-            share_currency = "ASN_OBLIGATIEFONDS"
-        elif share_type == "ASNMicrokredietfonds":
-            other_account = self.investment_account + ":Microkredietfonds"
-            share_currency = "ASN_MICROKREDIETFONDS"
-        elif share_type == "ASNGroenprojectenfonds":
-            other_account = self.investment_account + ":Groenprojectenfonds"
-            share_currency = "ASN_GROENPROJECTENFONDS"
-        else:
-            print("Warning: Unknown share type: " + share_type)
-        return [other_account, share_currency]
+    def get_investment_account_and_currency(
+        self, share_type: str
+    ) -> Optional[Tuple[str, str]]:
+        fund = self.funds.get(share_type)
+        if fund is None:
+            return None
+        sub_account, share_currency = fund
+        return (self.investment_account + ":" + sub_account, share_currency)
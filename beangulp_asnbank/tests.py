@@ -1,9 +1,12 @@
 from beangulp_asnbank import importer
+from beangulp_importers.checkpoint import Checkpoints
 
 from beancount.parser import cmptest, printer, parser
 from beancount.utils.test_utils import docfile
 from beangulp import extract
 import itertools
+import os
+import tempfile
 
 accounts = {
     "IBAN_CHEQUING": "Assets:Chequing",
@@ -63,6 +66,7 @@ class TestAsnBank(cmptest.TestCase):
 2021-10-05 balance Assets:Spaarrekening                            100.00 EUR
 
 2021-10-05 * "CREDITRENTE                     TOT 01-10-21"
+  fingerprint: "24ad22d750ecacab"
   Assets:Spaarrekening   1.00 EUR
   Income:Rente          -1.00 EUR
 
@@ -92,6 +96,7 @@ class TestAsnBank(cmptest.TestCase):
 2021-10-04 balance Assets:Beleggen                                 12.50 EUR
 
 2021-10-04 * "Aankoop beleggen"
+  fingerprint: "4d114d3292151928"
   Assets:Beleggen                                 -12.50 EUR
   Assets:Beleggen:Fonds:DuurzaamMixfondsNeutraal  0.1000 ASN_MIXFONDS_NEUTRAAL {50.00 EUR}
 
@@ -125,6 +130,7 @@ class TestAsnBank(cmptest.TestCase):
 2021-11-04 balance Assets:Beleggen                                 100.00 EUR
 
 2021-11-04 * "Verkoop beleggen"
+  fingerprint: "5b1a8e82461a15b6"
   Assets:Beleggen                           120.00 EUR
   Assets:Beleggen:Fonds:Microkredietfonds  -0.1000 ASN_MICROKREDIETFONDS {} @ 50.00 EUR
   Income:PL
@@ -158,6 +164,27 @@ class TestAsnBank(cmptest.TestCase):
 
         assert entries[1].meta[DUPLICATE] == True
 
+    @docfile
+    def test_duplicate_payee(self, filename: str) -> None:
+        """\
+09-01-2022,IBAN_CHEQUING,IBAN_ALICE,alice,,,,EUR,50.00,EUR,-5.00,09-01-2022,09-01-2022,1234,IOB,12345678,,GEEN,1
+09-01-2022,IBAN_CHEQUING,IBAN_BOB,bob,,,,EUR,45.00,EUR,-5.00,09-01-2022,09-01-2022,1234,IOB,12345678,,GEEN,1
+        """
+        existing_entries = parser.parse_many(
+            """\
+2022-01-09 * "alice" "GEEN"
+  Assets:Chequing  -5.00 EUR
+  Expenses:Food     5.00 EUR
+        """
+        )
+        asnbank_importer = importer.Importer(accounts)
+        entries = asnbank_importer.extract(filename, existing_entries)
+        asnbank_importer.deduplicate(entries, existing_entries)
+        # Only the transfer to the same party is a duplicate.
+        self.assertEqual([e.payee for e in entries[1:]], ["alice", "bob"])
+        self.assertIs(entries[1].meta[DUPLICATE], existing_entries[0])
+        self.assertNotIn(DUPLICATE, entries[2].meta)
+
     # Test whether the account is discovered correctly
     @docfile
     def test_account_name(self, filename: str) -> None:
@@ -166,3 +193,180 @@ class TestAsnBank(cmptest.TestCase):
         """
         asnbank_importer = importer.Importer(accounts)
         self.assertEqual(asnbank_importer.account(filename), accounts["IBAN_CHEQUING"])
+
+    # The account and balance come from the parse done by extract
+    @docfile
+    def test_file_info_cached(self, filename: str) -> None:
+        """\
+09-01-2022,IBAN_CHEQUING,IBAN_SAVINGS,name,,,,EUR,50.21,EUR,10.00,09-01-2022,09-01-2022,1234,IOB,12345678,,GEEN,1
+10-01-2022,IBAN_CHEQUING,IBAN_SAVINGS,name,,,,EUR,60.21,EUR,-5.00,10-01-2022,10-01-2022,1234,IOB,12345678,,GEEN,1
+        """
+        asnbank_importer = importer.Importer(accounts)
+        entries = asnbank_importer.extract(filename, [])
+        self.assertEqual(entries[1].amount.number, importer.number.D("60.21"))
+
+        def read(filepath):
+            raise AssertionError("The file should not be read again")
+
+        asnbank_importer.read = read
+        self.assertEqual(asnbank_importer.account(filename), accounts["IBAN_CHEQUING"])
+
+    @docfile
+    def test_daily_balances(self, filename: str) -> None:
+        """\
+09-01-2022,IBAN_CHEQUING,IBAN_PAYEE,name,,,,EUR,50.00,EUR,10.00,09-01-2022,09-01-2022,1234,IOB,12345678,,GEEN,1
+09-01-2022,IBAN_CHEQUING,IBAN_PAYEE,name,,,,EUR,60.00,EUR,-5.00,09-01-2022,09-01-2022,1234,IOB,12345678,,GEEN,1
+10-01-2022,IBAN_CHEQUING,IBAN_PAYEE,name,,,,EUR,55.00,EUR,-5.00,10-01-2022,10-01-2022,1234,IOB,12345678,,GEEN,1
+        """
+        asnbank_importer = importer.Importer(accounts, daily_balances=True)
+        entries = asnbank_importer.extract(filename, [])
+        self.assertEqualEntries(
+            entries,
+            """
+            2022-01-09 balance Assets:Chequing                                 50.00 EUR
+
+            2022-01-09 * "name" "GEEN"
+                Assets:Chequing  10.00 EUR
+
+            2022-01-09 * "name" "GEEN"
+                Assets:Chequing  -5.00 EUR
+
+            2022-01-10 balance Assets:Chequing                                 55.00 EUR
+
+            2022-01-10 * "name" "GEEN"
+                Assets:Chequing  -5.00 EUR
+        """,
+        )
+
+    @docfile
+    def test_descending_balances(self, filename: str) -> None:
+        """\
+10-01-2022,IBAN_CHEQUING,IBAN_PAYEE,name,,,,EUR,55.00,EUR,-5.00,10-01-2022,10-01-2022,1234,IOB,12345678,,GEEN,1
+09-01-2022,IBAN_CHEQUING,IBAN_PAYEE,name,,,,EUR,60.00,EUR,-5.00,09-01-2022,09-01-2022,1234,IOB,12345678,,GEEN,1
+09-01-2022,IBAN_CHEQUING,IBAN_PAYEE,name,,,,EUR,50.00,EUR,10.00,09-01-2022,09-01-2022,1234,IOB,12345678,,GEEN,1
+        """
+        asnbank_importer = importer.Importer(accounts)
+        entries = asnbank_importer.extract(filename, [])
+        self.assertEqualEntries(
+            entries,
+            """
+            2022-01-09 * "name" "GEEN"
+                Assets:Chequing  10.00 EUR
+
+            2022-01-09 * "name" "GEEN"
+                Assets:Chequing  -5.00 EUR
+
+            2022-01-10 balance Assets:Chequing                                 55.00 EUR
+
+            2022-01-10 * "name" "GEEN"
+                Assets:Chequing  -5.00 EUR
+        """,
+        )
+
+        # The first transaction of a date is the last row of the date in the file.
+        asnbank_importer = importer.Importer(accounts, daily_balances=True)
+        entries = asnbank_importer.extract(filename, [])
+        balances = [e for e in entries if isinstance(e, importer.data.Balance)]
+        self.assertEqual(
+            [(e.date.day, e.amount.number) for e in balances],
+            [(9, importer.number.D("50.00")), (10, importer.number.D("55.00"))],
+        )
+
+    @docfile
+    def test_quote_in_narration(self, filename: str) -> None:
+        """\
+09-01-2022,IBAN_CHEQUING,IBAN_PAYEE,name,,,,EUR,50.00,EUR,-5.00,09-01-2022,09-01-2022,1234,IOB,12345678,,'Pizza 12" large',1
+09-01-2022,IBAN_CHEQUING,IBAN_PAYEE,name,,,,EUR,45.00,EUR,-2.00,09-01-2022,09-01-2022,1234,IOB,12345678,,'Cola',2
+10-01-2022,IBAN_CHEQUING,IBAN_PAYEE,name,,,,EUR,43.00,EUR,-3.00,10-01-2022,10-01-2022,1234,IOB,12345678,,'Tip 3"',3
+10-01-2022,IBAN_CHEQUING,IBAN_PAYEE,name,,,,EUR,40.00,EUR,10.00,10-01-2022,10-01-2022,1234,IOB,12345678,,'Refund',4
+        """
+        asnbank_importer = importer.Importer(accounts, daily_balances=True)
+        entries = asnbank_importer.extract(filename, [])
+        self.assertEqualEntries(
+            entries,
+            """
+            2022-01-09 balance Assets:Chequing                                 50.00 EUR
+
+            2022-01-09 * "name" "Pizza 12\\" large"
+                Assets:Chequing  -5.00 EUR
+
+            2022-01-09 * "name" "Cola"
+                Assets:Chequing  -2.00 EUR
+
+            2022-01-10 balance Assets:Chequing                                 43.00 EUR
+
+            2022-01-10 * "name" "Tip 3\\""
+                Assets:Chequing  -3.00 EUR
+
+            2022-01-10 * "name" "Refund"
+                Assets:Chequing  10.00 EUR
+        """,
+        )
+
+    @docfile
+    def test_unknown_fund(self, filename: str) -> None:
+        """\
+04-10-2021,IBAN_INVESTING,,,,,,EUR,12.50,EUR,-12.50,04-10-2021,06-10-2021,0000,EFF,00000000,,'Voor u gekocht via Euronext Fund Services: 0 1000 Participaties ASN Nieuw Fonds a EUR 50 00. Valutadatum:       06/10/2021.',0
+        """
+        asnbank_importer = importer.Importer(
+            accounts,
+            investment_account="Assets:Beleggen:Fonds",
+            profit_loss_account="Income:PL",
+        )
+        entries = asnbank_importer.extract(filename, [])
+        self.assertEqual(len(entries[1].postings), 1)
+        self.assertEqual(
+            [fund.share_type for fund in asnbank_importer.unknown_funds],
+            ["ASNNieuwFonds"],
+        )
+
+        # New funds can be added to the table
+        asnbank_importer = importer.Importer(
+            accounts,
+            investment_account="Assets:Beleggen:Fonds",
+            profit_loss_account="Income:PL",
+            funds={"ASNNieuwFonds": ("NieuwFonds", "ASN_NIEUW_FONDS")},
+        )
+        entries = asnbank_importer.extract(filename, [])
+        self.assertEqual(
+            entries[1].postings[1].account, "Assets:Beleggen:Fonds:NieuwFonds"
+        )
+        self.assertEqual(asnbank_importer.unknown_funds, [])
+
+    def test_incremental(self) -> None:
+        rows = [
+            "09-01-2022,IBAN_CHEQUING,IBAN_PAYEE,name,,,,EUR,50.00,EUR,10.00,09-01-2022,09-01-2022,1234,IOB,12345678,,GEEN,1\n",
+            "09-01-2022,IBAN_CHEQUING,IBAN_PAYEE,name,,,,EUR,60.00,EUR,-5.00,09-01-2022,09-01-2022,1234,IOB,12345678,,GEEN,1\n",
+            "10-01-2022,IBAN_CHEQUING,IBAN_PAYEE,name,,,,EUR,55.00,EUR,-6.00,10-01-2022,10-01-2022,1234,IOB,12345678,,GEEN,1\n",
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "asn.csv")
+            asnbank_importer = importer.Importer(accounts)
+            asnbank_importer.checkpoints = Checkpoints(
+                os.path.join(directory, "checkpoints.json")
+            )
+
+            with open(filename, "w") as fd:
+                fd.write(rows[0])
+            entries = asnbank_importer.extract(filename, [])
+            self.assertEqual(len(entries), 2)
+
+            with open(filename, "a") as fd:
+                fd.writelines(rows[1:])
+            entries = asnbank_importer.extract(filename, [])
+            # The balance of 09-01-2022 was already asserted the first time.
+            self.assertEqualEntries(
+                entries,
+                """
+                2022-01-09 * "name" "GEEN"
+                    Assets:Chequing  -5.00 EUR
+
+                2022-01-10 balance Assets:Chequing                                 55.00 EUR
+
+                2022-01-10 * "name" "GEEN"
+                    Assets:Chequing  -6.00 EUR
+            """,
+            )
+            self.assertEqual(entries[0].meta["lineno"], 2)
+
+            self.assertEqual(asnbank_importer.extract(filename, []), [])
@@ -1,48 +1,148 @@
 from dataclasses import MISSING
 from os import path
+from typing import Dict, Optional, Tuple
 from beancount.core import data, number
 from beancount.core.position import CostSpec, Cost
 from beangulp.importers import csvbase
+from beangulp_coinbase.lots import LotTracker, unit_cost
+from beangulp_importers import base, identify
 import csv as pycsv
+import datetime
 import decimal
 import re
 
 pycsv.register_dialect("coinbasedialect", delimiter=",")
 
 
-class PotentiallyEmptyAmount(csvbase.Column):
-    def __init__(self, name, subs=None):
+ZERO = number.D("0.00")
+
+
+def is_plain(value: str) -> bool:
+    """Whether the value is a plain decimal number, such as -12.34."""
+    return value.removeprefix("-").replace(".", "", 1).isdigit() and value.isascii()
+
+
+class PotentiallyEmptyAmount(csvbase.Amount):
+    def __init__(self, name, subs=None, absolute=False):
         super().__init__(name)
-        self.subs = subs if subs is not None else {}
+        self.absolute = absolute
+        self.subs = [
+            (re.compile(pattern), replacement)
+            for pattern, replacement in (subs or {}).items()
+        ]
 
     def parse(self, value):
-        for pattern, replacement in self.subs.items():
-            value = re.sub(pattern, replacement, value)
         if value == "":
-            return number.D("0.00")
-        return decimal.Decimal(value)
+            return ZERO
+        # Formatted numbers are normalized, plain numbers need not be.
+        if not is_plain(value):
+            value = self.normalize(value)
+            if value == "":
+                return ZERO
+        amount = decimal.Decimal(value)
+        return abs(amount) if self.absolute else amount
+
+    def normalize(self, value: str) -> str:
+        for pattern, replacement in self.subs:
+            value = pattern.sub(replacement, value)
+        return value
+
+    def parse_many(self, values):
+        """Parse a column of values.
+
+        Exports repeat the same values a lot (zero fees, spot prices), so
+        every distinct value is only parsed once.
+        """
+        parsed = {}
+        result = []
+        for value in values:
+            amount = parsed.get(value)
+            if amount is None:
+                amount = parsed[value] = self.parse(value)
+            result.append(amount)
+        return result
+
+
+class Timestamp(csvbase.Column):
+    # Both "2022-01-28T00:00:00Z" and "2024-01-28 00:00:00 UTC" start with the date.
+    def parse(self, value):
+        return datetime.date.fromisoformat(value.strip()[:10])
+
+
+class TransactionType(csvbase.Column):
+    def parse(self, value):
+        value = value.strip()
+        return TRANSACTION_TYPES.get(value, value)
+
+
+# Transaction types of the newer exports that are booked like an older type.
+TRANSACTION_TYPES = {
+    "Advanced Trade Buy": "Buy",
+    "Advanced Trade Sell": "Sell",
+    "Learning Reward": "Coinbase Earn",
+    "Staking Income": "Rewards Income",
+}
+
+CURRENCY_SYMBOL = re.compile(r"[^0-9.,\-]")
+
+
+class FiatAmount(PotentiallyEmptyAmount):
+    """An amount of fiat currency. Newer exports format these with a currency
+    symbol and thousands separators, such as "-€1,234.56" or "€1.234,56"."""
 
+    def normalize(self, value: str) -> str:
+        value = CURRENCY_SYMBOL.sub("", value)
+        decimal_point = "."
+        if "," in value:
+            if "." in value:
+                decimal_point = "," if value.rindex(",") > value.rindex(".") else "."
+            elif value.count(",") == 1 and len(value) - value.index(",") != 4:
+                # A single comma is a decimal comma, unless three digits follow it.
+                decimal_point = ","
+        elif value.count(".") > 1:
+            decimal_point = ","
+        thousands = "," if decimal_point == "." else "."
+        return value.replace(thousands, "").replace(decimal_point, ".")
 
-class Importer(csvbase.Importer):
+
+class Importer(base.Importer):
     encoding = "utf8"
     names = True
     dialect = "coinbasedialect"
-    skiplines = 7
+    profile_column = "transaction_type"
+
+    # Header names of the newer "Transaction History" export.
+    aliases = {
+        "Price Currency": "Spot Price Currency",
+        "Price at Transaction": "Spot Price at Transaction",
+        "Total (inclusive of fees and/or spread)": "Total (inclusive of fees)",
+        "Fees and/or Spread": "Fees",
+    }
 
-    date = csvbase.Date("Timestamp", "%Y-%m-%dT%H:%M:%SZ")
-    amount = csvbase.Amount("Quantity Transacted")
+    date = Timestamp("Timestamp")
+    # Newer exports have negative quantities for outputs, the sign is
+    # derived from the transaction type.
+    amount = PotentiallyEmptyAmount("Quantity Transacted", absolute=True)
     narration = csvbase.Column("Notes")
     currency = csvbase.Column("Asset")
-    fees = PotentiallyEmptyAmount("Fees")
-    transaction_type = csvbase.Column("Transaction Type")
+    fees = FiatAmount("Fees", absolute=True)
+    transaction_type = TransactionType("Transaction Type")
+    # Only in newer exports.
+    transaction_id = csvbase.Column("ID", default="")
 
     # Subtotal (Cost of transaction input)
-    subtotal = PotentiallyEmptyAmount("Subtotal")
-    total_with_fees = PotentiallyEmptyAmount("Total (inclusive of fees)")
+    subtotal = FiatAmount("Subtotal", absolute=True)
+    total_with_fees = FiatAmount("Total (inclusive of fees)", absolute=True)
 
     spot_price_currency = csvbase.Column("Spot Price Currency")
-    spot_price_at_transaction = csvbase.Amount("Spot Price at Transaction")
+    spot_price_at_transaction = FiatAmount("Spot Price at Transaction", absolute=True)
+
+    convert_regex = re.compile(r"^Converted [0-9.]+ [A-Z]+ to ([0-9.]+) ([A-Z]+)$")
 
+    #! - lots: Book sells, converts and sends against concrete lots and compute
+    #!   the P&L, instead of leaving the reduction to beancount. See lots.py.
+    #! - prices: Also extract a price directive per date and asset from the spot
+    #!   prices in the file.
     def __init__(
         self,
         coinbase_assets_base: str,
@@ -51,7 +151,13 @@ class Importer(csvbase.Importer):
         fees_expenses: str,
         rewards_income_account: str,
         currency: str = "EUR",
+        lots: Optional[LotTracker] = None,
+        prices: bool = False,
     ) -> None:
+        self.lots = lots
+        self.prices = prices
+        # The spot price per (date, asset) of the file being extracted.
+        self.spot_prices: Dict[Tuple[datetime.date, str], data.Price] = {}
         self.earn_income_account = earn_income_account
         self.pl_income_account = pl_income_account
         self.coinbase_assets_base = coinbase_assets_base
@@ -62,9 +168,54 @@ class Importer(csvbase.Importer):
     def filename(self, filepath):
         return "coinbase." + path.basename(filepath)
 
-    def identify(remap, file):
-        with open(file) as fd:
-            return path.basename(fd.name).startswith("Coinbase-")
+    def identify(self, file):
+        return identify.matches("coinbase", file)
+
+    def preamble(self, filepath):
+        # The preamble differs between export versions, the signature of the export
+        # finds the header after it.
+        head = identify.prefix(filepath)
+        match = identify.SIGNATURES["coinbase"].match(head)
+        if match is None:
+            raise IndexError("The input file does not contain an header line")
+        return head.count(b"\n", 0, match.start("header"))
+
+    def metadata(self, filepath, lineno, row):
+        meta = super().metadata(filepath, lineno, row)
+        if row.transaction_id:
+            meta["transaction_id"] = row.transaction_id
+        return meta
+
+    @staticmethod
+    def duplicate_keys(entry):
+        transaction_id = entry.meta.get("transaction_id")
+        if transaction_id:
+            yield ("transaction_id", transaction_id)
+        # For older exports, which have no ID. The notes say what kind of transaction
+        # it was, such as "Bought 1.0 ETH for €2010.00 EUR".
+        yield (entry.date, entry.narration, entry.postings[0].units)
+
+    def extract(self, filepath, existing):
+        if self.lots is not None:
+            self.lots.seed(existing, self.coinbase_assets_base + ":")
+        self.spot_prices = {}
+        entries = super().extract(filepath, existing)
+        if self.prices:
+            entries.extend(self.price_entries(existing))
+        return entries
+
+    def price_entries(self, existing):
+        """The spot prices of the extracted file that are not in the existing entries."""
+        known = {
+            (entry.date, entry.currency)
+            for entry in existing
+            if isinstance(entry, data.Price)
+        }
+        return [
+            price
+            for key, price in sorted(self.spot_prices.items())
+            if key not in known
+        ]
 
     def coinbase_account_for_asset(self, asset: str) -> str:
         return self.coinbase_assets_base + ":" + asset
@@ -80,6 +231,14 @@ class Importer(csvbase.Importer):
         # If a price is available, use it
         if not row.spot_price_at_transaction.is_zero():
             price = data.Amount(row.spot_price_at_transaction, row.spot_price_currency)
+            if self.prices and row.currency != row.spot_price_currency:
+                # The last price of the day is kept.
+                self.spot_prices[(transaction.date, row.currency)] = data.Price(
+                    data.new_metadata(transaction.meta["filename"], transaction.meta["lineno"]),
+                    transaction.date,
+                    row.currency,
+                    price,
+                )
 
         # For transactions where the primary is output, add an empty cost to automatically reduce
         if negate:
@@ -118,9 +277,7 @@ class Importer(csvbase.Importer):
 
         if row.transaction_type == "Convert":
             # Determine the conversion to from the narration
-            matches = re.search(
-                "^Converted [0-9\.]+ [A-Z]+ to ([0-9\.]+) ([A-Z]+)$", row.narration
-            )
+            matches = self.convert_regex.match(row.narration)
             to_units = number.D(matches[1])
             to_currency = matches[2]
             to_amount = data.Amount(to_units, to_currency)
@@ -195,4 +352,86 @@ class Importer(csvbase.Importer):
             )
             transaction.postings.append(fee_posting)
 
+        if self.lots is not None:
+            self.book(transaction, row)
+
         return transaction
+
+    def book(self, transaction, row):
+        """Resolve the reduction of the transaction to lots and compute the P&L."""
+        postings = transaction.postings
+        prefix = self.coinbase_assets_base + ":"
+        booked = []
+        for posting in postings:
+            if not posting.account.startswith(prefix) or posting.cost is None:
+                booked.append(posting)
+                continue
+            units = posting.units
+            if units.number > 0:
+                cost = posting.cost
+                if isinstance(cost, CostSpec):
+                    per_unit = unit_cost(cost.number_total, units.number)
+                    if per_unit != cost.number_total / units.number:
+                        # Book the lot at the rounded cost that its reductions show.
+                        posting = posting._replace(
+                            cost=cost._replace(number_per=per_unit, number_total=None)
+                        )
+                    cost = Cost(per_unit, cost.currency, None, None)
+                self.lots.add(transaction.date, posting.account, units, cost)
+                booked.append(posting)
+                continue
+
+            # Replace the reduction with a posting per lot.
+            reduced = self.lots.reduce(posting.account, -units)
+            for lot_units, cost in reduced:
+                booked.append(posting._replace(units=-lot_units, cost=cost))
+            missing = -units.number - sum(lot_units.number for lot_units, _ in reduced)
+            if missing:
+                print(
+                    f"Warning: no open lots for {missing} {units.currency} in "
+                    f"{posting.account} on {transaction.date}"
+                )
+                booked.append(posting._replace(units=data.Amount(-missing, units.currency)))
+        postings[:] = booked
+
+        if row.transaction_type not in ("Sell", "Convert"):
+            return
+        # The P&L is what remains after the cost of the reduced lots.
+        residual = number.ZERO
+        for posting in postings:
+            if posting.account == self.pl_income_account:
+                continue
+            if isinstance(posting.cost, Cost):
+                weight = posting.units.number * posting.cost.number
+                currency = posting.cost.currency
+            elif isinstance(posting.cost, CostSpec):
+                if posting.cost.number_total is not None:
+                    weight = posting.cost.number_total.copy_sign(posting.units.number)
+                elif posting.cost.number_per is not None:
+                    # A lot booked at a rounded cost per unit.
+                    weight = posting.units.number * posting.cost.number_per
+                else:
+                    # A reduction that could not be resolved.
+                    return
+                currency = posting.cost.currency
+            else:
+                weight = posting.units.number
+                currency = posting.units.currency
+            if currency != self.currency:
+                return
+            residual += weight
+
+        cash = row.total_with_fees if row.transaction_type == "Sell" else row.subtotal
+        pl = data.Posting(
+            self.pl_income_account,
+            data.Amount((-residual).quantize(cash), self.currency),
+            None,
+            None,
+            None,
+            None,
+        )
+        for index, posting in enumerate(postings):
+            if posting.account == self.pl_income_account:
+                postings[index] = pl
+                return
+        postings.append(pl)
@@ -0,0 +1,124 @@
+"""Lot tracking for the Coinbase importer.
+
+Without it, sells, converts and sends reduce an empty cost and beancount
+books them when the ledger is loaded. With a LotTracker, the importer keeps
+the open lots of every asset account itself and writes the reductions
+against concrete lots:
+
+    from beangulp_coinbase.lots import LotTracker
+
+    importer = Importer(..., lots=LotTracker("FIFO", {"ETH": "LIFO"}))
+
+The lots are seeded from the existing entries at the start of every
+extraction, and then follow the extracted transactions. Reductions in the
+existing entries remove the lot that the ledger booked them against.
+"""
+
+from collections import deque
+from decimal import Decimal
+from typing import Deque, Dict, List, Optional, Tuple
+from beancount.core import data
+from beancount.core.position import Cost
+
+METHODS = ("FIFO", "LIFO")
+# Per-unit costs that do not divide evenly are rounded to this.
+COST_QUANTUM = Decimal("0.00000001")
+
+
+def unit_cost(total: Decimal, units: Decimal) -> Decimal:
+    """The cost per unit of a lot with this total cost."""
+    number = total / units
+    if number.as_tuple().exponent < COST_QUANTUM.as_tuple().exponent:
+        number = number.quantize(COST_QUANTUM)
+    return number
+
+
+class Lot:
+    __slots__ = ("units", "cost")
+
+    def __init__(self, units, cost: Cost) -> None:
+        self.units = units
+        self.cost = cost
+
+
+class LotTracker:
+    """Open lots per asset account, reduced first in first out or last in first out.
+
+    Every account has a deque of lots in the order they were acquired, so a
+    reduction only touches the lots it consumes.
+    """
+
+    def __init__(self, method: str = "FIFO", methods: Optional[Dict[str, str]] = None):
+        self.method = method
+        self.methods = methods or {}
+        for value in [method, *self.methods.values()]:
+            assert value in METHODS, f"Unknown booking method {value}"
+        self.lots: Dict[Tuple[str, str], Deque[Lot]] = {}
+
+    def seed(self, existing: data.Entries, prefix: str) -> None:
+        """Reset the lots to those of the accounts under prefix in the existing entries."""
+        self.lots = {}
+        for entry in existing:
+            if not isinstance(entry, data.Transaction):
+                continue
+            for posting in entry.postings:
+                if not isinstance(posting.cost, Cost) or posting.units is None:
+                    continue
+                if not posting.account.startswith(prefix):
+                    continue
+                if posting.units.number > 0:
+                    self.add(entry.date, posting.account, posting.units, posting.cost)
+                else:
+                    self.remove(posting.account, -posting.units, posting.cost)
+
+    def add(self, date, account: str, units: data.Amount, cost: Cost) -> Cost:
+        """Add a lot and return its cost, dated if it was not yet."""
+        if cost.date is None:
+            cost = cost._replace(date=date)
+        key = (account, units.currency)
+        lots = self.lots.get(key)
+        if lots is None:
+            lots = self.lots[key] = deque()
+        lots.append(Lot(units.number, cost))
+        return cost
+
+    def remove(self, account: str, units: data.Amount, cost: Cost) -> None:
+        """Remove units (a positive amount) from the lot with this cost and date.
+
+        Units that the lot does not cover are reduced like any other reduction.
+        """
+        lots = self.lots.get((account, units.currency))
+        remaining = units.number
+        for lot in lots or ():
+            if lot.cost[:3] == cost[:3]:
+                taken = min(lot.units, remaining)
+                remaining -= taken
+                lot.units -= taken
+                if lot.units == 0:
+                    lots.remove(lot)
+                break
+        if remaining > 0:
+            self.reduce(account, data.Amount(remaining, units.currency))
+
+    def reduce(self, account: str, units: data.Amount) -> List[Tuple[data.Amount, Cost]]:
+        """Remove units (a positive amount) from the lots of the account.
+
+        Returns the reduced units per lot. Units that are not covered by the
+        open lots are left out.
+        """
+        lots = self.lots.get((account, units.currency))
+        lifo = self.methods.get(units.currency, self.method) == "LIFO"
+        remaining = units.number
+        reduced = []
+        while remaining > 0 and lots:
+            lot = lots[-1] if lifo else lots[0]
+            taken = min(lot.units, remaining)
+            reduced.append((data.Amount(taken, units.currency), lot.cost))
+            remaining -= taken
+            lot.units -= taken
+            if lot.units == 0:
+                if lifo:
+                    lots.pop()
+                else:
+                    lots.popleft()
+        return reduced
@@ -1,8 +1,15 @@
 from beangulp_coinbase import importer
+from beangulp_coinbase.lots import LotTracker
 
+from beancount import loader
+from beancount.core import data
+from beancount.core.number import D
+from beancount.core.position import Cost
 from beancount.parser import cmptest
 from beancount.utils.test_utils import docfile
 from beangulp import extract
+import datetime
+import textwrap
 
 
 class StringOutput:
@@ -49,6 +56,7 @@ Timestamp,Transaction Type,Asset,Quantity Transacted,Spot Price Currency,Spot Pr
 **** filepath
 
 2022-01-28 * "Converted 2.500 CLV to 2.0000 DAI"
+  fingerprint: "3472c79425a0ca47"
   Assets:Coinbase:CLV     -2.500 CLV {} @ 1.0000 EUR
   Assets:Coinbase:DAI     2.0000 DAI {# 2.5000 EUR}
   Expenses:TradingFees  0.020000 EUR
@@ -89,6 +97,7 @@ Timestamp,Transaction Type,Asset,Quantity Transacted,Spot Price Currency,Spot Pr
 **** filepath
 
 2022-01-28 * "Received 20.00000 JASMY from Coinbase Earn"
+  fingerprint: "d3b6fb49a75bb39c"
   Assets:Coinbase:JASMY   20.000 JASMY {# 1.5638 EUR} @ 4.5723 EUR
   Income:CoinbaseEarn    -1.5638 EUR
 
@@ -128,6 +137,7 @@ Timestamp,Transaction Type,Asset,Quantity Transacted,Spot Price Currency,Spot Pr
 **** filepath
 
 2022-01-28 * "Received 123.45678 BTC from an external account"
+  fingerprint: "a4b9276d27795fa9"
   Assets:Coinbase:BTC  123.45678 BTC {10000.00 EUR}
 
 
@@ -166,6 +176,7 @@ Timestamp,Transaction Type,Asset,Quantity Transacted,Spot Price Currency,Spot Pr
 **** filepath
 
 2022-01-28 * "Sent 0.00123467 BTC to 12345678901234567890"
+  fingerprint: "33fc34be2b1353b7"
   Assets:Coinbase:BTC  -0.00123467 BTC {} @ 10123.00 EUR
 
 
@@ -204,6 +215,7 @@ Timestamp,Transaction Type,Asset,Quantity Transacted,Spot Price Currency,Spot Pr
 **** filepath
 
 2022-01-28 * "Bought 1.23456789 ETH for €31.99 EUR"
+  fingerprint: "8a1fdd3dc9c07646"
   Assets:Coinbase:ETH   1.23456789 ETH {# 30.00 EUR} @ 2000.00 EUR
   Assets:Coinbase:EUR       -31.99 EUR
   Expenses:TradingFees        1.99 EUR
@@ -244,6 +256,7 @@ Timestamp,Transaction Type,Asset,Quantity Transacted,Spot Price Currency,Spot Pr
 **** filepath
 
 2022-01-28 * "Sold 1.000000 ETH for €100.00 EUR"
+  fingerprint: "885fcb9d6b3b69b3"
   Assets:Coinbase:ETH   -1.000000 ETH {} @ 1234.32 EUR
   Income:PL
   Assets:Coinbase:EUR      102.00 EUR
@@ -285,9 +298,310 @@ Timestamp,Transaction Type,Asset,Quantity Transacted,Spot Price Currency,Spot Pr
 **** filepath
 
 2022-01-28 * "Received 1.000000 DAI from Coinbase Rewards"
+  fingerprint: "fe1d7c8ee601ecd5"
   Assets:Coinbase:DAI      2.000000 DAI {# 1.760000 EUR} @ 0.8800000 EUR
   Income:CoinbaseRewards  -2.000000 DAI {# 1.760000 EUR}
 
 
 """,
         )
+
+    def test_parse_many(self) -> None:
+        column = importer.PotentiallyEmptyAmount("Fees", {"€": "", ",": ""})
+        self.assertEqual(
+            column.parse_many(["", "1.99", "€1,234.50", "-0.5", "1.99"]),
+            [D("0.00"), D("1.99"), D("1234.50"), D("-0.5"), D("1.99")],
+        )
+        self.assertEqual(column.parse("€"), D("0.00"))
+
+    def test_parse_fiat(self) -> None:
+        column = importer.FiatAmount("Fees")
+        for value, expected in [
+            ("-€1,234.56", "-1234.56"),
+            ("€1.234,56", "1234.56"),
+            ("€1,234", "1234"),
+            ("€12,50", "12.50"),
+            ("€1,234,567.00", "1234567.00"),
+            ("€0.123456", "0.123456"),
+        ]:
+            self.assertEqual(column.parse(value), D(expected))
+        # Quantities are not fiat amounts and are parsed as they are.
+        amount = importer.Importer.columns["amount"]
+        self.assertEqual(amount.parse("1E-8"), D("1E-8"))
+
+    @docfile
+    def test_duplicates(self, filename: str) -> None:
+        """\
+Transactions
+User,email@address.com,0000000000
+
+Timestamp,Transaction Type,Asset,Quantity Transacted,Spot Price Currency,Spot Price at Transaction,Subtotal,Total (inclusive of fees),Fees,Notes
+2022-01-02T00:00:00Z,Buy,ETH,1.0,EUR,1000.00,1000.00,1010.00,10.00,Bought 1.0 ETH for €1010.00 EUR
+2022-01-02T12:00:00Z,Receive,ETH,1.0,EUR,1000.00,"","","",Received 1.0 ETH from an external account
+"""
+        coinbase_importer = importer.Importer(
+            coinbase_assets_base="Assets:Coinbase",
+            earn_income_account="Income:CoinbaseEarn",
+            pl_income_account="Income:PL",
+            fees_expenses="Expenses:TradingFees",
+            rewards_income_account="Income:CoinbaseRewards",
+        )
+        existing = coinbase_importer.extract(filename, [])[:1]
+        for entry in existing:
+            entry.meta.pop("fingerprint")
+        entries = coinbase_importer.extract(filename, existing)
+        coinbase_importer.deduplicate(entries, existing)
+        # Only the buy was imported before, the receive of the same quantity is new.
+        self.assertEqual(
+            [extract.DUPLICATE in entry.meta for entry in entries], [True, False]
+        )
+
+    @docfile
+    def test_transaction_history(self, filename: str) -> None:
+        """\
+
+Transactions
+User,email@address.com,0000000000
+ID,Timestamp,Transaction Type,Asset,Quantity Transacted,Price Currency,Price at Transaction,Subtotal,Total (inclusive of fees and/or spread),Fees and/or Spread,Notes
+65a1b2c3d4e5f6a7b8c9d0e1,2024-01-28 10:00:00 UTC,Advanced Trade Sell,ETH,-1.000000,EUR,"€1,234.32",€100.00,€102.00,€2.00,Sold 1.000000 ETH for €100.00 EUR
+"""
+        coinbase_importer = importer.Importer(
+            coinbase_assets_base="Assets:Coinbase",
+            earn_income_account="Income:CoinbaseEarn",
+            pl_income_account="Income:PL",
+            fees_expenses="Expenses:TradingFees",
+            rewards_income_account="Income:CoinbaseRewards",
+        )
+        self.assertTrue(coinbase_importer.identify(filename))
+        entries = coinbase_importer.extract(filename, [])
+        self.assertEqual(entries[0].meta["lineno"], 5)
+        output = StringOutput()
+        extract.print_extracted_entries([["filepath", entries]], output)
+        actual = output.s
+        self.assertEqual(
+            actual,
+            """\
+;; -*- mode: beancount -*-
+
+**** filepath
+
+2024-01-28 * "Sold 1.000000 ETH for €100.00 EUR"
+  transaction_id: "65a1b2c3d4e5f6a7b8c9d0e1"
+  fingerprint: "95c381fcbb4c98c1"
+  Assets:Coinbase:ETH   -1.000000 ETH {} @ 1234.32 EUR
+  Income:PL
+  Assets:Coinbase:EUR      102.00 EUR
+  Expenses:TradingFees       2.00 EUR
+
+
+""",
+        )
+
+    @docfile
+    def test_lots(self, filename: str) -> None:
+        """\
+Transactions
+User,email@address.com,0000000000
+
+Timestamp,Transaction Type,Asset,Quantity Transacted,Spot Price Currency,Spot Price at Transaction,Subtotal,Total (inclusive of fees),Fees,Notes
+2022-01-02T00:00:00Z,Buy,ETH,2.0,EUR,1000.00,2000.00,2010.00,10.00,Bought 2.0 ETH for €2010.00 EUR
+2022-02-01T00:00:00Z,Sell,ETH,1.5,EUR,3000.00,4500.00,4490.00,10.00,Sold 1.5 ETH for €4490.00 EUR
+2022-03-01T00:00:00Z,Convert,ETH,1.0,EUR,3000.00,3000.00,3000.00,0.00,Converted 1.0 ETH to 0.1 BTC
+"""
+        existing, _, _ = loader.load_string(
+            """
+            2021-01-01 open Assets:Coinbase:ETH
+            2021-01-01 open Assets:Coinbase:EUR
+            2021-06-01 * "Bought"
+              Assets:Coinbase:ETH  1.0 ETH {500.00 EUR}
+              Assets:Coinbase:EUR  -500.00 EUR
+            """,
+            dedent=True,
+        )
+        coinbase_importer = importer.Importer(
+            coinbase_assets_base="Assets:Coinbase",
+            earn_income_account="Income:CoinbaseEarn",
+            pl_income_account="Income:PL",
+            fees_expenses="Expenses:TradingFees",
+            rewards_income_account="Income:CoinbaseRewards",
+            lots=LotTracker(),
+        )
+        entries = coinbase_importer.extract(filename, existing)
+        for entry in entries:
+            entry.meta.pop("fingerprint")
+        output = StringOutput()
+        extract.print_extracted_entries([["filepath", entries]], output)
+        self.assertEqual(
+            output.s,
+            """\
+;; -*- mode: beancount -*-
+
+**** filepath
+
+2022-01-02 * "Bought 2.0 ETH for €2010.00 EUR"
+  Assets:Coinbase:ETH        2.0 ETH {# 2000.00 EUR} @ 1000.00 EUR
+  Assets:Coinbase:EUR   -2010.00 EUR
+  Expenses:TradingFees     10.00 EUR
+
+2022-02-01 * "Sold 1.5 ETH for €4490.00 EUR"
+  Assets:Coinbase:ETH       -1.0 ETH {500.00 EUR, 2021-06-01} @ 3000.00 EUR
+  Assets:Coinbase:ETH       -0.5 ETH {1000.0 EUR, 2022-01-02} @ 3000.00 EUR
+  Income:PL             -3500.00 EUR
+  Assets:Coinbase:EUR    4490.00 EUR
+  Expenses:TradingFees     10.00 EUR
+
+2022-03-01 * "Converted 1.0 ETH to 0.1 BTC"
+  Assets:Coinbase:ETH      -1.0 ETH {1000.0 EUR, 2022-01-02} @ 3000.00 EUR
+  Assets:Coinbase:BTC       0.1 BTC {# 3000.00 EUR}
+  Income:PL            -2000.00 EUR
+
+
+""",
+        )
+
+    def test_lots_lifo(self) -> None:
+        lots = LotTracker("FIFO", {"ETH": "LIFO"})
+        for number, price in [("1", "100"), ("1", "200")]:
+            for currency in ["ETH", "BTC"]:
+                lots.add(
+                    None,
+                    "Assets:Coinbase",
+                    data.Amount(D(number), currency),
+                    Cost(D(price), "EUR", None, None),
+                )
+        for currency, price in [("ETH", D("200")), ("BTC", D("100"))]:
+            (reduced,) = lots.reduce("Assets:Coinbase", data.Amount(D("0.5"), currency))
+            self.assertEqual(reduced[1].number, price)
+
+    def test_lots_seed(self) -> None:
+        existing, _, _ = loader.load_string(
+            """
+            2021-01-01 open Assets:Coinbase:ETH
+            2021-01-01 open Assets:Coinbase:EUR
+            2021-01-01 open Income:PL
+            2021-06-01 * "Bought"
+              Assets:Coinbase:ETH  1.0 ETH {500.00 EUR}
+              Assets:Coinbase:EUR  -500.00 EUR
+            2021-07-01 * "Bought"
+              Assets:Coinbase:ETH  1.0 ETH {600.00 EUR}
+              Assets:Coinbase:EUR  -600.00 EUR
+            2021-08-01 * "Sold the second lot"
+              Assets:Coinbase:ETH  -1.0 ETH {600.00 EUR}
+              Assets:Coinbase:EUR  700.00 EUR
+              Income:PL
+            """,
+            dedent=True,
+        )
+        lots = LotTracker("FIFO")
+        lots.seed(existing, "Assets:Coinbase:")
+        (reduced,) = lots.reduce("Assets:Coinbase:ETH", data.Amount(D("1.0"), "ETH"))
+        date = datetime.date(2021, 6, 1)
+        self.assertEqual(reduced[1], Cost(D("500.00"), "EUR", date, None))
+
+    @docfile
+    def test_lots_unit_cost(self, filename: str) -> None:
+        """\
+Transactions
+User,email@address.com,0000000000
+
+Timestamp,Transaction Type,Asset,Quantity Transacted,Spot Price Currency,Spot Price at Transaction,Subtotal,Total (inclusive of fees),Fees,Notes
+2022-01-02T00:00:00Z,Buy,ETH,3.0,EUR,3333.33,10000.00,10010.00,10.00,Bought 3.0 ETH for €10010.00 EUR
+2022-02-01T00:00:00Z,Sell,ETH,1.0,EUR,4000.00,4000.00,3990.00,10.00,Sold 1.0 ETH for €3990.00 EUR
+"""
+        ledger = """
+            2021-01-01 open Assets:Coinbase:ETH
+            2021-01-01 open Assets:Coinbase:EUR
+            2021-01-01 open Income:PL
+            2021-01-01 open Expenses:TradingFees
+            """
+        existing, _, _ = loader.load_string(ledger, dedent=True)
+        coinbase_importer = importer.Importer(
+            coinbase_assets_base="Assets:Coinbase",
+            earn_income_account="Income:CoinbaseEarn",
+            pl_income_account="Income:PL",
+            fees_expenses="Expenses:TradingFees",
+            rewards_income_account="Income:CoinbaseRewards",
+            lots=LotTracker(),
+        )
+        entries = coinbase_importer.extract(filename, existing)
+        for entry in entries:
+            entry.meta.pop("fingerprint")
+        output = StringOutput()
+        extract.print_extracted_entries([["filepath", entries]], output)
+        self.assertIn("3.0 ETH {3333.33333333 EUR} @ 3333.33 EUR", output.s)
+        self.assertIn("-1.0 ETH {3333.33333333 EUR, 2022-01-02} @ 4000.00 EUR", output.s)
+        # The reduction matches the lot when the output is loaded.
+        _, errors, _ = loader.load_string(textwrap.dedent(ledger) + output.s)
+        self.assertEqual(errors, [])
+
+    @docfile
+    def test_lots_convert_unit_cost(self, filename: str) -> None:
+        """\
+Transactions
+User,email@address.com,0000000000
+
+Timestamp,Transaction Type,Asset,Quantity Transacted,Spot Price Currency,Spot Price at Transaction,Subtotal,Total (inclusive of fees),Fees,Notes
+2022-01-02T00:00:00Z,Buy,ETH,1.0,EUR,2000.00,2000.00,2000.00,0.00,Bought 1.0 ETH for €2000.00 EUR
+2022-03-01T00:00:00Z,Convert,ETH,1.0,EUR,3000.00,3000.00,3000.00,0.00,Converted 1.0 ETH to 0.7 BTC
+"""
+        ledger = """
+            2021-01-01 open Assets:Coinbase:ETH
+            2021-01-01 open Assets:Coinbase:BTC
+            2021-01-01 open Assets:Coinbase:EUR
+            2021-01-01 open Income:PL
+            2021-01-01 open Expenses:TradingFees
+            """
+        existing, _, _ = loader.load_string(ledger, dedent=True)
+        coinbase_importer = importer.Importer(
+            coinbase_assets_base="Assets:Coinbase",
+            earn_income_account="Income:CoinbaseEarn",
+            pl_income_account="Income:PL",
+            fees_expenses="Expenses:TradingFees",
+            rewards_income_account="Income:CoinbaseRewards",
+            lots=LotTracker(),
+        )
+        entries = coinbase_importer.extract(filename, existing)
+        for entry in entries:
+            entry.meta.pop("fingerprint")
+        output = StringOutput()
+        extract.print_extracted_entries([["filepath", entries]], output)
+        self.assertIn("0.7 BTC {4285.71428571 EUR}", output.s)
+        self.assertRegex(output.s, r"Income:PL +-1000\.00 EUR")
+        # The transaction balances with the rounded cost of the new lot.
+        _, errors, _ = loader.load_string(textwrap.dedent(ledger) + output.s)
+        self.assertEqual(errors, [])
+
+    @docfile
+    def test_prices(self, filename: str) -> None:
+        """\
+Transactions
+User,email@address.com,0000000000
+
+Timestamp,Transaction Type,Asset,Quantity Transacted,Spot Price Currency,Spot Price at Transaction,Subtotal,Total (inclusive of fees),Fees,Notes
+2022-01-02T00:00:00Z,Buy,ETH,2.0,EUR,1000.00,2000.00,2010.00,10.00,Bought 2.0 ETH for €2010.00 EUR
+2022-01-02T12:00:00Z,Buy,ETH,1.0,EUR,1100.00,1100.00,1110.00,10.00,Bought 1.0 ETH for €1110.00 EUR
+2022-01-02T12:00:00Z,Buy,BTC,0.1,EUR,30000.00,3000.00,3010.00,10.00,Bought 0.1 BTC for €3010.00 EUR
+2022-01-03T00:00:00Z,Buy,ETH,1.0,EUR,1200.00,1200.00,1210.00,10.00,Bought 1.0 ETH for €1210.00 EUR
+"""
+        existing, _, _ = loader.load_string(
+            """
+            2022-01-03 price ETH 1234.00 EUR
+            """,
+            dedent=True,
+        )
+        coinbase_importer = importer.Importer(
+            coinbase_assets_base="Assets:Coinbase",
+            earn_income_account="Income:CoinbaseEarn",
+            pl_income_account="Income:PL",
+            fees_expenses="Expenses:TradingFees",
+            rewards_income_account="Income:CoinbaseRewards",
+            prices=True,
+        )
+        entries = coinbase_importer.extract(filename, existing)
+        self.assertEqualEntries(
+            """
+            2022-01-02 price BTC 30000.00 EUR
+            2022-01-02 price ETH 1100.00 EUR
+            """,
+            [entry for entry in entries if isinstance(entry, data.Price)],
+        )
@@ -0,0 +1,53 @@
+"""Registry of the importers in this repository.
+
+The importers of the registry are only imported when a file matches their
+signature, see lazy.py, so a configuration can list all of them without
+paying for the ones it does not need:
+
+    import beangulp_importers
+
+    importers = [
+        beangulp_importers.AsnBankImporter(known_accounts),
+        beangulp_importers.PaypalImporter("EUR", "Assets:Paypal", None),
+    ]
+
+load() returns the Importer class itself.
+"""
+
+import importlib
+from typing import Dict, List
+
+# The module that defines the Importer class of each importer.
+IMPORTERS: Dict[str, str] = {
+    "asnbank": "beangulp_asnbank.importer",
+    "coinbase": "beangulp_coinbase.importer",
+    "ovchipkaart": "beangulp_ovchipkaart.importer",
+    "paypal": "beangulp_paypal.importer",
+}
+
+# Attribute names under which the lazy importers are exposed.
+CLASSES: Dict[str, str] = {
+    "AsnBankImporter": "asnbank",
+    "CoinbaseImporter": "coinbase",
+    "OvChipkaartImporter": "ovchipkaart",
+    "PaypalImporter": "paypal",
+}
+
+__all__ = list(CLASSES)
+
+
+def load(name: str) -> type:
+    """Import and return the Importer class of the importer with this name."""
+    return importlib.import_module(IMPORTERS[name]).Importer
+
+
+def __getattr__(name: str) -> type:
+    if name in CLASSES:
+        from beangulp_importers.lazy import lazy_class
+
+        return lazy_class(name, CLASSES[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> List[str]:
+    return sorted(list(globals()) + __all__)
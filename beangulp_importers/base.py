@@ -0,0 +1,294 @@
+"""Base class of the CSV importers in this repository.
+
+It works like beangulp's csvbase.Importer, but reads the file from a memory
+map, see reader.py, so that the byte offsets of the rows are known. This
+allows incremental extraction: when the importer has checkpoints, only the
+rows after the checkpoint of a file are extracted.
+
+The rows are decoded a batch at a time into compact rows, see rows.py.
+"""
+
+from functools import partial
+from typing import TYPE_CHECKING, Any, Dict, Iterator, Optional, Sequence, Tuple
+from beancount.core import data
+from beangulp.importers import csvbase
+from beangulp_importers import dedup
+from beangulp_importers.reader import Reader
+from beangulp_importers.rows import Decoder
+import hashlib
+import mmap
+import os
+
+if TYPE_CHECKING:
+    # The optional services are only imported by the configurations that use them.
+    from beangulp_importers.cache import ParseCache
+    from beangulp_importers.categorize import Rules
+    from beangulp_importers.checkpoint import Checkpoint, Checkpoints
+    from beangulp_importers.predict import Predictor
+    from beangulp_importers.profiling import Profiler
+
+# The start and end offset of a row in the file.
+Span = Tuple[int, int]
+
+# Number of rows that are decoded together.
+BATCH_SIZE = 1024
+
+
+def fingerprint(values: Sequence[bytes], seen: Dict[str, int]) -> str:
+    """A short digest of the raw fields of a row.
+
+    Identical rows in the same file are told apart by how many were seen
+    before, so the fingerprint identifies a row within its file.
+    """
+    key = b"\x1f".join(values)
+    digest = hashlib.blake2b(key, digest_size=8).hexdigest()
+    # Only the digests of the rows are remembered, not the rows.
+    occurrence = seen.get(digest, 0)
+    seen[digest] = occurrence + 1
+    if occurrence:
+        key += b"\x1f%d" % occurrence
+        digest = hashlib.blake2b(key, digest_size=8).hexdigest()
+    return digest
+
+
+class Importer(csvbase.Importer):
+    # Set to a checkpoint.Checkpoints to only extract rows that were not extracted before.
+    checkpoints: Optional["Checkpoints"] = None
+    # Set to a cache.ParseCache to reuse the parsed rows of files that did not change.
+    parse_cache: Optional["ParseCache"] = None
+    # Set to a profiling.Profiler to time the stages of the extraction.
+    profiler: Optional["Profiler"] = None
+    # The column whose value the finalize time is broken down by in profiles.
+    profile_column: Optional[str] = None
+    # Set to categorize.Rules to categorize the transactions without a counter-posting.
+    categorizer: Optional["Rules"] = None
+    # Set to a predict.Predictor to learn the accounts of the rest from the existing entries.
+    predictor: Optional["Predictor"] = None
+
+    # Header names of other layouts of the export, mapped to the column names.
+    aliases: Dict[str, str] = {}
+
+    def preamble(self, filepath: str) -> int:
+        """The number of lines before the header of the file."""
+        return int(self.skiplines)
+
+    def first_lineno(self, filepath: str) -> int:
+        """The line number of the first data row, as csvbase counts them."""
+        return self.preamble(filepath) + bool(self.names) + 1
+
+    def read_rows(
+        self, filepath: str, checkpoint: Optional["Checkpoint"] = None
+    ) -> Iterator[Tuple[int, Any, Span]]:
+        """Read the rows of the file, starting after the checkpoint if given.
+
+        Yields the line number, the row and the byte offsets of the row. The
+        rows come from the parse cache if the importer has one.
+        """
+        if self.parse_cache is None:
+            return self.parse_rows(filepath, checkpoint)
+        key = self.parse_cache.key(self, filepath)
+        parsed = self.parse_cache.get(key)
+        if parsed is None:
+            if checkpoint is not None:
+                # Only part of the file is parsed, which is not worth caching.
+                return self.parse_rows(filepath, checkpoint)
+            parsed = list(self.parse_rows(filepath))
+            self.parse_cache.put(key, parsed)
+        if checkpoint is not None:
+            return (row for row in parsed if row[2][0] >= checkpoint.offset)
+        return iter(parsed)
+
+    def parse_rows(
+        self, filepath: str, checkpoint: Optional["Checkpoint"] = None
+    ) -> Iterator[Tuple[int, Any, Span]]:
+        """Read and parse the rows of the file, starting after the checkpoint if given."""
+        skiplines = self.preamble(filepath)
+        with open(filepath, "rb") as fd:
+            # Empty files cannot be mapped.
+            if os.fstat(fd.fileno()).st_size == 0:
+                yield from self.read_mapped(filepath, b"", skiplines, checkpoint)
+                return
+            with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                yield from self.read_mapped(filepath, mm, skiplines, checkpoint)
+
+    def read_mapped(
+        self, filepath: str, mm, skiplines: int, checkpoint: Optional["Checkpoint"]
+    ) -> Iterator[Tuple[int, Any, Span]]:
+        reader = Reader(mm, self.dialect, self.encoding)
+        comments = self.comments.encode(reader.encoding) if self.comments else None
+
+        # The lines before the header are skipped without splitting them.
+        position = reader.skip(reader.start, skiplines)
+        if position is None:
+            return
+        rows = reader.rows(position, comments)
+        if self.profiler is not None:
+            rows = self.profiler.iterate("read", rows)
+
+        names = None
+        if self.names:
+            _, position, headers = next(rows, (None, None, None))
+            if headers is None:
+                raise IndexError("The input file does not contain an header line")
+            names = {}
+            for index, name in enumerate(headers):
+                name = name.decode(reader.encoding).strip()
+                names[self.aliases.get(name, name)] = index
+
+        seen: Dict[str, int] = {}
+        decoder = Decoder(
+            self.columns, names, partial(fingerprint, seen=seen), reader.encoding
+        )
+        decode = self.timed("parse", decoder.decode)
+
+        lineno = self.first_lineno(filepath)
+        if checkpoint is not None:
+            # Identical rows are told apart by how many came before them, so the rows
+            # before the checkpoint are counted, but not decoded.
+            for _, end, values in rows:
+                if values:
+                    fingerprint(values, seen)
+                if end >= checkpoint.offset:
+                    break
+            lineno += checkpoint.rows
+
+        batch = []
+        for start, end, values in rows:
+            batch.append((lineno, values, (start, end)))
+            lineno += 1
+            if len(batch) == BATCH_SIZE:
+                yield from self.decode_batch(decode, batch)
+                batch = []
+        yield from self.decode_batch(decode, batch)
+
+    @staticmethod
+    def decode_batch(decode, batch) -> Iterator[Tuple[int, Any, Span]]:
+        # Empty lines have no row.
+        rows = iter(decode([values for _, values, _ in batch if values]))
+        for lineno, values, span in batch:
+            yield lineno, next(rows) if values else None, span
+
+    def transactions(
+        self, filepath: str, checkpoint: Optional["Checkpoint"] = None
+    ) -> Iterator[Tuple[data.Transaction, Any, int, Span]]:
+        """Build a transaction for each row.
+
+        This is the per-row part of csvbase.Importer.extract. Yields the
+        finalized transaction together with its row, line number and offsets.
+        """
+        default_account = self.account(filepath)
+        key = None
+        if self.profile_column is not None:
+            key = lambda transaction, row: getattr(row, self.profile_column)
+        finalize = self.timed("finalize", self.finalize, key)
+        for lineno, row, span in self.read_rows(filepath, checkpoint):
+            # Skip empty lines.
+            if row is None:
+                continue
+
+            tag = getattr(row, "tag", None)
+            tags = {tag} if tag else csvbase.EMPTY
+
+            link = getattr(row, "link", None)
+            links = {link} if link else csvbase.EMPTY
+
+            flag = getattr(row, "flag", self.flag)
+            payee = getattr(row, "payee", None)
+            account = getattr(row, "account", default_account)
+            currency = getattr(row, "currency", self.currency)
+            units = data.Amount(row.amount, currency)
+
+            meta = self.metadata(filepath, lineno, row)
+            meta["fingerprint"] = row.fingerprint
+            txn = data.Transaction(
+                meta,
+                row.date,
+                flag,
+                payee,
+                row.narration,
+                tags,
+                links,
+                [data.Posting(account, units, None, None, None, None)],
+            )
+            yield finalize(txn, row), row, lineno, span
+
+    def timed(self, stage: str, function, key=None):
+        """The function, timed as the stage if the importer has a profiler."""
+        if self.profiler is None:
+            return function
+        return self.profiler.timed(stage, function, key)
+
+    def finish_profile(self, filepath: str) -> None:
+        """Store the profile of the extraction of the file, if profiling."""
+        if self.profiler is not None:
+            self.profiler.finish(filepath)
+
+    def categorize(self, entries: data.Entries, existing: data.Entries) -> data.Entries:
+        """Categorize the extracted transactions with the rules, then the predictor."""
+        if self.categorizer is not None:
+            entries = self.timed("post", self.categorizer.categorize)(entries)
+        if self.predictor is not None:
+            self.timed("train", self.predictor.train)(existing)
+            entries = self.timed("post", self.predictor.categorize)(entries)
+        return entries
+
+    def resume(self, filepath: str) -> Optional["Checkpoint"]:
+        """The checkpoint to continue the extraction of the file from, if any."""
+        if self.checkpoints is None:
+            return None
+        return self.checkpoints.get(filepath)
+
+    def commit(
+        self, filepath: str, lineno: int, span: Span, state: Optional[dict] = None
+    ) -> None:
+        """Remember that the file was extracted up to and including this row."""
+        if self.checkpoints is None:
+            return
+        from beangulp_importers.checkpoint import Checkpoint, digest
+
+        start, offset = span
+        self.checkpoints.set(
+            filepath,
+            Checkpoint(
+                offset,
+                lineno - self.first_lineno(filepath) + 1,
+                start,
+                digest(filepath, start, offset),
+                state or {},
+            ),
+        )
+
+    @staticmethod
+    def duplicate_keys(entry: data.Transaction):
+        """Natural keys of a transaction, to find it in the existing entries."""
+        if entry.postings:
+            yield (entry.date, entry.narration, entry.postings[0].units)
+
+    def deduplicate(self, entries: data.Entries, existing: data.Entries) -> None:
+        """Mark the entries that have the same keys as an existing transaction."""
+        dedup.mark_duplicates(entries, existing, self.duplicate_keys)
+
+    def stream(self, filepath: str) -> Iterator[data.Transaction]:
+        """Yield the transactions of the file one at a time.
+
+        Only a batch of rows is kept in memory. The checkpoint is committed
+        once all transactions have been consumed.
+        """
+        last = None
+        for txn, row, lineno, span in self.transactions(filepath, self.resume(filepath)):
+            yield txn
+            last = (lineno, span)
+
+        if last is not None:
+            self.commit(filepath, *last)
+
+    def extract(self, filepath: str, existing: data.Entries) -> data.Entries:
+        entries = list(self.stream(filepath))
+
+        # Reverse the list if the file is in descending order.
+        if len(entries) > 1 and not entries[0].date <= entries[-1].date:
+            entries.reverse()
+
+        entries = self.categorize(entries, existing)
+        self.finish_profile(filepath)
+        return entries
@@ -0,0 +1,116 @@
+"""Extract many files in parallel.
+
+Identification and extraction of a file only depend on that file, so the
+files are spread over a pool of worker processes. The results are returned
+in the order of the given files, whatever order the workers finish in.
+
+    from beangulp_importers import batch
+
+    results = batch.extract_files(importers, filepaths, existing, workers=4)
+    for result in results:
+        if result.error is not None:
+            print(result.filepath, result.error)
+        else:
+            print(result.filepath, result.extract_time)
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, List, NamedTuple, Optional, Sequence
+import time
+
+
+class ExtractedFile(NamedTuple):
+    filepath: str
+    # The extracted entries, empty if no importer identified the file.
+    entries: List[Any]
+    account: Optional[str]
+    importer: Optional[Any]
+    # Wall time in seconds spent in identify() and in extract() plus account().
+    identify_time: float
+    extract_time: float
+    # The exception that identifying or extracting the file raised, if any.
+    error: Optional[Exception] = None
+
+
+# The importers and existing entries of a worker process. They are sent once
+# per worker instead of once per file.
+_importers: Sequence[Any] = ()
+_existing: List[Any] = []
+
+
+def _initialize(importers: Sequence[Any], existing: List[Any]) -> None:
+    global _importers, _existing
+    _importers = importers
+    _existing = existing
+
+
+def _process(filepath: str) -> ExtractedFile:
+    start = time.perf_counter()
+    try:
+        return _extract(filepath, start)
+    except Exception as error:
+        # Like beangulp, an error only fails the file it happened in.
+        return ExtractedFile(
+            filepath, [], None, None, time.perf_counter() - start, 0.0, error
+        )
+
+
+def _extract(filepath: str, start: float) -> ExtractedFile:
+    matching = [i for i, importer in enumerate(_importers) if importer.identify(filepath)]
+    identified = time.perf_counter()
+    if len(matching) == 0:
+        return ExtractedFile(filepath, [], None, None, identified - start, 0.0)
+    if len(matching) > 1:
+        raise ValueError(f"{filepath} is identified by more than one importer")
+
+    importer = _importers[matching[0]]
+    entries = importer.extract(filepath, _existing)
+    account = importer.account(filepath)
+    # Send the index of the importer back, not a copy of it.
+    return ExtractedFile(
+        filepath,
+        entries,
+        account,
+        matching[0],
+        identified - start,
+        time.perf_counter() - identified,
+    )
+
+
+def extract_files(
+    importers: Sequence[Any],
+    filepaths: Sequence[str],
+    existing: Optional[List[Any]] = None,
+    workers: Optional[int] = None,
+) -> List[ExtractedFile]:
+    """Identify and extract the files with a pool of worker processes.
+
+    Args:
+      importers: The importers to try on each file.
+      filepaths: The files to extract.
+      existing: Entries of the existing ledger, passed to extract().
+      workers: Number of worker processes. Defaults to the number of CPUs,
+        0 extracts the files in the current process.
+
+    Returns:
+      One ExtractedFile for each file, in the order of filepaths. The error of
+      a file that could not be extracted is in its error field.
+    """
+    existing = existing if existing is not None else []
+    if workers == 0:
+        _initialize(importers, existing)
+        results = [_process(filepath) for filepath in filepaths]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_initialize,
+            initargs=(importers, existing),
+        ) as executor:
+            results = list(executor.map(_process, filepaths))
+
+    return [
+        result._replace(importer=importers[result.importer])
+        if result.importer is not None
+        else result
+        for result in results
+    ]
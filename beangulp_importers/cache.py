@@ -0,0 +1,196 @@
+"""Cache of the parsed rows of files.
+
+Extracting the same files over and over, for example while tuning rules,
+parses the same rows every time. With a parse cache, the rows of a file are
+stored after parsing and read back the next time instead:
+
+    from beangulp_importers.cache import ParseCache
+
+    importer.parse_cache = ParseCache("~/.cache/beangulp")
+
+An entry is found by a digest of:
+
+- the contents of the file,
+- the importer class and the settings that parsing depends on, such as the
+  columns, dialect and encoding, and
+- the source code of the importer and of the reading and parsing modules,
+  so that a new version of the code does not use rows parsed by the old.
+
+The rows are pickled with their values as parsed, so reading them back
+skips decoding and parsing altogether. Only the rows are cached: finalize()
+and the rest of extract() run as usual. When the entries take more than
+max_size bytes, the least recently used entries are removed.
+"""
+
+import hashlib
+import os
+import pickle
+import sys
+from importlib import metadata
+from typing import Any, Dict, List, Optional, Tuple
+from beangulp_importers import rows
+
+VERSION = 1
+MAX_SIZE = 256 * 2**20
+SUFFIX = ".rows"
+# Number of bytes read at a time to compute the digest of a file.
+CHUNK_SIZE = 2**20
+
+# Modules whose code determines the parsed rows, besides the importer's own.
+MODULES = ("beangulp_importers.base", "beangulp_importers.reader", "beangulp_importers.rows")
+
+# The code digest of each importer class.
+_code_digests: Dict[type, str] = {}
+
+
+def code_digest(cls: type) -> str:
+    """A digest of the source files of the class, its bases and the reading code."""
+    digest = _code_digests.get(cls)
+    if digest is None:
+        hasher = hashlib.blake2b(digest_size=16)
+        # The columns of beangulp parse the values.
+        hasher.update(metadata.version("beangulp").encode())
+        modules = {c.__module__ for c in cls.__mro__} | set(MODULES)
+        for name in sorted(modules):
+            module = sys.modules.get(name)
+            filepath = module and getattr(module, "__file__", None)
+            if filepath and name.split(".")[0].startswith("beangulp_"):
+                with open(filepath, "rb") as fd:
+                    hasher.update(fd.read())
+        digest = _code_digests[cls] = hasher.hexdigest()
+    return digest
+
+
+def parse_config(importer: Any) -> str:
+    """The settings of the importer that the parsed rows depend on."""
+    columns = [
+        (name, type(column).__qualname__, sorted(vars(column).items(), key=str))
+        for name, column in importer.columns.items()
+    ]
+    settings = [
+        (name, getattr(importer, name, None))
+        for name in (
+            "encoding",
+            "dialect",
+            "names",
+            "skiplines",
+            "comments",
+            "aliases",
+        )
+    ]
+    return repr((columns, settings))
+
+
+def file_digest(filepath: str) -> str:
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(filepath, "rb") as fd:
+        while True:
+            chunk = fd.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class ParseCache:
+    """Parsed rows of files in a directory, at most max_size bytes."""
+
+    def __init__(self, directory: str, max_size: int = MAX_SIZE) -> None:
+        self.directory = os.path.expanduser(directory)
+        self.max_size = max_size
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, importer: Any, filepath: str) -> str:
+        cls = type(importer)
+        hasher = hashlib.blake2b(digest_size=16)
+        for part in (
+            str(VERSION),
+            file_digest(filepath),
+            f"{cls.__module__}.{cls.__qualname__}",
+            parse_config(importer),
+            code_digest(cls),
+        ):
+            hasher.update(part.encode())
+            hasher.update(b"\0")
+        return hasher.hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def get(self, key: str) -> Optional[List[Tuple[int, Any, Tuple[int, int]]]]:
+        """The cached rows, as read_rows() yields them, or None."""
+        path = self.path(key)
+        try:
+            with open(path, "rb") as fd:
+                slots, constants, records = pickle.load(fd)
+        except Exception:
+            # A missing, damaged or outdated entry, such as one that refers to a
+            # class that no longer exists, is a miss.
+            return None
+        # Mark the entry as recently used.
+        os.utime(path)
+        row_type = rows.row_type(slots, constants)
+        new = row_type.__new__
+        setters = [rows.Row.__dict__["fingerprint"].__set__] + [
+            row_type.__dict__[slot].__set__ for slot in slots
+        ]
+        result = []
+        for lineno, start, end, values in records:
+            row = None
+            if values is not None:
+                row = new(row_type)
+                for set_value, value in zip(setters, values):
+                    set_value(row, value)
+            result.append((lineno, row, (start, end)))
+        return result
+
+    def put(self, key: str, parsed: List[Tuple[int, Any, Tuple[int, int]]]) -> None:
+        """Store the rows that read_rows() yielded and evict old entries."""
+        row = next((row for _, row, _ in parsed if row is not None), None)
+        if row is None:
+            return
+        cls = type(row)
+        slots = cls.__slots__
+        constants = {
+            name: value
+            for name, value in vars(cls).items()
+            if not name.startswith("__") and name not in slots and not isinstance(value, property)
+        }
+        getters = [rows.Row.__dict__["fingerprint"].__get__] + [
+            cls.__dict__[slot].__get__ for slot in slots
+        ]
+        records = [
+            (
+                lineno,
+                start,
+                end,
+                None if row is None else tuple(get(row) for get in getters),
+            )
+            for lineno, row, (start, end) in parsed
+        ]
+        path = self.path(key)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as fd:
+            pickle.dump((slots, constants, records), fd, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, path)
+        self.evict()
+
+    def evict(self) -> None:
+        """Remove the least recently used entries while the cache is too large."""
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if entry.name.endswith(SUFFIX):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+                    total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,249 @@
+"""Categorize extracted transactions with rules.
+
+A rules file is a JSON list of rules. A rule gives the account for the
+transactions that match all of its conditions, and the first matching rule
+in the file wins:
+
+    [
+        {"iban": "NL00BANK0123456789", "account": "Expenses:Rent"},
+        {"payee": "Albert Heijn", "account": "Expenses:Groceries"},
+        {"narration": "parkeren|parking", "account": "Expenses:Car"},
+        {"payee": "NS", "max_amount": "-50", "account": "Expenses:Travel:Subscription"}
+    ]
+
+The conditions are:
+
+- iban: the IBAN of the other party, from the iban metadata.
+- payee: the payee, compared without case.
+- narration: a regular expression that is searched for in the narration,
+  without case.
+- min_amount, max_amount: the range of the amount on the account of the
+  export, negative for money going out.
+
+The rules are compiled into an index, so that a transaction is not
+compared with every rule:
+
+- Rules with an IBAN or a payee are looked up in a dict.
+- Narration patterns without special characters, the most common kind,
+  are looked up in a dict, for every position in the narration and every
+  length of those patterns.
+- The other narration patterns are combined into one regular expression,
+  whose alternatives are tried in the order of the rules.
+
+Only transactions that have no counter-posting, or a counter-posting to
+UNKNOWN_ACCOUNT, are categorized:
+
+    from beangulp_importers.categorize import Rules
+
+    importer.categorizer = Rules.load("rules.json")
+"""
+
+import json
+import re
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Pattern
+from beancount.core import data
+
+# The account of counter-postings that the importer could not categorize.
+UNKNOWN_ACCOUNT = "Expenses:UnknownAccount"
+
+
+class Rule(NamedTuple):
+    account: str
+    payee: Optional[str] = None
+    iban: Optional[str] = None
+    narration: Optional[Pattern] = None
+    min_amount: Optional[Decimal] = None
+    max_amount: Optional[Decimal] = None
+
+
+def normalize_iban(iban: str) -> str:
+    return iban.replace(" ", "").upper()
+
+
+def normalize_payee(payee: str) -> str:
+    return payee.strip().casefold()
+
+
+def is_uncategorized(entry: data.Transaction) -> bool:
+    """Whether the transaction has no counter-posting or one to UNKNOWN_ACCOUNT."""
+    postings = entry.postings
+    if len(postings) == 1:
+        return postings[0].units is not None
+    return any(posting.account == UNKNOWN_ACCOUNT for posting in postings)
+
+
+def export_amount(entry: data.Transaction) -> Optional[Decimal]:
+    """The amount of an uncategorized transaction on the account of the export."""
+    for posting in entry.postings:
+        if posting.account == UNKNOWN_ACCOUNT:
+            # The unknown posting is the counter-posting of that amount.
+            return None if posting.units is None else -posting.units.number
+    units = entry.postings[0].units
+    return None if units is None else units.number
+
+
+def assign(
+    entry: data.Transaction, account: str, meta: Optional[Dict[str, Any]] = None
+) -> data.Transaction:
+    """The uncategorized transaction with its counter-posting to the account."""
+    postings = list(entry.postings)
+    if len(postings) == 1:
+        units = postings[0].units
+        postings.append(data.Posting(account, -units, None, None, None, meta))
+        return entry._replace(postings=postings)
+    for i, posting in enumerate(postings):
+        if posting.account == UNKNOWN_ACCOUNT:
+            if meta:
+                posting = posting._replace(meta={**(posting.meta or {}), **meta})
+            postings[i] = posting._replace(account=account)
+    return entry._replace(postings=postings)
+
+
+SPECIAL = set(".^$*+?{}[]\\|()")
+
+
+def is_literal(pattern: str) -> bool:
+    return bool(pattern) and not SPECIAL.intersection(pattern)
+
+
+class Rules:
+    """An index of rules, to find the first rule that matches a transaction."""
+
+    def __init__(self, rules: Iterable[Rule]) -> None:
+        self.rules: List[Rule] = list(rules)
+        # The indexes of the rules by IBAN and by payee, in the order of the file.
+        self.ibans: Dict[str, List[int]] = {}
+        self.payees: Dict[str, List[int]] = {}
+        # The rules with a literal narration pattern, by the pattern in lower case.
+        self.literals: Dict[str, List[int]] = {}
+        # The rules with another narration pattern or only an amount range.
+        patterns = []
+        self.pattern_rules: List[int] = []
+        self.range_rules: List[int] = []
+        for index, rule in enumerate(self.rules):
+            if rule.iban is not None:
+                self.ibans.setdefault(normalize_iban(rule.iban), []).append(index)
+            elif rule.payee is not None:
+                self.payees.setdefault(normalize_payee(rule.payee), []).append(index)
+            elif rule.narration is not None and is_literal(rule.narration.pattern):
+                self.literals.setdefault(rule.narration.pattern.lower(), []).append(index)
+            elif rule.narration is not None:
+                # The empty group tells which alternative, so which rule, matched.
+                patterns.append(f"(?=.*?(?:{rule.narration.pattern}))(?P<r{index}>)")
+                self.pattern_rules.append(index)
+            elif rule.min_amount is not None or rule.max_amount is not None:
+                self.range_rules.append(index)
+            else:
+                raise ValueError(f"Rule {index} for {rule.account} has no conditions")
+        self.lengths = sorted({len(literal) for literal in self.literals})
+        # Alternatives are tried in order, so the first rule whose pattern matches wins.
+        self.pattern = None
+        if patterns:
+            self.pattern = re.compile(
+                "^(?:" + "|".join(patterns) + ")", re.IGNORECASE | re.DOTALL
+            )
+
+    @classmethod
+    def load(cls, filepath: str) -> "Rules":
+        with open(filepath) as fd:
+            return cls.from_json(json.load(fd))
+
+    @classmethod
+    def from_json(cls, rules: List[Dict[str, Any]]) -> "Rules":
+        def amount(value) -> Optional[Decimal]:
+            return None if value is None else Decimal(str(value))
+
+        return cls(
+            Rule(
+                rule["account"],
+                rule.get("payee"),
+                rule.get("iban"),
+                re.compile(rule["narration"], re.IGNORECASE) if "narration" in rule else None,
+                amount(rule.get("min_amount")),
+                amount(rule.get("max_amount")),
+            )
+            for rule in rules
+        )
+
+    @staticmethod
+    def matches(rule: Rule, entry: data.Transaction, amount: Optional[Decimal]) -> bool:
+        """Whether the transaction meets all conditions of the rule."""
+        if rule.iban is not None:
+            if normalize_iban(entry.meta.get("iban") or "") != normalize_iban(rule.iban):
+                return False
+        if rule.payee is not None:
+            if normalize_payee(entry.payee or "") != normalize_payee(rule.payee):
+                return False
+        if rule.narration is not None and not rule.narration.search(entry.narration or ""):
+            return False
+        if rule.min_amount is not None and (amount is None or amount < rule.min_amount):
+            return False
+        if rule.max_amount is not None and (amount is None or amount > rule.max_amount):
+            return False
+        return True
+
+    def first(self, indexes: Iterable[int], entry: data.Transaction, amount) -> Optional[int]:
+        for index in indexes:
+            if self.matches(self.rules[index], entry, amount):
+                return index
+        return None
+
+    def match(self, entry: data.Transaction, amount: Optional[Decimal] = None) -> Optional[Rule]:
+        """The first rule that matches the transaction with this amount, if any."""
+        candidates = []
+        iban = entry.meta.get("iban")
+        if iban and self.ibans:
+            candidates.append(self.first(self.ibans.get(normalize_iban(iban), ()), entry, amount))
+        if entry.payee and self.payees:
+            candidates.append(
+                self.first(self.payees.get(normalize_payee(entry.payee), ()), entry, amount)
+            )
+        if self.literals and entry.narration:
+            candidates.append(self.match_literals(entry, amount))
+        if self.pattern is not None:
+            found = self.pattern.match(entry.narration or "")
+            if found is not None:
+                index = int(found.lastgroup[1:])
+                if not self.matches(self.rules[index], entry, amount):
+                    # Another condition failed, try the rules after it one by one.
+                    position = self.pattern_rules.index(index) + 1
+                    index = self.first(self.pattern_rules[position:], entry, amount)
+                candidates.append(index)
+        if self.range_rules:
+            candidates.append(self.first(self.range_rules, entry, amount))
+        candidates = [index for index in candidates if index is not None]
+        return self.rules[min(candidates)] if candidates else None
+
+    def match_literals(self, entry: data.Transaction, amount) -> Optional[int]:
+        """The first rule with a literal narration pattern that matches, if any."""
+        text = entry.narration.lower()
+        literals = self.literals
+        found = None
+        for start in range(len(text)):
+            for length in self.lengths:
+                indexes = literals.get(text[start : start + length])
+                if indexes is None:
+                    continue
+                for index in indexes:
+                    if found is not None and index >= found:
+                        break
+                    if self.matches(self.rules[index], entry, amount):
+                        found = index
+                        break
+        return found
+
+    def categorize(self, entries: List[Any]) -> List[Any]:
+        """The entries with the uncategorized transactions categorized."""
+        result = []
+        for entry in entries:
+            if isinstance(entry, data.Transaction):
+                entry = self.categorize_transaction(entry)
+            result.append(entry)
+        return result
+
+    def categorize_transaction(self, entry: data.Transaction) -> data.Transaction:
+        if not is_uncategorized(entry):
+            return entry
+        rule = self.match(entry, export_amount(entry))
+        return entry if rule is None else assign(entry, rule.account)
@@ -0,0 +1,106 @@
+"""Checkpoints for incremental extraction.
+
+Most exports only grow by appending rows. A checkpoint remembers how far a
+file was imported, so the next run can seek past the rows that were already
+imported. Checkpoints are kept in a JSON file:
+
+    from beangulp_importers.checkpoint import Checkpoints
+
+    importer = AsnBankImporter(known_accounts)
+    importer.checkpoints = Checkpoints("checkpoints.json")
+"""
+
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, NamedTuple, Optional
+import hashlib
+import json
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Number of bytes at the start of the file that are part of the digest.
+HEAD_SIZE = 4096
+
+
+class Checkpoint(NamedTuple):
+    # Byte offset of the end of the last processed row.
+    offset: int
+    # Number of rows (excluding the header) up to and including that row.
+    rows: int
+    # Byte offset of the start of the last processed row.
+    start: int
+    # Digest of the start of the file and of the last processed row.
+    digest: str
+    # Importer specific state that is needed to continue at the offset.
+    state: Dict[str, Any] = {}
+
+
+def digest(filepath: str, start: int, end: int) -> str:
+    """Digest of the head of the file and of the bytes between start and end.
+
+    Only bytes before start are part of the head, so appending rows to a
+    file does not change the digest.
+    """
+    with open(filepath, "rb") as fd:
+        head = fd.read(min(start, HEAD_SIZE))
+        fd.seek(start)
+        row = fd.read(end - start)
+    return hashlib.blake2b(head + row, digest_size=16).hexdigest()
+
+
+class Checkpoints:
+    """Checkpoints of files, stored in a JSON file and keyed by file path.
+
+    Worker processes of the batch driver or the watcher share the file: every
+    checkpoint is merged into the checkpoints on disk while holding a lock.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.checkpoints = self.load()
+
+    def load(self) -> Dict[str, Checkpoint]:
+        """Read the checkpoints on disk."""
+        checkpoints = {}
+        if os.path.exists(self.path):
+            with open(self.path) as fd:
+                for filepath, values in json.load(fd).items():
+                    checkpoints[filepath] = Checkpoint(**values)
+        return checkpoints
+
+    @contextmanager
+    def lock(self) -> Iterator[None]:
+        """Hold an exclusive lock on the checkpoints of all processes."""
+        with open(self.path + ".lock", "w") as fd:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+
+    def get(self, filepath: str) -> Optional[Checkpoint]:
+        """Return the checkpoint of the file if it still matches its contents."""
+        checkpoint = self.checkpoints.get(os.path.abspath(filepath))
+        if checkpoint is None:
+            return None
+        if os.path.getsize(filepath) < checkpoint.offset:
+            return None
+        if digest(filepath, checkpoint.start, checkpoint.offset) != checkpoint.digest:
+            return None
+        return checkpoint
+
+    def set(self, filepath: str, checkpoint: Checkpoint) -> None:
+        """Store the checkpoint of the file and write it to disk."""
+        with self.lock():
+            # Keep the checkpoints that other processes wrote in the meantime.
+            self.checkpoints = self.load()
+            self.checkpoints[os.path.abspath(filepath)] = checkpoint
+            temporary = f"{self.path}.{os.getpid()}.tmp"
+            with open(temporary, "w") as fd:
+                json.dump(
+                    {key: value._asdict() for key, value in self.checkpoints.items()},
+                    fd,
+                    indent=1,
+                )
+            os.replace(temporary, self.path)
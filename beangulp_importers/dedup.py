@@ -0,0 +1,83 @@
+"""Find duplicates of extracted transactions in the existing ledger.
+
+beangulp compares every extracted entry with the existing entries around its
+date. Instead, the existing transactions are put in a dict by natural keys,
+such as a transaction ID or the date, amount and narration, and every
+extracted transaction is looked up by its keys.
+
+The index is kept for as long as the same existing entries are passed in, so
+it is built once per run and not once per file. The entries that beangulp
+appends to them after every file are added to the index.
+"""
+
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+from beancount.core import data
+from beangulp import extract
+
+KeyFunction = Callable[[data.Transaction], Iterable[Hashable]]
+
+
+class DuplicateIndex:
+    def __init__(self, existing: List[Any], keys: KeyFunction) -> None:
+        self.natural_keys = keys
+        self.index: Dict[Hashable, data.Transaction] = {}
+        self.add(existing)
+
+    def add(self, entries: Iterable[Any]) -> None:
+        """Add the transactions of the entries to the index."""
+        for entry in entries:
+            if isinstance(entry, data.Transaction):
+                for key in self.keys(entry):
+                    self.index.setdefault(key, entry)
+
+    def keys(self, entry: data.Transaction) -> Iterable[Hashable]:
+        # The row fingerprint is the cheapest and most precise key, when present.
+        fingerprint = entry.meta.get("fingerprint")
+        if fingerprint is not None:
+            yield ("fingerprint", fingerprint)
+        # Transfers keep the fingerprint of the merged leg on its posting.
+        for posting in entry.postings:
+            if posting.meta and "fingerprint" in posting.meta:
+                yield ("fingerprint", posting.meta["fingerprint"])
+        yield from self.natural_keys(entry)
+
+    def find(self, entry: data.Transaction) -> Optional[data.Transaction]:
+        """Return an existing transaction with one of the keys of the entry."""
+        for key in self.keys(entry):
+            duplicate = self.index.get(key)
+            if duplicate is not None:
+                return duplicate
+        return None
+
+
+# The index of each key function with the existing entries it was built from.
+_indexes: Dict[KeyFunction, Tuple[List[Any], int, DuplicateIndex]] = {}
+
+
+def index(existing: List[Any], keys: KeyFunction) -> DuplicateIndex:
+    """Return the index of the existing entries, reusing it if possible."""
+    cached = _indexes.get(keys)
+    if cached is not None and cached[0] is existing and cached[1] <= len(existing):
+        # beangulp appends the entries of every file to the existing entries.
+        duplicates = cached[2]
+        duplicates.add(existing[cached[1] :])
+        _indexes[keys] = (existing, len(existing), duplicates)
+        return duplicates
+    duplicates = DuplicateIndex(existing, keys)
+    _indexes[keys] = (existing, len(existing), duplicates)
+    return duplicates
+
+
+def mark_duplicates(entries: List[Any], existing: List[Any], keys: KeyFunction) -> None:
+    """Mark the extracted transactions that are already in the existing entries.
+
+    Like beangulp, the duplicate metadata field is set to the existing entry.
+    """
+    if not existing:
+        return
+    duplicates = index(existing, keys)
+    for entry in entries:
+        if isinstance(entry, data.Transaction):
+            duplicate = duplicates.find(entry)
+            if duplicate is not None:
+                entry.meta[extract.DUPLICATE] = duplicate
@@ -0,0 +1,76 @@
+"""Identify files by their first bytes.
+
+The prefix of a file is read once and shared by the identify() methods of
+all importers. Each importer matches it against a precompiled signature of
+its export format.
+"""
+
+import csv
+import functools
+import os
+import re
+from typing import Dict, List, Pattern, Tuple
+
+# Number of bytes read from the start of a file. Large enough to cover the
+# preamble of a Coinbase export.
+PREFIX_SIZE = 4096
+
+BOM = rb"(?:\xef\xbb\xbf)?"
+
+SIGNATURES: Dict[str, Pattern[bytes]] = {
+    # Statements start directly with a row, which starts with the date.
+    "asnbank": re.compile(rb"\d\d-\d\d-\d\d\d\d,"),
+    # A preamble of a few lines followed by the header, which the importer finds
+    # by the header group.
+    "coinbase": re.compile(
+        rb"(?:.*\r?\n){0,16}?"
+        rb"(?P<header>(?:ID,)?Timestamp,Transaction Type,Asset,Quantity Transacted,)"
+    ),
+    "ovchipkaart": re.compile(
+        BOM
+        + rb'"Datum";"Check-in";"Vertrek";"Check-uit";"Bestemming";"Bedrag";"Transactie";'
+        + rb'"Klasse";"Product";"Opmerkingen";"Naam";"Kaartnummer"'
+    ),
+    # The names in the header depend on the language of the account, so only its
+    # form is matched: at least ten quoted names. The importer checks the names.
+    "paypal": re.compile(BOM + rb'"[^"\r\n]+"(?:,"[^"\r\n]*"){9,}\r?\n'),
+}
+
+
+def file_key(filepath: str) -> Tuple[str, int, int]:
+    stat = os.stat(filepath)
+    return (os.path.abspath(filepath), stat.st_mtime_ns, stat.st_size)
+
+
+@functools.lru_cache(maxsize=256)
+def _read_prefix(key: Tuple[str, int, int]) -> bytes:
+    with open(key[0], "rb") as fd:
+        return fd.read(PREFIX_SIZE)
+
+
+def prefix(filepath: str) -> bytes:
+    """Return the first bytes of the file.
+
+    The result is cached by path, modification time and size, so identifying
+    a file with every importer only opens it once.
+    """
+    return _read_prefix(file_key(filepath))
+
+
+def matches(name: str, filepath: str) -> bool:
+    """Whether the file starts with the signature of the named importer."""
+    return SIGNATURES[name].match(prefix(filepath)) is not None
+
+
+def header(
+    filepath: str, encoding: str = "utf-8-sig", delimiter: str = ","
+) -> List[str]:
+    """Return the names in the first line of the file."""
+    line = prefix(filepath).split(b"\n", 1)[0].decode(encoding, "replace")
+    return next(csv.reader([line], delimiter=delimiter), [])
+
+
+def identify(filepath: str) -> List[str]:
+    """Return the names of the importers whose signature matches the file."""
+    head = prefix(filepath)
+    return [name for name, signature in SIGNATURES.items() if signature.match(head)]
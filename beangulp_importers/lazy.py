@@ -0,0 +1,107 @@
+"""Importers that are only imported when a file matches their signature.
+
+The classes of the registry, such as beangulp_importers.AsnBankImporter,
+create a LazyImporter. It keeps the arguments and identifies files by the
+signature of the export in identify.SIGNATURES, without importing the
+importer module. The module is imported and the real importer created
+with the arguments once a file matches, or once an attribute that only the
+real importer has is used.
+
+Attributes that are set before that, such as checkpoints, are set on the
+real importer when it is created.
+"""
+
+from typing import Any, Dict, Optional
+import beangulp
+from beangulp_importers import identify
+
+
+class LazyImporter(beangulp.Importer):
+    # The name of the importer in the registry, set by the subclasses.
+    key = ""
+
+    def __init__(self, *args, **kwargs) -> None:
+        vars(self).update(_args=args, _kwargs=kwargs, _attributes={}, _importer=None)
+
+    @property
+    def importer(self) -> Any:
+        """The real importer, imported and created on first use."""
+        importer = self._importer
+        if importer is None:
+            from beangulp_importers import load
+
+            importer = load(self.key)(*self._args, **self._kwargs)
+            for name, value in self._attributes.items():
+                setattr(importer, name, value)
+            vars(self)["_importer"] = importer
+        return importer
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_"):
+            # Not forwarded, such as the attributes looked up while unpickling.
+            raise AttributeError(name)
+        if name in self._attributes:
+            return self._attributes[name]
+        return getattr(self.importer, name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        if self._importer is None:
+            self._attributes[name] = value
+        else:
+            setattr(self._importer, name, value)
+
+    def __delattr__(self, name: str) -> None:
+        if self._importer is None:
+            del self._attributes[name]
+        else:
+            delattr(self._importer, name)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.key!r})"
+
+    @property
+    def name(self) -> str:
+        from beangulp_importers import IMPORTERS
+
+        return IMPORTERS[self.key] + ".Importer"
+
+    def identify(self, filepath: str) -> bool:
+        if not identify.matches(self.key, filepath):
+            return False
+        return self.importer.identify(filepath)
+
+    def account(self, filepath: str) -> str:
+        return self.importer.account(filepath)
+
+    def date(self, filepath: str):
+        return self.importer.date(filepath)
+
+    def filename(self, filepath: str) -> Optional[str]:
+        return self.importer.filename(filepath)
+
+    def extract(self, filepath: str, existing) -> Any:
+        return self.importer.extract(filepath, existing)
+
+    def deduplicate(self, entries, existing) -> None:
+        return self.importer.deduplicate(entries, existing)
+
+    def sort(self, entries, reverse=False) -> None:
+        return self.importer.sort(entries, reverse)
+
+
+# The LazyImporter subclass of each importer.
+_classes: Dict[str, type] = {}
+
+
+def lazy_class(class_name: str, key: str) -> type:
+    """The LazyImporter subclass for the importer with this name."""
+    cls = _classes.get(key)
+    if cls is None:
+        # Found by pickle as an attribute of the registry.
+        namespace = {
+            "key": key,
+            "__module__": "beangulp_importers",
+            "__qualname__": class_name,
+        }
+        cls = _classes[key] = type(class_name, (LazyImporter,), namespace)
+    return cls
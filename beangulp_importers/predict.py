@@ -0,0 +1,203 @@
+"""Predict the counter-account of transactions from the existing ledger.
+
+The model counts, for every token of the transactions in the ledger, how
+often it went with each Expenses and Income account. The tokens are the
+words of the payee and of the narration and the IBAN of the other party:
+
+    payee:albert  payee:heijn  narration:boodschappen  iban:NL00BANK0123456789
+
+An uncategorized transaction gets the account with the most votes from its
+tokens, as a counter-posting with the confidence as metadata. A token
+votes for an account with the share of its transactions that went to that
+account, times n / (n + 1) for a token seen n times, so that a token seen
+once does not count as much as one seen a hundred times. The confidence is
+the average vote of the known tokens for the account.
+
+The model is kept in a JSON file together with the digests of the
+transactions it learned from, so every run only learns from the new
+transactions of the ledger:
+
+    from beangulp_importers.predict import Predictor
+
+    importer.predictor = Predictor("predictor.json")
+
+Transactions that are edited in the ledger after they were learned are not
+learned again.
+"""
+
+import hashlib
+import json
+import os
+import re
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from beancount.core import data
+from beangulp_importers.categorize import (
+    UNKNOWN_ACCOUNT,
+    assign,
+    is_uncategorized,
+    normalize_iban,
+)
+
+VERSION = 1
+# The account types that are predicted.
+ROOTS = ("Expenses", "Income")
+WORD = re.compile(r"[^\W\d_]{3,}")
+CONFIDENCE = Decimal("0.01")
+
+
+def tokens(entry: data.Transaction) -> Set[str]:
+    """The tokens of a transaction."""
+    result = set()
+    if entry.payee:
+        result.update("payee:" + word for word in WORD.findall(entry.payee.lower()))
+    if entry.narration:
+        result.update("narration:" + word for word in WORD.findall(entry.narration.lower()))
+    iban = entry.meta.get("iban")
+    if iban:
+        result.add("iban:" + normalize_iban(iban))
+    return result
+
+
+def entry_digest(entry: data.Transaction) -> str:
+    """A digest that identifies the transaction in the ledger."""
+    fingerprint = entry.meta.get("fingerprint")
+    if fingerprint is not None:
+        return fingerprint
+    key = "\x1f".join(
+        [str(entry.date), entry.payee or "", entry.narration or ""]
+        + [f"{posting.account} {posting.units}" for posting in entry.postings]
+    )
+    return hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+
+
+class Predictor:
+    """Token counts per account, stored in a JSON file if a path is given."""
+
+    #! - min_confidence: Transactions are only categorized when the confidence is at
+    #!   least this.
+    #! - roots: The account types that are learned and predicted.
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        min_confidence: float = 0.5,
+        roots: Sequence[str] = ROOTS,
+    ) -> None:
+        self.path = path
+        self.min_confidence = min_confidence
+        self.roots = tuple(roots)
+        # Accounts are stored once, the counts refer to them by index.
+        self.accounts: List[str] = []
+        self.account_index: Dict[str, int] = {}
+        self.counts: Dict[str, Dict[int, int]] = {}
+        self.seen: Set[str] = set()
+        # The existing entries the model was last trained on, and their number.
+        self.trained: Tuple[Optional[List[Any]], int] = (None, 0)
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def load(self, path: str) -> None:
+        with open(path) as fd:
+            state = json.load(fd)
+        if state.get("version") != VERSION:
+            return
+        self.accounts = state["accounts"]
+        self.account_index = {account: i for i, account in enumerate(self.accounts)}
+        self.counts = {
+            token: {int(i): n for i, n in counts.items()}
+            for token, counts in state["tokens"].items()
+        }
+        self.seen = set(state["seen"])
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as fd:
+            json.dump(
+                {
+                    "version": VERSION,
+                    "accounts": self.accounts,
+                    "tokens": self.counts,
+                    "seen": sorted(self.seen),
+                },
+                fd,
+                separators=(",", ":"),
+            )
+        os.replace(temporary, self.path)
+
+    def labels(self, entry: data.Transaction) -> List[str]:
+        """The accounts of the transaction that the model learns."""
+        return [
+            posting.account
+            for posting in entry.postings
+            if posting.account.startswith(self.roots) and posting.account != UNKNOWN_ACCOUNT
+        ]
+
+    def learn(self, entry: data.Transaction) -> None:
+        accounts = self.labels(entry)
+        if not accounts:
+            return
+        indexes = []
+        for account in accounts:
+            index = self.account_index.get(account)
+            if index is None:
+                index = self.account_index[account] = len(self.accounts)
+                self.accounts.append(account)
+            indexes.append(index)
+        for token in tokens(entry):
+            counts = self.counts.setdefault(token, {})
+            for index in indexes:
+                counts[index] = counts.get(index, 0) + 1
+
+    def train(self, existing: List[Any]) -> int:
+        """Learn from the transactions that were not learned before.
+
+        Returns the number of learned transactions.
+        """
+        if self.trained[0] is existing and self.trained[1] == len(existing):
+            return 0
+        learned = 0
+        for entry in existing:
+            if not isinstance(entry, data.Transaction):
+                continue
+            digest = entry_digest(entry)
+            if digest in self.seen:
+                continue
+            self.seen.add(digest)
+            self.learn(entry)
+            learned += 1
+        self.trained = (existing, len(existing))
+        if learned:
+            self.save()
+        return learned
+
+    def predict(self, entry: data.Transaction) -> Optional[Tuple[str, Decimal]]:
+        """The most likely account of the transaction and the confidence."""
+        scores: Dict[int, float] = {}
+        known = 0
+        for token in tokens(entry):
+            counts = self.counts.get(token)
+            if not counts:
+                continue
+            known += 1
+            total = sum(counts.values())
+            for index, count in counts.items():
+                scores[index] = scores.get(index, 0.0) + count / (total + 1)
+        if not scores:
+            return None
+        index = max(scores, key=scores.__getitem__)
+        confidence = Decimal(scores[index] / known).quantize(CONFIDENCE)
+        return self.accounts[index], confidence
+
+    def categorize(self, entries: Iterable[Any]) -> List[Any]:
+        """The entries with a predicted counter-posting for uncategorized transactions."""
+        result = []
+        for entry in entries:
+            if isinstance(entry, data.Transaction) and is_uncategorized(entry):
+                prediction = self.predict(entry)
+                if prediction is not None and prediction[1] >= self.min_confidence:
+                    account, confidence = prediction
+                    entry = assign(entry, account, {"confidence": confidence})
+            result.append(entry)
+        return result
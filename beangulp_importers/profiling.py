@@ -0,0 +1,116 @@
+"""Opt-in profiling of the importers.
+
+When an importer has a profiler, the stages of extract() are timed:
+
+- read: reading and splitting the CSV rows.
+- parse: parsing the column values.
+- finalize: the importer's finalize(), also per transaction type.
+- post: processing after finalize, such as the PayPal merge or the ASN balances.
+- train: training the predictor on the new existing entries.
+
+Without a profiler, the importers call their functions directly:
+
+    from beangulp_importers.profiling import Profiler
+
+    importer.profiler = Profiler("profile.json")
+    importer.extract(filepath, [])
+    print(importer.profiler.reports[filepath])
+"""
+
+import json
+import os
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+
+class Stat:
+    __slots__ = ("seconds", "calls")
+
+    def __init__(self) -> None:
+        self.seconds = 0.0
+        self.calls = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"seconds": self.seconds, "calls": self.calls}
+
+
+class Profiler:
+    """Wall time and call counts per stage and per transaction type.
+
+    The counts are collected until finish() is called at the end of the
+    extraction of a file, which stores them as the report of that file.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        # Where the reports are written as JSON, if anywhere.
+        self.path = path
+        self.stages: Dict[str, Stat] = {}
+        self.types: Dict[str, Stat] = {}
+        self.reports: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, stage: str, seconds: float, calls: int = 1) -> None:
+        stat = self.stages.get(stage)
+        if stat is None:
+            stat = self.stages[stage] = Stat()
+        stat.seconds += seconds
+        stat.calls += calls
+
+    def add_type(self, kind: str, seconds: float) -> None:
+        stat = self.types.get(kind)
+        if stat is None:
+            stat = self.types[kind] = Stat()
+        stat.seconds += seconds
+        stat.calls += 1
+
+    def timed(
+        self, stage: str, function: Callable, key: Optional[Callable] = None
+    ) -> Callable:
+        """Wrap the function to time its calls as the stage.
+
+        With key, the time is also added to the type that key returns for the
+        arguments of the call.
+        """
+        clock = time.perf_counter
+
+        def wrapper(*args):
+            start = clock()
+            result = function(*args)
+            elapsed = clock() - start
+            self.add(stage, elapsed)
+            if key is not None:
+                self.add_type(str(key(*args)), elapsed)
+            return result
+
+        return wrapper
+
+    def iterate(self, stage: str, iterable: Iterable) -> Iterator:
+        """Iterate, timing the production of each item as the stage."""
+        clock = time.perf_counter
+        iterator = iter(iterable)
+        while True:
+            start = clock()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(stage, clock() - start, 0)
+                return
+            self.add(stage, clock() - start)
+            yield item
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "stages": {name: stat.as_dict() for name, stat in self.stages.items()},
+            "types": {name: stat.as_dict() for name, stat in sorted(self.types.items())},
+        }
+
+    def finish(self, filepath: str) -> Dict[str, Any]:
+        """Store the counts as the report of the file and start over."""
+        report = self.reports[filepath] = self.as_dict()
+        self.stages = {}
+        self.types = {}
+        if self.path is not None:
+            temporary = self.path + ".tmp"
+            with open(temporary, "w") as fd:
+                json.dump(self.reports, fd, indent=1)
+            os.replace(temporary, self.path)
+        return report
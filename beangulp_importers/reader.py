@@ -0,0 +1,151 @@
+"""Read CSV exports from a memory map.
+
+The file is not decoded as a whole. Rows are found by searching for line
+ends in the mapped bytes and split into fields as bytes, so that only the
+fields an importer parses are decoded. Rows are split without the csv
+module when they have:
+
+- no quotes, such as ASN statements and Coinbase reports,
+- every field quoted, such as PayPal and OV-chipkaart exports, or
+- some fields quoted, without quotes inside them, such as Coinbase amounts
+  with a thousands separator.
+
+Other rows, with escaped quotes, quotes inside unquoted fields or line
+breaks in a field, are read with the csv module. The encoding of the file
+has to be ASCII compatible, which all the exports are.
+"""
+
+import codecs
+import csv as pycsv
+import mmap
+import re
+from typing import Iterator, List, Optional, Tuple
+
+from beangulp_importers import identify
+
+BOM = codecs.BOM_UTF8
+NON_BLANK = re.compile(rb"\S")
+
+
+def is_blank(filepath: str) -> bool:
+    """Whether the file is empty or only contains whitespace.
+
+    Usually the first bytes of the file, which identify() has read already,
+    are enough to tell. Otherwise the mapped file is searched, without
+    reading it into memory.
+    """
+    head = identify.prefix(filepath)
+    if NON_BLANK.search(head):
+        return False
+    if len(head) < identify.PREFIX_SIZE:
+        return True
+    with open(filepath, "rb") as fd, mmap.mmap(
+        fd.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mm:
+        return NON_BLANK.search(mm) is None
+
+
+def field_encoding(encoding: str) -> str:
+    """The encoding of the fields. The byte order mark is skipped separately."""
+    name = codecs.lookup(encoding).name
+    return "utf-8" if name == "utf-8-sig" else name
+
+
+class Reader:
+    """The rows of a mapped file, as lists of fields in bytes."""
+
+    def __init__(self, mm, dialect: str, encoding: str) -> None:
+        self.mm = mm
+        self.dialect = dialect
+        self.encoding = field_encoding(encoding)
+        self.delimiter = pycsv.get_dialect(dialect).delimiter.encode()
+        self.quoted = b'"' + self.delimiter + b'"'
+        delimiter = re.escape(self.delimiter)
+        field = rb'(?:"[^"]*"|[^"%s]*)' % delimiter
+        self.simple = re.compile(rb"%s(?:%s%s)*" % (field, delimiter, field))
+        self.fields = re.compile(rb'(?:^|%s)(?:"([^"]*)"|([^"%s]*))' % (delimiter, delimiter))
+        # The first line starts after the byte order mark, if any.
+        self.start = len(BOM) if mm[: len(BOM)] == BOM else 0
+
+    def line(self, position: int) -> Tuple[bytes, int]:
+        """The line at the position without its line end, and the position after it."""
+        end = self.mm.find(b"\n", position)
+        end = len(self.mm) if end < 0 else end + 1
+        return self.mm[position:end].rstrip(b"\r\n"), end
+
+    def split(self, line: bytes) -> Optional[List[bytes]]:
+        """The fields of a line, or None if the csv module has to read it."""
+        if not line:
+            return []
+        if b'"' not in line:
+            return line.split(self.delimiter)
+        if len(line) > 1 and line[:1] == b'"' and line[-1:] == b'"':
+            inner = line[1:-1]
+            fields = inner.split(self.quoted)
+            # Only the quotes around the delimiters, so no quotes in the fields.
+            if inner.count(b'"') == 2 * (len(fields) - 1):
+                return fields
+        if self.simple.fullmatch(line):
+            return [quoted or plain for quoted, plain in self.fields.findall(line)]
+        return None
+
+    def open_quote(self, line: bytes, quoted: bool) -> bool:
+        """Whether a quoted field is open at the end of the line.
+
+        As in the csv module, a quote only opens a field at the start of the
+        field, so quotes inside unquoted fields do not count. With quoted,
+        the line starts inside a quoted field.
+        """
+        start = not quoted
+        index = 0
+        while True:
+            if quoted:
+                end = line.find(b'"', index)
+                if end < 0:
+                    return True
+                if line[end + 1 : end + 2] == b'"':
+                    # An escaped quote.
+                    index = end + 2
+                    continue
+                quoted = start = False
+                index = end + 1
+            elif start and line[index : index + 1] == b'"':
+                quoted = True
+                index += 1
+            else:
+                end = line.find(self.delimiter, index)
+                if end < 0:
+                    return False
+                start = True
+                index = end + len(self.delimiter)
+
+    def rows(
+        self, position: int, comments: Optional[bytes] = None
+    ) -> Iterator[Tuple[int, int, List[bytes]]]:
+        """Yield the start, end and fields of the rows from the position on."""
+        size = len(self.mm)
+        while position < size:
+            start = position
+            line, position = self.line(position)
+            if comments and line.startswith(comments):
+                continue
+            fields = self.split(line)
+            if fields is None:
+                # A quoted field continues on the next line while it is open.
+                quoted = self.open_quote(line, False)
+                while quoted and position < size:
+                    line, position = self.line(position)
+                    quoted = self.open_quote(line, True)
+                lines = self.mm[start:position].splitlines(True)
+                text = [part.decode(self.encoding) for part in lines]
+                values = next(pycsv.reader(text, dialect=self.dialect), [])
+                fields = [value.encode(self.encoding) for value in values]
+            yield start, position, fields
+
+    def skip(self, position: int, lines: int) -> Optional[int]:
+        """The position after skipping lines, or None if the file ends first."""
+        for _ in range(lines):
+            if position >= len(self.mm):
+                return None
+            _, position = self.line(position)
+        return position
@@ -0,0 +1,179 @@
+"""Compact rows.
+
+The CSV rows of a file are decoded into instances of a class with __slots__
+that only has the columns of the importer. The fields are read as bytes and
+only those of the columns are decoded, a batch of rows and one column at a
+time. The raw fields are dropped after the fingerprint of the row is taken.
+
+Amounts are kept as scaled integers, with the number of decimals in the low
+bits, and only become a Decimal when they are read. An int of an amount
+takes about a third of the memory of the Decimal. Values that repeat, such
+as dates and currencies, are parsed once and shared between rows.
+"""
+
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from beangulp.importers import csvbase
+
+# Number of low bits that hold the number of decimals of an amount.
+SCALE_BITS = 5
+SCALE_MASK = (1 << SCALE_BITS) - 1
+# Amounts with more digits stay a Decimal, scaleb() would round them.
+MAX_DIGITS = 28
+# Number of distinct values per column whose parsed value is remembered.
+MEMO_SIZE = 4096
+
+
+def pack(number: Decimal):
+    """The amount as a scaled integer, or the Decimal if it does not fit."""
+    sign, digits, exponent = number.as_tuple()
+    if type(exponent) is not int or not -SCALE_MASK <= exponent <= 0:
+        return number
+    if len(digits) > MAX_DIGITS:
+        return number
+    coefficient = int(number.scaleb(-exponent))
+    if sign and not coefficient:
+        # Negative zero.
+        return number
+    return (coefficient << SCALE_BITS) | -exponent
+
+
+def unpack(value):
+    """The Decimal of a packed amount."""
+    if type(value) is int:
+        return Decimal(value >> SCALE_BITS).scaleb(-(value & SCALE_MASK))
+    return value
+
+
+def column_index(spec, names: Optional[Dict[str, int]]) -> int:
+    """The index of a column given by name or index."""
+    if isinstance(spec, int) or names is None:
+        return spec
+    return names[spec]
+
+
+class Row:
+    """Base class of the row classes, which are made per file."""
+
+    __slots__ = ("fingerprint",)
+
+    def __repr__(self) -> str:
+        fields = ", ".join(
+            f"{name.lstrip('_')}={getattr(self, name.lstrip('_'))!r}"
+            for name in type(self).__slots__
+        )
+        return f"Row({fields})"
+
+
+def row_type(slots: Tuple[str, ...], constants: Dict[str, Any]) -> type:
+    """A row class with the slots, where "_name" is the packed amount of column name."""
+    cls = type("Row", (Row,), {"__slots__": slots, **constants})
+    for slot in slots:
+        if slot.startswith("_"):
+            get = cls.__dict__[slot].__get__
+            setattr(cls, slot[1:], property(lambda row, get=get: unpack(get(row))))
+    return cls
+
+
+class Fields:
+    """The fields of a row, decoded when they are read."""
+
+    __slots__ = ("values", "encoding")
+
+    def __init__(self, values: Sequence[bytes], encoding: str) -> None:
+        self.values = values
+        self.encoding = encoding
+
+    def __getitem__(self, index: int) -> str:
+        return self.values[index].decode(self.encoding)
+
+
+class Decoder:
+    """Decode lists of fields into rows with the columns of an importer.
+
+    Columns with a default that are missing from the file become a class
+    attribute. Columns with a parse_many() method are parsed a column at a
+    time.
+    """
+
+    def __init__(
+        self,
+        columns: Dict[str, csvbase.Column],
+        names: Optional[Dict[str, int]],
+        fingerprint: Callable[[Sequence[bytes]], str],
+        encoding: str = "utf-8",
+    ) -> None:
+        self.fingerprint = fingerprint
+        self.encoding = encoding
+        constants: Dict[str, Any] = {}
+        slots = []
+        decoders = []
+        for name, column in columns.items():
+            if column.default is not None and not all(
+                isinstance(spec, int) or spec in (names or ()) for spec in column.names
+            ):
+                # Columns with a default may be missing from the file.
+                constants[name] = column.default
+                continue
+            amount = isinstance(column, csvbase.Amount)
+            slots.append("_" + name if amount else name)
+            decoders.append((self.column_decoder(column, names, encoding), amount))
+
+        self.row_type = row_type(tuple(slots), constants)
+        self.fields = [
+            (self.row_type.__dict__[slot].__set__, decode, amount)
+            for slot, (decode, amount) in zip(slots, decoders)
+        ]
+        self.set_fingerprint = Row.__dict__["fingerprint"].__set__
+
+    @staticmethod
+    def column_decoder(
+        column: csvbase.Column, names: Optional[Dict[str, int]], encoding: str
+    ) -> Callable[[List[List[bytes]]], List[Any]]:
+        """A function that decodes the column of a list of rows."""
+        if hasattr(column, "parse_many"):
+            index = column_index(column.names[0], names)
+            return lambda rows: column.parse_many(
+                [values[index].decode(encoding) for values in rows]
+            )
+        if len(column.names) != 1:
+            getter = column.getter(names)
+            return lambda rows: [getter(Fields(values, encoding)) for values in rows]
+        index = column_index(column.names[0], names)
+        parse, default = column.parse, column.default
+        memo: Dict[bytes, Any] = {}
+
+        def parse_field(raw: bytes):
+            # As the csvbase getter does, for a single field.
+            value = raw.decode(encoding)
+            if not value and default:
+                return default
+            return parse(value)
+
+        def decode(rows):
+            result = []
+            for values in rows:
+                raw = values[index]
+                value = memo.get(raw, memo)
+                if value is memo:
+                    if len(memo) >= MEMO_SIZE:
+                        memo.clear()
+                    value = memo[raw] = parse_field(raw)
+                result.append(value)
+            return result
+
+        return decode
+
+    def decode(self, rows: List[List[bytes]]) -> List[Row]:
+        """Decode non-empty lists of fields."""
+        new = self.row_type.__new__
+        row_type = self.row_type
+        result = [new(row_type) for _ in rows]
+        for row, values in zip(result, rows):
+            self.set_fingerprint(row, self.fingerprint(values))
+        for set_value, decode, amount in self.fields:
+            for row, value in zip(result, decode(rows)):
+                if amount and type(value) is Decimal:
+                    value = pack(value)
+                set_value(row, value)
+        return result
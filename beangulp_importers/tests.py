@@ -0,0 +1,875 @@
+import beangulp_importers
+from beangulp_importers import (
+    batch,
+    cache,
+    categorize,
+    dedup,
+    identify,
+    predict,
+    reader,
+    rows,
+    transfers,
+    watch,
+)
+from beangulp_importers.cache import ParseCache
+from beangulp_importers.checkpoint import Checkpoints
+from beangulp_importers.profiling import Profiler
+
+from beancount.core import data
+from beancount.core.number import D
+from beancount.parser import parser
+from beancount.utils.test_utils import docfile
+from beangulp import extract
+from beangulp.importers import csvbase
+import asyncio
+import datetime
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+
+class TestRegistry(unittest.TestCase):
+    def test_lazy_import(self) -> None:
+        # Importing the registry should not import any importer
+        result = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import sys, beangulp_importers; "
+                "print(sorted(m for m in sys.modules if m.startswith('beangulp')))",
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        self.assertEqual(result.stdout.strip(), "['beangulp_importers']")
+
+    def test_lazy_services(self) -> None:
+        # The optional services are only imported when they are configured
+        result = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import sys, beangulp_importers.base; "
+                "print(sorted(m for m in sys.modules "
+                "if m.startswith('beangulp_importers')))",
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        for name in ["cache", "categorize", "checkpoint", "predict", "profiling"]:
+            self.assertNotIn(f"beangulp_importers.{name}'", result.stdout)
+
+    def test_classes(self) -> None:
+        from beangulp_asnbank.importer import Importer
+
+        self.assertIs(beangulp_importers.load("asnbank"), Importer)
+        for name in beangulp_importers.__all__:
+            self.assertTrue(hasattr(getattr(beangulp_importers, name), "extract"))
+        with self.assertRaises(AttributeError):
+            beangulp_importers.UnknownImporter
+
+        asnbank_importer = beangulp_importers.AsnBankImporter({}, daily_balances=True)
+        asnbank_importer.checkpoints = None
+        self.assertIsInstance(asnbank_importer.importer, Importer)
+        self.assertTrue(asnbank_importer.importer.daily_balances)
+        self.assertEqual(asnbank_importer.name, "beangulp_asnbank.importer.Importer")
+        # The importers can be sent to worker processes.
+        paypal_importer = beangulp_importers.PaypalImporter("EUR", "Assets:Paypal", None)
+        paypal_importer = pickle.loads(pickle.dumps(paypal_importer))
+        self.assertEqual(paypal_importer.importer.currency, "EUR")
+
+    def test_lazy_importers(self) -> None:
+        # A lazy importer only imports its module when a file matches its signature
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "statement.csv")
+            with open(filename, "w") as fd:
+                fd.write(TestCheckpoint.header + TestCheckpoint.rows[0])
+            result = subprocess.run(
+                [
+                    sys.executable,
+                    "-c",
+                    "import sys, beangulp_importers as b; "
+                    "importers = [b.AsnBankImporter({}), "
+                    "b.CoinbaseImporter('A', 'B', 'C', 'D', 'E'), "
+                    "b.OvChipkaartImporter('Assets:Ov', None), "
+                    "b.PaypalImporter('EUR', 'Assets:Paypal', None)]; "
+                    f"print([i.name for i in importers if i.identify({filename!r})]); "
+                    "print(sorted(m for m in sys.modules "
+                    "if m.startswith('beangulp_') and m.endswith('.importer')))",
+                ],
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+        self.assertEqual(
+            result.stdout.split("\n")[:2],
+            [
+                "['beangulp_ovchipkaart.importer.Importer']",
+                "['beangulp_ovchipkaart.importer']",
+            ],
+        )
+
+
+class TestIdentify(unittest.TestCase):
+    @docfile
+    def test_asnbank(self, filename: str) -> None:
+        """\
+14-10-2021,IBAN_CHEQUING,IBAN_PAYEE,payee,,,,EUR,150.00,EUR,-10.00,14-10-2021,14-10-2021,0000,INC,00000000,,'Narration of transaction',0
+        """
+        self.assertEqual(identify.identify(filename), ["asnbank"])
+        self.assertTrue(beangulp_importers.AsnBankImporter({}).identify(filename))
+
+    @docfile
+    def test_coinbase(self, filename: str) -> None:
+        """\
+"You can use this transaction report to inform your likely tax obligations."
+
+
+
+Transactions
+User,email@address.com,0000000000
+
+Timestamp,Transaction Type,Asset,Quantity Transacted,Spot Price Currency,Spot Price at Transaction,Subtotal,Total (inclusive of fees),Fees,Notes
+        """
+        self.assertEqual(identify.identify(filename), ["coinbase"])
+
+    @docfile
+    def test_ovchipkaart(self, filename: str) -> None:
+        """\
+"Datum";"Check-in";"Vertrek";"Check-uit";"Bestemming";"Bedrag";"Transactie";"Klasse";"Product";"Opmerkingen";"Naam";"Kaartnummer"
+        """
+        self.assertEqual(identify.identify(filename), ["ovchipkaart"])
+
+    @docfile
+    def test_paypal(self, filename: str) -> None:
+        """\
+\ufeff"Date","Time","TimeZone","Name","Type","Status","Currency","Gross","Fee","Net","From Email Address","To Email Address","Transaction ID","Reference Txn ID","Receipt ID","Balance","Subject"
+        """
+        self.assertEqual(identify.identify(filename), ["paypal"])
+        importer = beangulp_importers.PaypalImporter("EUR", "Assets:Paypal", None)
+        self.assertTrue(importer.identify(filename))
+
+    @docfile
+    def test_paypal_language(self, filename: str) -> None:
+        """\
+"Datum","Tijd","Tijdzone","Naam","Type","Status","Valuta","Bruto","Kosten","Net","Van e-mailadres","Naar e-mailadres","Transactiereferentie","Referentietransactiecode","Kwitantiecode","Saldo","Onderwerp"
+        """
+        from beangulp_paypal import importer
+
+        dutch = dict(
+            importer.english,
+            date="Datum",
+            time="Tijd",
+            timezone="Tijdzone",
+            name="Naam",
+            currency="Valuta",
+            balance="Saldo",
+            subject="Onderwerp",
+            transaction_id="Transactiereferentie",
+            reference_transaction_id="Referentietransactiecode",
+        )
+        self.assertEqual(identify.identify(filename), ["paypal"])
+        paypal_importer = importer.Importer("EUR", "Assets:Paypal", None, dutch)
+        self.assertTrue(paypal_importer.identify(filename))
+        paypal_importer = importer.Importer("EUR", "Assets:Paypal", None)
+        self.assertFalse(paypal_importer.identify(filename))
+
+    @docfile
+    def test_prefix_read_once(self, filename: str) -> None:
+        """\
+Some other file
+        """
+        with mock.patch("builtins.open", wraps=open) as opened:
+            for name in beangulp_importers.IMPORTERS:
+                self.assertFalse(identify.matches(name, filename))
+        self.assertEqual(opened.call_count, 1)
+
+
+class TestBatch(unittest.TestCase):
+    def test_extract_files(self) -> None:
+        files = {
+            "b.csv": "14-10-2021,IBAN_CHEQUING,IBAN_PAYEE,payee,,,,EUR,150.00,EUR,-10.00,14-10-2021,14-10-2021,0000,INC,00000000,,'Narration',0\n",
+            "a.csv": '"Datum";"Check-in";"Vertrek";"Check-uit";"Bestemming";"Bedrag";"Transactie";"Klasse";"Product";"Opmerkingen";"Naam";"Kaartnummer"\n'
+            '"29-03-2021";"";"Eindhoven Centraal";"11:49";"Nijmegen";"8,88";"Check-uit";"";"Product";"";"Name";"1234"\n',
+            "c.txt": "Not a statement\n",
+        }
+        importers = [
+            beangulp_importers.AsnBankImporter({"IBAN_CHEQUING": "Assets:Chequing"}),
+            beangulp_importers.OvChipkaartImporter("Assets:OvChipkaart", None),
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            filepaths = []
+            for name, contents in files.items():
+                filepaths.append(os.path.join(directory, name))
+                with open(filepaths[-1], "w") as fd:
+                    fd.write(contents)
+
+            for workers in (0, 2):
+                results = batch.extract_files(importers, filepaths, workers=workers)
+                self.assertEqual([r.filepath for r in results], filepaths)
+                self.assertEqual(
+                    [r.account for r in results],
+                    ["Assets:Chequing", "Assets:OvChipkaart", None],
+                )
+                self.assertIs(results[0].importer, importers[0])
+                self.assertEqual([len(r.entries) for r in results], [2, 1, 0])
+
+    def test_error(self) -> None:
+        files = {
+            "a.csv": "14-10-2021,IBAN_CHEQUING,IBAN_PAYEE,payee,,,,EUR,150.00,EUR,-10.00,14-10-2021,14-10-2021,0000,INC,00000000,,'Narration',0\n",
+            "b.csv": "14-13-2021,IBAN_CHEQUING,IBAN_PAYEE,payee,,,,EUR,150.00,EUR,-10.00,14-13-2021,14-13-2021,0000,INC,00000000,,'Narration',0\n",
+            "c.csv": "15-10-2021,IBAN_CHEQUING,IBAN_PAYEE,payee,,,,EUR,140.00,EUR,-10.00,15-10-2021,15-10-2021,0000,INC,00000000,,'Narration',0\n",
+        }
+        importers = [
+            beangulp_importers.AsnBankImporter({"IBAN_CHEQUING": "Assets:Chequing"})
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            filepaths = []
+            for name, contents in files.items():
+                filepaths.append(os.path.join(directory, name))
+                with open(filepaths[-1], "w") as fd:
+                    fd.write(contents)
+
+            for workers in (0, 2):
+                # The file with an invalid date does not fail the other files.
+                results = batch.extract_files(importers, filepaths, workers=workers)
+                self.assertEqual([r.filepath for r in results], filepaths)
+                self.assertEqual([len(r.entries) for r in results], [2, 0, 2])
+                self.assertIsNone(results[0].error)
+                self.assertIsInstance(results[1].error, ValueError)
+                self.assertIsNone(results[2].error)
+
+
+class TestCheckpoint(unittest.TestCase):
+    header = '"Datum";"Check-in";"Vertrek";"Check-uit";"Bestemming";"Bedrag";"Transactie";"Klasse";"Product";"Opmerkingen";"Naam";"Kaartnummer"\n'
+    rows = [
+        '"29-03-2021";"";"Eindhoven";"11:49";"Nijmegen";"8,88";"Check-uit";"";"Product";"";"Name";"1234"\n',
+        '"30-03-2021";"";"Nijmegen";"08:12";"Utrecht";"9,99";"Check-uit";"";"Product";"";"Name";"1234"\n',
+    ]
+
+    def test_resume(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "ov.csv")
+            store = os.path.join(directory, "checkpoints.json")
+            ov_importer = beangulp_importers.OvChipkaartImporter("Assets:Ov", None)
+            ov_importer.checkpoints = Checkpoints(store)
+
+            with open(filename, "w") as fd:
+                fd.write(self.header + self.rows[0])
+            self.assertEqual(len(ov_importer.extract(filename, [])), 1)
+
+            with open(filename, "a") as fd:
+                fd.write(self.rows[1])
+            # The checkpoints survive a new run.
+            ov_importer.checkpoints = Checkpoints(store)
+            entries = ov_importer.extract(filename, [])
+            self.assertEqual([e.narration for e in entries], ["Nijmegen - Utrecht - Product"])
+            self.assertEqual(entries[0].meta["lineno"], 3)
+            self.assertEqual(ov_importer.extract(filename, []), [])
+
+    def test_identical_row(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "ov.csv")
+            ov_importer = beangulp_importers.OvChipkaartImporter("Assets:Ov", None)
+            ov_importer.checkpoints = Checkpoints(
+                os.path.join(directory, "checkpoints.json")
+            )
+
+            with open(filename, "w") as fd:
+                fd.write(self.header + self.rows[0])
+            first = ov_importer.extract(filename, [])
+
+            # An appended row that is identical to an extracted row has the
+            # fingerprint it has when the whole file is extracted.
+            with open(filename, "a") as fd:
+                fd.write(self.rows[0])
+            entries = ov_importer.extract(filename, [])
+            ov_importer.checkpoints = None
+            expected = [e.meta["fingerprint"] for e in ov_importer.extract(filename, [])]
+            self.assertEqual([e.meta["fingerprint"] for e in entries], expected[1:])
+            self.assertNotEqual(entries[0].meta["fingerprint"], first[0].meta["fingerprint"])
+
+    def test_changed_file(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "ov.csv")
+            ov_importer = beangulp_importers.OvChipkaartImporter("Assets:Ov", None)
+            ov_importer.checkpoints = Checkpoints(
+                os.path.join(directory, "checkpoints.json")
+            )
+
+            with open(filename, "w") as fd:
+                fd.write(self.header + self.rows[0])
+            ov_importer.extract(filename, [])
+
+            # Not an extension of the previous file, so everything is extracted.
+            with open(filename, "w") as fd:
+                fd.write(self.header + self.rows[1] + self.rows[0])
+            self.assertEqual(len(ov_importer.extract(filename, [])), 2)
+
+
+    def test_workers(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            store = os.path.join(directory, "checkpoints.json")
+            ov_importer = beangulp_importers.OvChipkaartImporter("Assets:Ov", None)
+            ov_importer.checkpoints = Checkpoints(store)
+            filepaths = []
+            for index in range(8):
+                filepaths.append(os.path.join(directory, f"ov{index}.csv"))
+                with open(filepaths[-1], "w") as fd:
+                    fd.write(self.header + self.rows[index % 2])
+            batch.extract_files([ov_importer], filepaths, workers=4)
+
+            # The checkpoints of all workers are kept.
+            checkpoints = Checkpoints(store)
+            self.assertEqual(
+                sorted(checkpoints.checkpoints), sorted(map(os.path.abspath, filepaths))
+            )
+            ov_importer.checkpoints = checkpoints
+            results = batch.extract_files([ov_importer], filepaths, workers=4)
+            self.assertEqual([r.entries for r in results], [[]] * 8)
+
+
+class TestDeduplicate(unittest.TestCase):
+    @docfile
+    def test_mark_duplicates(self, filename: str) -> None:
+        """\
+"Datum";"Check-in";"Vertrek";"Check-uit";"Bestemming";"Bedrag";"Transactie";"Klasse";"Product";"Opmerkingen";"Naam";"Kaartnummer"
+"29-03-2021";"";"Eindhoven";"11:49";"Nijmegen";"8,88";"Check-uit";"";"Product";"";"Name";"1234"
+"30-03-2021";"";"Nijmegen";"08:12";"Utrecht";"9,99";"Check-uit";"";"Product";"";"Name";"1234"
+        """
+        existing, _, _ = parser.parse_string(
+            """
+            2021-03-29 * "Eindhoven - Nijmegen - Product"
+              Assets:Ov        -8.88 EUR
+              Expenses:Travel   8.88 EUR
+            """
+        )
+        ov_importer = beangulp_importers.OvChipkaartImporter("Assets:Ov", None)
+        entries = ov_importer.extract(filename, existing)
+        ov_importer.deduplicate(entries, existing)
+        self.assertIs(entries[0].meta[extract.DUPLICATE], existing[0])
+        self.assertNotIn(extract.DUPLICATE, entries[1].meta)
+
+        # The index is reused for the next file, with the entries that beangulp
+        # appended to the existing entries
+        index = dedup.index(existing, ov_importer.duplicate_keys)
+        existing.extend(entries)
+        with mock.patch.object(
+            dedup, "DuplicateIndex", wraps=dedup.DuplicateIndex
+        ) as constructor:
+            entries = ov_importer.extract(filename, existing)
+            ov_importer.deduplicate(entries, existing)
+        constructor.assert_not_called()
+        self.assertIs(dedup.index(existing, ov_importer.duplicate_keys), index)
+        self.assertIs(entries[1].meta[extract.DUPLICATE], existing[2])
+
+    @docfile
+    def test_fingerprint(self, filename: str) -> None:
+        """\
+"Datum";"Check-in";"Vertrek";"Check-uit";"Bestemming";"Bedrag";"Transactie";"Klasse";"Product";"Opmerkingen";"Naam";"Kaartnummer"
+"29-03-2021";"";"Eindhoven";"11:49";"Nijmegen";"8,88";"Check-uit";"";"Product";"";"Name";"1234"
+"29-03-2021";"";"Eindhoven";"11:49";"Nijmegen";"8,88";"Check-uit";"";"Product";"";"Name";"1234"
+        """
+        ov_importer = beangulp_importers.OvChipkaartImporter("Assets:Ov", None)
+        first = [e.meta["fingerprint"] for e in ov_importer.extract(filename, [])]
+        second = [e.meta["fingerprint"] for e in ov_importer.extract(filename, [])]
+        # Deterministic, and identical rows are told apart
+        self.assertEqual(first, second)
+        self.assertNotEqual(first[0], first[1])
+
+        # An entry with the same fingerprint is a duplicate, whatever its other fields
+        existing, _, _ = parser.parse_string(
+            f"""
+            2021-03-29 * "Edited narration"
+              fingerprint: "{first[1]}"
+              Assets:Ov        -8.88 EUR
+            """
+        )
+        entries = ov_importer.extract(filename, existing)
+        ov_importer.deduplicate(entries, existing)
+        self.assertNotIn(extract.DUPLICATE, entries[0].meta)
+        self.assertIs(entries[1].meta[extract.DUPLICATE], existing[0])
+
+
+class TestProfiler(unittest.TestCase):
+    @docfile
+    def test_paypal(self, filename: str) -> None:
+        """\
+"Date","Time","TimeZone","Name","Type","Status","Currency","Gross","Fee","Net","From Email Address","To Email Address","Transaction ID","Reference Txn ID","Receipt ID","Balance","Subject"
+"19/08/2020","03:00:00","PDT","Payee","Express Checkout Payment","Completed","EUR","-66,00","0,00","-66,00","email@address.com","anotheremail@address.com","transactionid23423","","","-66,00","Description"
+"19/08/2020","03:00:00","PDT","","Bank Deposit to PP Account ","Pending","EUR","66,00","0,00","66,00","","email@address.com","6324872369","transactionid23423","","0,00","Another description"
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "profile.json")
+            paypal_importer = beangulp_importers.PaypalImporter(
+                "EUR", "Assets:Paypal", "Liabilities:DirectDebit"
+            )
+            paypal_importer.profiler = Profiler(path)
+            paypal_importer.extract(filename, [])
+            with open(path) as fd:
+                report = json.load(fd)[filename]
+
+        self.assertEqual(report, paypal_importer.profiler.reports[filename])
+        self.assertEqual(
+            sorted(report["stages"]), ["finalize", "parse", "post", "read"]
+        )
+        self.assertEqual(report["stages"]["finalize"]["calls"], 2)
+        # The header row is read as well.
+        self.assertEqual(report["stages"]["read"]["calls"], 3)
+        self.assertEqual(
+            {name: stat["calls"] for name, stat in report["types"].items()},
+            {"Bank Deposit to PP Account": 1, "Express Checkout Payment": 1},
+        )
+
+    def test_disabled(self) -> None:
+        # Without a profiler, the functions are not wrapped.
+        ov_importer = beangulp_importers.OvChipkaartImporter("Assets:Ov", None)
+        finalize = ov_importer.timed("finalize", ov_importer.finalize)
+        self.assertEqual(finalize, ov_importer.finalize)
+
+
+class TestRows(unittest.TestCase):
+    def test_pack(self) -> None:
+        for value in ["1.000000", "-0.50", "0.00", "123", "-0", "1E+3", "1.23456789"]:
+            number = D(value)
+            packed = rows.pack(number)
+            self.assertEqual(str(rows.unpack(packed)), str(number))
+        self.assertIsInstance(rows.pack(D("-12.34")), int)
+
+    def test_decoder(self) -> None:
+        columns = {
+            "date": csvbase.Date("Date", "%d-%m-%Y"),
+            "amount": csvbase.Amount("Amount"),
+            "optional": csvbase.Column("Missing", default="-"),
+        }
+        decoder = rows.Decoder(columns, {"Date": 0, "Amount": 1}, lambda values: "fp")
+        first, second = decoder.decode([[b"01-02-2021", b"1.50"], [b"01-02-2021", b"-2"]])
+        self.assertEqual((first.date, first.amount), (datetime.date(2021, 2, 1), D("1.50")))
+        self.assertEqual((second.amount, second.optional), (D("-2"), "-"))
+        # Repeated values are shared.
+        self.assertIs(first.date, second.date)
+        with self.assertRaises(AttributeError):
+            first.other = 1
+
+
+class TestReader(unittest.TestCase):
+    def test_rows(self) -> None:
+        content = (
+            b'\xef\xbb\xbfa,b,c\r\n'
+            b'"1","two","3"\r\n'
+            b'\r\n'
+            b'1,2,\n'
+            b'x,"1,234.50",\n'
+            b'Pizza 12" large,b,c\n'
+            b'"1,5","say ""hi""",3\n'
+            b'"multi\nline",x,"y"\n'
+            b'"last","",""'
+        )
+        rows = list(reader.Reader(content, "excel", "utf-8-sig").rows(3))
+        self.assertEqual(
+            [fields for _, _, fields in rows],
+            [
+                [b"a", b"b", b"c"],
+                [b"1", b"two", b"3"],
+                [],
+                [b"1", b"2", b""],
+                [b"x", b"1,234.50", b""],
+                [b'Pizza 12" large', b"b", b"c"],
+                [b"1,5", b'say "hi"', b"3"],
+                [b"multi\nline", b"x", b"y"],
+                [b"last", b"", b""],
+            ],
+        )
+        # The rows cover the file after the byte order mark.
+        self.assertEqual(rows[0][0], 3)
+        self.assertEqual([end for _, end, _ in rows[:-1]], [start for start, _, _ in rows[1:]])
+        self.assertEqual(rows[-1][1], len(content))
+
+    def test_is_blank(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            for content, blank in [
+                (b"", True),
+                (b" \r\n\t\n", True),
+                (b" " * 10000, True),
+                (b" " * 10000 + b"x", False),
+                (b"\n\nx", False),
+            ]:
+                filepath = os.path.join(tmp, f"{len(content)}-{blank}.csv")
+                with open(filepath, "wb") as fd:
+                    fd.write(content)
+                self.assertEqual(reader.is_blank(filepath), blank, content[-10:])
+
+
+class TestTransfers(unittest.TestCase):
+    def parse(self, filename: str, text: str):
+        entries, _, _ = parser.parse_string(text, dedent=True)
+        return [entry._replace(meta={**entry.meta, "filename": filename}) for entry in entries]
+
+    def test_merge_transfers(self) -> None:
+        paypal = self.parse(
+            "paypal.csv",
+            """
+            2021-03-01 * "Shop" "Payment"
+              Expenses:Shop           10.00 EUR
+              Assets:Bank            -10.00 EUR
+            2021-03-20 * "Other shop" "Payment"
+              Expenses:Shop            5.00 EUR
+              Assets:Bank             -5.00 EUR
+            """,
+        )
+        asn = self.parse(
+            "asn.csv",
+            """
+            2021-02-20 * "PayPal" "Too early"
+              fingerprint: "old"
+              Assets:Bank            -10.00 EUR
+            2021-03-03 * "PayPal" "Direct debit"
+              fingerprint: "leg"
+              Assets:Bank            -10.00 EUR
+            2021-03-20 * "PayPal" "Different amount"
+              Assets:Bank             -6.00 EUR
+            """,
+        )
+        entries = transfers.merge_transfers(paypal + asn)
+        self.assertEqual(
+            [entry.narration for entry in entries],
+            ["Payment", "Payment", "Too early", "Different amount"],
+        )
+        posting = entries[0].postings[1]
+        self.assertEqual(posting.meta["fingerprint"], "leg")
+
+        # The merged leg is a duplicate when it is extracted again.
+        index = dedup.DuplicateIndex(entries, lambda entry: ())
+        self.assertIs(index.find(asn[1]), entries[0])
+
+    def test_hook(self) -> None:
+        ov = self.parse(
+            "ov.csv",
+            """
+            2021-03-01 * "Saldo automatisch opgeladen"
+              Assets:Ov                20.00 EUR
+              Liabilities:OvIncasso   -20.00 EUR
+            """,
+        )
+        bank = self.parse(
+            "asn.csv",
+            """
+            2021-03-02 * "Incasso"
+              Liabilities:OvIncasso   -20.00 EUR
+              Assets:Bank              20.00 EUR
+            """,
+        )
+        extracted = [("ov.csv", ov, "Assets:Ov", None), ("asn.csv", bank, "Assets:Bank", None)]
+        result = transfers.hook(extracted, [])
+        # The bank leg has a posting the top-up does not have, so it is kept.
+        self.assertEqual(result, extracted)
+
+        bank[0] = bank[0]._replace(postings=bank[0].postings[:1])
+        result = transfers.hook(extracted, [])
+        self.assertEqual([len(entries) for _, entries, *_ in result], [1, 0])
+        self.assertEqual(result[0][2:], ("Assets:Ov", None))
+
+
+class TestCategorize(unittest.TestCase):
+    RULES = [
+        {"iban": "NL00 RENT 0000 0000 01", "account": "Expenses:Rent"},
+        {"payee": "ns", "max_amount": "-50", "account": "Expenses:Travel:Subscription"},
+        {"payee": "NS", "account": "Expenses:Travel"},
+        {"narration": "park(eren|ing)", "account": "Expenses:Car"},
+        {"narration": "ticket", "min_amount": 0, "account": "Income:Refunds"},
+        {"narration": "ticket", "account": "Expenses:Tickets"},
+        {"min_amount": "1000", "account": "Income:Salary"},
+    ]
+
+    @docfile
+    def test_asnbank(self, filename: str) -> None:
+        """\
+01-10-2021,NL00ASNB0000000001,NL00RENT0000000001,Landlord,,,,EUR,5000.00,EUR,-900.00,01-10-2021,01-10-2021,0000,OVB,00000000,,'Rent',0
+02-10-2021,NL00ASNB0000000001,NL00NSNS0000000001,NS,,,,EUR,4100.00,EUR,-80.00,02-10-2021,02-10-2021,0000,OVB,00000000,,'Subscription',0
+03-10-2021,NL00ASNB0000000001,NL00NSNS0000000001,NS,,,,EUR,4020.00,EUR,-5.00,03-10-2021,03-10-2021,0000,OVB,00000000,,'Parking ticket',0
+04-10-2021,NL00ASNB0000000001,,,,,,EUR,4015.00,EUR,-2.50,04-10-2021,04-10-2021,0000,BEA,00000000,,'Parkeren Utrecht',0
+05-10-2021,NL00ASNB0000000001,,,,,,EUR,4012.50,EUR,-20.00,05-10-2021,05-10-2021,0000,BEA,00000000,,'Concert ticket',0
+06-10-2021,NL00ASNB0000000001,,,,,,EUR,3992.50,EUR,20.00,06-10-2021,06-10-2021,0000,BEA,00000000,,'Concert ticket',0
+07-10-2021,NL00ASNB0000000001,NL00WORK0000000001,Employer,,,,EUR,4012.50,EUR,3000.00,07-10-2021,07-10-2021,0000,OVB,00000000,,'Salary',0
+08-10-2021,NL00ASNB0000000001,,,,,,EUR,7012.50,EUR,-1.00,08-10-2021,08-10-2021,0000,BEA,00000000,,'Something else',0
+        """
+        importer = beangulp_importers.AsnBankImporter({"NL00ASNB0000000001": "Assets:Bank"})
+        importer.categorizer = categorize.Rules.from_json(self.RULES)
+        entries = importer.extract(filename, [])
+        self.assertEqual(entries[0].meta["iban"], "NL00RENT0000000001")
+        accounts = [
+            entry.postings[1].account if len(entry.postings) > 1 else None
+            for entry in entries
+            if isinstance(entry, data.Transaction)
+        ]
+        self.assertEqual(
+            accounts,
+            [
+                "Expenses:Rent",
+                "Expenses:Travel:Subscription",
+                # The payee rule comes before the narration rule.
+                "Expenses:Travel",
+                "Expenses:Car",
+                "Expenses:Tickets",
+                "Income:Refunds",
+                "Income:Salary",
+                None,
+            ],
+        )
+
+    def test_unknown_account(self) -> None:
+        entries, _, _ = parser.parse_string(
+            """
+            2021-10-01 * "Shop" "Parking"
+              Expenses:UnknownAccount   2.50 EUR
+              Assets:Paypal            -2.50 EUR
+            """,
+            dedent=True,
+        )
+        rules = categorize.Rules.from_json(self.RULES)
+        (entry,) = rules.categorize(entries)
+        self.assertEqual([p.account for p in entry.postings], ["Expenses:Car", "Assets:Paypal"])
+
+    def test_no_conditions(self) -> None:
+        with self.assertRaises(ValueError):
+            categorize.Rules.from_json([{"account": "Expenses:All"}])
+
+
+class TestPredict(unittest.TestCase):
+    EXISTING = """
+        2021-09-01 * "Albert Heijn" "Boodschappen"
+          fingerprint: "a"
+          Assets:Bank            -30.00 EUR
+          Expenses:Groceries      30.00 EUR
+        2021-09-08 * "Albert Heijn" "Boodschappen"
+          Assets:Bank            -25.00 EUR
+          Expenses:Groceries      25.00 EUR
+        2021-09-10 * "NS" "Reizen"
+          Assets:Bank            -10.00 EUR
+          Expenses:Travel         10.00 EUR
+    """
+
+    @docfile
+    def test_asnbank(self, filename: str) -> None:
+        """\
+01-10-2021,NL00ASNB0000000001,,Albert Heijn,,,,EUR,5000.00,EUR,-12.00,01-10-2021,01-10-2021,0000,BEA,00000000,,'Boodschappen',0
+02-10-2021,NL00ASNB0000000001,,Unknown,,,,EUR,4988.00,EUR,-5.00,02-10-2021,02-10-2021,0000,BEA,00000000,,'Something',0
+        """
+        existing, _, _ = parser.parse_string(self.EXISTING, dedent=True)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "predictor.json")
+            importer = beangulp_importers.AsnBankImporter({"NL00ASNB0000000001": "Assets:Bank"})
+            importer.predictor = predict.Predictor(path)
+            entries = importer.extract(filename, existing)
+            posting = entries[0].postings[1]
+            self.assertEqual(posting.account, "Expenses:Groceries")
+            self.assertEqual(posting.meta["confidence"], D("0.67"))
+            self.assertEqual(len(entries[2].postings), 1)
+
+            # The model is stored and only learns the new transactions.
+            predictor = predict.Predictor(path)
+            self.assertEqual(predictor.predict(entries[0])[0], "Expenses:Groceries")
+            self.assertEqual(predictor.train(existing), 0)
+            more, _, _ = parser.parse_string(
+                """
+                2021-09-12 * "NS" "Reizen"
+                  Assets:Bank            -10.00 EUR
+                  Expenses:Travel         10.00 EUR
+                """,
+                dedent=True,
+            )
+            self.assertEqual(predictor.train(existing + more), 1)
+            self.assertEqual(predictor.counts["payee:albert"], {0: 2})
+
+
+class TestParseCache(unittest.TestCase):
+    header = TestCheckpoint.header
+    rows = TestCheckpoint.rows
+
+    def test_extract(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "ov.csv")
+            with open(filename, "w") as fd:
+                fd.write(self.header + "".join(self.rows))
+            ov_importer = beangulp_importers.OvChipkaartImporter("Assets:Ov", None)
+            ov_importer.parse_cache = ParseCache(os.path.join(directory, "cache"))
+            expected = ov_importer.extract(filename, [])
+
+            with mock.patch.object(ov_importer, "parse_rows") as parse_rows:
+                entries = ov_importer.extract(filename, [])
+            parse_rows.assert_not_called()
+            self.assertEqual(entries, expected)
+            self.assertEqual(entries[1].postings[0].units.number, D("-9.99"))
+
+            # Other settings are another entry.
+            ov_importer.columns = dict(ov_importer.columns, extra=csvbase.Column("Naam"))
+            with mock.patch.object(ov_importer, "parse_rows", return_value=iter([])) as parse_rows:
+                ov_importer.extract(filename, [])
+            parse_rows.assert_called_once()
+
+    def test_evict(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            filenames = []
+            for index, row in enumerate(self.rows):
+                filename = os.path.join(directory, f"ov{index}.csv")
+                with open(filename, "w") as fd:
+                    fd.write(self.header + row)
+                filenames.append(filename)
+            ov_importer = beangulp_importers.load("ovchipkaart")("Assets:Ov", None)
+            cache = ov_importer.parse_cache = ParseCache(os.path.join(directory, "cache"))
+            first, second = [cache.key(ov_importer, filename) for filename in filenames]
+            ov_importer.extract(filenames[0], [])
+            ov_importer.extract(filenames[1], [])
+            os.utime(cache.path(first), (0, 0))
+
+            # The least recently used entry is removed.
+            cache.max_size = os.path.getsize(cache.path(second))
+            cache.evict()
+            self.assertFalse(os.path.exists(cache.path(first)))
+            self.assertTrue(os.path.exists(cache.path(second)))
+
+    def test_unreadable_entry(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            parse_cache = ParseCache(directory)
+            # Entries of a removed module, a damaged entry and an empty entry.
+            for key, content in [
+                ("module", b"cremoved_module\nRow\n."),
+                ("damaged", b"\x80\x05garbage"),
+                ("empty", b""),
+            ]:
+                with open(parse_cache.path(key), "wb") as fd:
+                    fd.write(content)
+                self.assertIsNone(parse_cache.get(key))
+
+    def test_file_digest(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "ov.csv")
+            with open(filename, "w") as fd:
+                fd.write(self.header + "".join(self.rows))
+            with mock.patch.object(cache, "CHUNK_SIZE", 16):
+                chunked = cache.file_digest(filename)
+            self.assertEqual(chunked, cache.file_digest(filename))
+
+
+class TestWatch(unittest.TestCase):
+    header = TestCheckpoint.header
+    rows = TestCheckpoint.rows
+
+    def test_watch(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            downloads = os.path.join(directory, "downloads")
+            os.mkdir(downloads)
+            with open(os.path.join(downloads, "old.csv"), "w") as fd:
+                fd.write(self.header + self.rows[0])
+            output = os.path.join(directory, "staging.beancount")
+            ov_importer = beangulp_importers.OvChipkaartImporter("Assets:Ov", None)
+            watcher = watch.Watcher(
+                [ov_importer], downloads, output, workers=0, interval=0.01, debounce=0.05
+            )
+
+            async def run() -> None:
+                stop = asyncio.Event()
+                task = asyncio.create_task(watcher.run(stop))
+                # A partial download is left alone.
+                partial = os.path.join(downloads, "new.csv.part")
+                with open(partial, "w") as fd:
+                    fd.write(self.header + self.rows[0])
+                await asyncio.sleep(0.1)
+                self.assertFalse(os.path.exists(output))
+                os.rename(partial, os.path.join(downloads, "new.csv"))
+                await wait_for(output)
+                # The export is downloaded again with a new row.
+                with open(os.path.join(downloads, "new.csv"), "w") as fd:
+                    fd.write(self.header + "".join(self.rows))
+                await wait_for(output, "Utrecht")
+                stop.set()
+                await task
+
+            async def wait_for(filepath: str, text: str = "") -> None:
+                for _ in range(200):
+                    if os.path.exists(filepath):
+                        with open(filepath) as fd:
+                            if text in fd.read():
+                                return
+                    await asyncio.sleep(0.01)
+
+            asyncio.run(run())
+            with open(output) as fd:
+                text = fd.read()
+            # The file that was there at the start is not extracted.
+            self.assertNotIn("old.csv", text)
+            self.assertEqual(text.count("Eindhoven - Nijmegen"), 1)
+            self.assertEqual(text.count("Nijmegen - Utrecht"), 1)
+
+    def test_write_again(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "staging.beancount")
+            ov_importer = beangulp_importers.OvChipkaartImporter("Assets:Ov", None)
+            watcher = watch.Watcher([ov_importer], directory, output, workers=0)
+            entries = parser.parse_many(
+                """
+                2023-01-01 * "Trip"
+                  Assets:Ov  -2.00 EUR
+
+                2023-01-02 balance Assets:Ov  10.00 EUR
+                """
+            )
+            result = batch.ExtractedFile("ov.csv", entries, None, ov_importer, 0, 0)
+            with mock.patch.object(
+                dedup, "DuplicateIndex", wraps=dedup.DuplicateIndex
+            ) as duplicate_index:
+                watcher.write(result)
+                watcher.write(result)
+            # The index is built once, the written entries are added to it.
+            duplicate_index.assert_called_once()
+            with open(output) as fd:
+                text = fd.read()
+            self.assertEqual(text.count("Trip"), 1)
+            self.assertEqual(text.count("balance"), 1)
+
+    def test_retry(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "new.csv")
+            with open(filename, "w") as fd:
+                fd.write(self.header + self.rows[0])
+            output = os.path.join(directory, "staging.beancount")
+            ov_importer = beangulp_importers.OvChipkaartImporter("Assets:Ov", None)
+            watcher = watch.Watcher(
+                [ov_importer],
+                directory,
+                output,
+                workers=0,
+                debounce=0,
+                process_existing=True,
+            )
+
+            async def run() -> None:
+                loop = asyncio.get_running_loop()
+                with watcher.executor() as executor:
+                    self.assertEqual(watcher.ready(loop.time()), [])
+                    self.assertEqual(watcher.ready(loop.time()), [filename])
+                    error = OSError("busy")
+                    with mock.patch.object(batch, "_process", side_effect=error):
+                        await watcher.process(executor, filename)
+                    # The file is tried again after the retry time.
+                    later = loop.time() + watcher.retry
+                    self.assertEqual(watcher.ready(loop.time()), [])
+                    self.assertEqual(watcher.ready(later), [filename])
+                    await watcher.process(executor, filename)
+                    self.assertEqual(watcher.ready(later), [])
+
+            with mock.patch("builtins.print"):
+                asyncio.run(run())
+            with open(output) as fd:
+                self.assertIn("Eindhoven - Nijmegen", fd.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,160 @@
+"""Match the legs of transfers between the exports of different importers.
+
+A transfer between two accounts shows up in the exports of both. PayPal
+books a bank transfer as a posting to its bank_account and the ASN
+statement has the same amount on that account as its first posting; the
+same goes for the OV-chipkaart top-ups. Both legs are one transaction:
+
+- the leg that has the transfer as a later posting is kept, and
+- the leg that has it as its first posting is dropped, if it has no
+  postings that the kept leg does not have.
+
+The metadata of the dropped leg, such as its fingerprint, is put on the
+posting of the kept leg, so that deduplication finds the dropped leg when
+it is extracted again. The legs are put in buckets by account and amount,
+sorted by date, so that each posting is matched with a binary search.
+
+Run it over the entries of all files, for example as a beangulp hook:
+
+    from beangulp_importers import transfers
+
+    main = beangulp.Ingest(importers, hooks=[transfers.hook])
+"""
+
+import datetime
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
+from beancount.core import data
+from beangulp import extract
+
+# The maximum number of days between the legs of a transfer.
+WINDOW = datetime.timedelta(days=4)
+
+# Metadata of the dropped leg that is not copied to the kept leg.
+SKIP_META = {"filename", "lineno", extract.DUPLICATE}
+
+
+def posting_key(posting: data.Posting) -> Hashable:
+    # Amount hashes in Python, a tuple of its fields does not.
+    units = posting.units
+    if units is None:
+        return (posting.account, None, None)
+    return (posting.account, units.number, units.currency)
+
+
+def covered(dropped: data.Transaction, kept: data.Transaction) -> bool:
+    """Whether every posting of the dropped leg is also a posting of the kept leg."""
+    postings = set(map(posting_key, kept.postings))
+    return all(posting_key(posting) in postings for posting in dropped.postings)
+
+
+def find_transfers(
+    entries: List[Any], window: datetime.timedelta = WINDOW
+) -> List[Tuple[int, int, int]]:
+    """Find the legs of transfers in the entries.
+
+    Returns (index of the kept leg, index of its posting, index of the
+    dropped leg) for every transfer.
+    """
+    # The first postings by account and amount, as (date, index) sorted by date.
+    buckets: Dict[Hashable, List[Tuple[datetime.date, int]]] = defaultdict(list)
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, data.Transaction) or extract.DUPLICATE in entry.meta:
+            continue
+        if entry.postings and entry.postings[0].units is not None:
+            buckets[posting_key(entry.postings[0])].append((entry.date, index))
+    for bucket in buckets.values():
+        bucket.sort()
+
+    # The legs that are already part of a transfer, kept or dropped.
+    used: Set[int] = set()
+    dropped: Set[int] = set()
+    transfers = []
+    for index, entry in enumerate(entries):
+        if index in dropped or not isinstance(entry, data.Transaction):
+            continue
+        if extract.DUPLICATE in entry.meta:
+            continue
+        for number, posting in enumerate(entry.postings[1:], 1):
+            bucket = buckets.get(posting_key(posting))
+            if not bucket:
+                continue
+            other = nearest(entries, bucket, entry, window, used)
+            if other is not None:
+                used.update((index, other))
+                dropped.add(other)
+                transfers.append((index, number, other))
+    return transfers
+
+
+def nearest(
+    entries: List[Any],
+    bucket: List[Tuple[datetime.date, int]],
+    entry: data.Transaction,
+    window: datetime.timedelta,
+    used: Set[int],
+) -> Optional[int]:
+    """The index of the closest leg in date that can be merged into the entry."""
+    filename = entry.meta.get("filename")
+    best = None
+    best_distance = None
+    position = bisect_left(bucket, (entry.date - window, -1))
+    last = entry.date + window
+    while position < len(bucket) and bucket[position][0] <= last:
+        date, index = bucket[position]
+        position += 1
+        other = entries[index]
+        # The legs are in the exports of different accounts.
+        if index in used or other.meta.get("filename") == filename:
+            continue
+        distance = abs(date - entry.date)
+        if (best_distance is None or distance < best_distance) and covered(other, entry):
+            best, best_distance = index, distance
+    return best
+
+
+def merge(kept: data.Transaction, number: int, dropped: data.Transaction) -> data.Transaction:
+    """The kept leg with the metadata of the dropped leg on the posting."""
+    posting = kept.postings[number]
+    meta = dict(posting.meta or {})
+    for key, value in dropped.meta.items():
+        if key not in SKIP_META:
+            meta.setdefault(key, value)
+    postings = list(kept.postings)
+    postings[number] = posting._replace(meta=meta)
+    return kept._replace(postings=postings)
+
+
+def merge_transfers(entries: List[Any], window: datetime.timedelta = WINDOW) -> List[Any]:
+    """The entries with the legs of each transfer merged into one transaction."""
+    result = list(entries)
+    dropped = set()
+    for index, number, other in find_transfers(entries, window):
+        result[index] = merge(result[index], number, entries[other])
+        dropped.add(other)
+    return [entry for index, entry in enumerate(result) if index not in dropped]
+
+
+def hook(extracted: List[Tuple], existing: data.Entries) -> List[Tuple]:
+    """Merge the transfers between the extracted files, as a beangulp hook."""
+    entries = [entry for _, file_entries, *_ in extracted for entry in file_entries]
+    transfers = find_transfers(entries)
+    if not transfers:
+        return extracted
+    replaced = {}
+    for index, number, other in transfers:
+        replaced[index] = merge(replaced.get(index, entries[index]), number, entries[other])
+        replaced[other] = None
+
+    result = []
+    index = 0
+    for filepath, file_entries, *rest in extracted:
+        merged = []
+        for entry in file_entries:
+            entry = replaced.get(index, entry)
+            index += 1
+            if entry is not None:
+                merged.append(entry)
+        result.append((filepath, merged, *rest))
+    return result
@@ -0,0 +1,234 @@
+"""Extract statements as they are downloaded into a directory.
+
+The watcher polls the modification time and size of the files in the
+directory. A new or changed file is extracted once it did not change for
+the debounce time, so that files that are still being written are left
+alone. Only that file is identified and extracted, by a bounded pool of
+worker processes, and its new entries are appended to a staging file:
+
+    from beangulp_importers import watch
+
+    watch.watch(importers, "~/Downloads/bank", "staging.beancount", existing=entries)
+
+Entries that are duplicates of existing entries, or of entries written
+before by the watcher, are not written. A file that could not be extracted
+is tried again when it changes, or after the retry time. Files that are in
+the directory when the watcher starts are taken as extracted already,
+unless process_existing is set.
+"""
+
+import asyncio
+import io
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Set, Tuple
+from beancount.core import data
+from beangulp import extract
+from beangulp_importers import batch, dedup
+
+# Suffixes of files that browsers and sync tools write before the download is complete.
+PARTIAL_SUFFIXES = (".tmp", ".part", ".crdownload", ".download")
+
+StatKey = Tuple[int, int]
+
+
+def balance_key(entry: data.Balance) -> Hashable:
+    return (entry.date, entry.account, entry.amount)
+
+
+class Watcher:
+    #! - output: The staging file that the extracted entries are appended to.
+    #! - existing: Entries of the ledger, to leave out entries that are already in it.
+    #! - workers: Number of worker processes, 0 extracts in a thread of this process.
+    #! - interval: Seconds between polls of the directory.
+    #! - debounce: Seconds that a file has to stay unchanged before it is extracted.
+    #! - process_existing: Also extract the files that are there when the watcher starts.
+    #! - retry: Seconds until a file that could not be extracted is tried again.
+    def __init__(
+        self,
+        importers: Sequence[Any],
+        directory: str,
+        output: str,
+        existing: Optional[List[Any]] = None,
+        workers: int = 2,
+        interval: float = 1.0,
+        debounce: float = 2.0,
+        process_existing: bool = False,
+        retry: float = 60.0,
+    ) -> None:
+        self.importers = importers
+        self.directory = os.path.expanduser(directory)
+        self.output = output
+        self.existing = existing if existing is not None else []
+        self.workers = workers
+        self.interval = interval
+        self.debounce = debounce
+        self.retry = retry
+        # The entries written to the staging file, the duplicate index of the existing
+        # and written entries per key function, and the balances among them.
+        self.written: List[Any] = []
+        self.indexes: Dict[dedup.KeyFunction, dedup.DuplicateIndex] = {}
+        self.balances: Set[Hashable] = set()
+        self.add_balances(self.existing)
+        # The modification time and size of the files when they were last extracted.
+        self.extracted: Dict[str, StatKey] = {}
+        if not process_existing:
+            self.extracted = self.scan()
+        # Changed files by path: their modification time and size, and since when.
+        self.pending: Dict[str, Tuple[StatKey, float]] = {}
+        # The files being extracted, with their modification time and size.
+        self.running: Dict[str, StatKey] = {}
+
+    def scan(self) -> Dict[str, StatKey]:
+        """The modification time and size of the files in the directory."""
+        output = os.path.abspath(self.output)
+        result = {}
+        for root, directories, filenames in os.walk(self.directory):
+            directories[:] = [name for name in directories if not name.startswith(".")]
+            for filename in filenames:
+                if filename.startswith(".") or filename.endswith(PARTIAL_SUFFIXES):
+                    continue
+                filepath = os.path.join(root, filename)
+                if os.path.abspath(filepath) == output:
+                    continue
+                try:
+                    stat = os.stat(filepath)
+                except FileNotFoundError:
+                    continue
+                result[filepath] = (stat.st_mtime_ns, stat.st_size)
+        return result
+
+    def ready(self, now: float) -> List[str]:
+        """The changed files that did not change for the debounce time."""
+        result = []
+        files = self.scan()
+        for filepath, key in files.items():
+            if filepath in self.running:
+                # A change is picked up once the extraction is done.
+                continue
+            if self.extracted.get(filepath) == key:
+                self.pending.pop(filepath, None)
+                continue
+            pending = self.pending.get(filepath)
+            if pending is None or pending[0] != key:
+                self.pending[filepath] = (key, now)
+            elif now - pending[1] >= self.debounce:
+                del self.pending[filepath]
+                self.running[filepath] = key
+                result.append(filepath)
+        for filepath in set(self.pending) - set(files):
+            del self.pending[filepath]
+        return sorted(result)
+
+    def executor(self) -> Executor:
+        if self.workers == 0:
+            batch._initialize(self.importers, self.existing)
+            return ThreadPoolExecutor(max_workers=1)
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=batch._initialize,
+            initargs=(self.importers, self.existing),
+        )
+
+    async def run(self, stop: Optional[asyncio.Event] = None) -> None:
+        """Watch the directory until the stop event is set."""
+        loop = asyncio.get_running_loop()
+        stop = stop or asyncio.Event()
+        # At most this many files are extracted or waiting for a worker.
+        slots = asyncio.Semaphore(max(self.workers, 1) * 2)
+        tasks = set()
+        with self.executor() as executor:
+            while not stop.is_set():
+                for filepath in self.ready(loop.time()):
+                    await slots.acquire()
+                    task = asyncio.create_task(self.process(executor, filepath))
+                    task.add_done_callback(lambda _: slots.release())
+                    task.add_done_callback(tasks.discard)
+                    tasks.add(task)
+                try:
+                    await asyncio.wait_for(stop.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+            if tasks:
+                await asyncio.wait(tasks)
+
+    async def process(self, executor: Executor, filepath: str) -> None:
+        loop = asyncio.get_running_loop()
+        key = self.running[filepath]
+        try:
+            result = await loop.run_in_executor(executor, batch._process, filepath)
+            if result.error is not None:
+                raise result.error
+            if result.importer is not None:
+                self.write(result._replace(importer=self.importers[result.importer]))
+        except Exception as error:
+            print(f"Warning: could not extract {filepath}: {error}")
+            # Try again after the retry time, or as soon as the file changed.
+            self.pending[filepath] = (key, loop.time() + self.retry - self.debounce)
+        else:
+            self.extracted[filepath] = key
+        finally:
+            del self.running[filepath]
+
+    def duplicates(self, keys: dedup.KeyFunction) -> dedup.DuplicateIndex:
+        """The index of the existing and written entries by these keys."""
+        index = self.indexes.get(keys)
+        if index is None:
+            index = self.indexes[keys] = dedup.DuplicateIndex(self.existing, keys)
+            index.add(self.written)
+        return index
+
+    def new_entries(self, importer: Any, entries: List[Any]) -> List[Any]:
+        """The entries that are not in the ledger and were not written before."""
+        keys = getattr(importer, "duplicate_keys", None)
+        if keys is not None:
+            duplicates = self.duplicates(keys)
+            entries = [
+                entry
+                for entry in entries
+                if not (isinstance(entry, data.Transaction) and duplicates.find(entry))
+            ]
+        elif hasattr(importer, "deduplicate"):
+            importer.deduplicate(entries, self.existing)
+            entries = [entry for entry in entries if extract.DUPLICATE not in entry.meta]
+        result = []
+        for entry in entries:
+            # Balances are not transactions, but extracting a file again repeats them.
+            if isinstance(entry, data.Balance) and balance_key(entry) in self.balances:
+                continue
+            result.append(entry)
+        return result
+
+    def add_balances(self, entries: List[Any]) -> None:
+        self.balances.update(
+            balance_key(entry) for entry in entries if isinstance(entry, data.Balance)
+        )
+
+    def write(self, result: batch.ExtractedFile) -> None:
+        """Append the new entries of the file to the staging file."""
+        importer = result.importer
+        entries = self.new_entries(importer, result.entries)
+        if not entries:
+            return
+        buffer = io.StringIO()
+        extract.print_extracted_entries(
+            [(result.filepath, entries, result.account, importer)], buffer
+        )
+        text = buffer.getvalue()
+        if extract.HEADER and os.path.exists(self.output) and os.path.getsize(self.output):
+            # The header is only written once, at the start of the file.
+            text = text[len(extract.HEADER) + 1 :]
+        with open(self.output, "a") as fd:
+            fd.write(text)
+        self.written.extend(entries)
+        for index in self.indexes.values():
+            index.add(entries)
+        self.add_balances(entries)
+
+
+def watch(importers: Sequence[Any], directory: str, output: str, **kwargs) -> None:
+    """Watch the directory until interrupted, see Watcher for the arguments."""
+    try:
+        asyncio.run(Watcher(importers, directory, output, **kwargs).run())
+    except KeyboardInterrupt:
+        pass
@@ -1,22 +1,23 @@
 from os import path
-from turtle import pos
 from typing import Optional
 from beangulp.importers import csvbase
+from beangulp_importers import base, identify
 import csv as pycsv
 from beancount.core import number, data
 
 pycsv.register_dialect("ovchipkaartdialect", delimiter=";")
 
 
-class CommaAmount(csvbase.Column):
+class CommaAmount(csvbase.Amount):
     def parse(self, value):
         return number.D(value.replace(",", "."))
 
 
-class Importer(csvbase.Importer):
+class Importer(base.Importer):
     encoding = "utf8"
     names = True
     dialect = "ovchipkaartdialect"
+    profile_column = "narration"
 
     date = csvbase.Date("Datum", "%d-%m-%Y")
     amount = CommaAmount("Bedrag")
@@ -44,11 +45,13 @@ class Importer(csvbase.Importer):
             if not entry.postings[0].units.number.is_zero()
         ]
 
-    def identify(remap, file):
-        header = '"Datum";"Check-in";"Vertrek";"Check-uit";"Bestemming";"Bedrag";"Transactie";"Klasse";"Product";"Opmerkingen";"Naam";"Kaartnummer"'
-        with open(file) as fd:
-            head = fd.read(len(header))
-        return head.startswith(header)
+    @staticmethod
+    def duplicate_keys(entry):
+        # The narration contains the check-in and check-out locations.
+        yield (entry.date, entry.postings[0].units, entry.narration)
+
+    def identify(self, file):
+        return identify.matches("ovchipkaart", file)
 
     def finalize(self, transaction, row):
         if row.narration == "Saldo automatisch opgeladen":
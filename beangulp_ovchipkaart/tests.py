@@ -2,6 +2,8 @@ from beangulp_ovchipkaart import importer
 
 from beancount.parser import cmptest
 from beancount.utils.test_utils import docfile
+import subprocess
+import sys
 
 
 class TestOvchipkaart(cmptest.TestCase):
@@ -41,3 +43,17 @@ class TestOvchipkaart(cmptest.TestCase):
                 Assets:Vervoer:OvChipkaarttegoed  -8.88 EUR
         """,
         )
+
+    # Importing the importer should not pull in a GUI toolkit
+    def test_no_gui_imports(self) -> None:
+        result = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import sys, beangulp_ovchipkaart.importer; print('tkinter' in sys.modules)",
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        self.assertEqual(result.stdout.strip(), "False")
@@ -3,6 +3,7 @@ from os import path
 from typing import Any, List, Optional
 from beancount.core import data, number, position
 from beangulp.importers import csvbase
+from beangulp_importers import base, categorize, identify, reader
 import csv as pycsv
 import datetime
 
@@ -34,14 +35,15 @@ class MergeType(Enum):
 pycsv.register_dialect("paypaldialect", delimiter=",")
 
 
-class CommaAmount(csvbase.Column):
+class CommaAmount(csvbase.Amount):
     def parse(self, value: str):
         return number.D(value.replace(",", "."))
 
 
-class Importer(csvbase.Importer):
+class Importer(base.Importer):
     encoding = "utf-8-sig"
     dialect = "paypaldialect"
+    profile_column = "typ"
 
     def __init__(
         self,
@@ -66,141 +68,310 @@ class Importer(csvbase.Importer):
                 lang["reference_transaction_id"]
             ),
         }
+        # The names of the header in this language.
+        self.header = {
+            name for column in self.columns.values() for name in column.names
+        }
         self.bank_account = bank_account
         super().__init__(account, base_currency)
 
     def filename(self, filepath: str) -> str:
         return "paypal." + path.basename(filepath)
 
-    def identify(remap, file: str) -> bool:
-        f = open(file)
-        is_correct = path.basename(f.name) == "Download.CSV"
-        f.close()
-        return is_correct
+    def identify(self, file: str) -> bool:
+        if not identify.matches("paypal", file):
+            return False
+        return self.header.issubset(identify.header(file, self.encoding))
 
-    def extract(self, filepath: str, existing: List[Any]) -> List[Any]:
-        with open(filepath, encoding=self.encoding) as file:
-            contents = file.read()
-            if contents == "" or contents.isspace():
-                return []
+    def is_blank(self, filepath: str) -> bool:
+        return reader.is_blank(filepath)
+
+    def metadata(self, filepath: str, lineno: int, row):
+        meta = super().metadata(filepath, lineno, row)
+        if row.transaction_id:
+            meta["transaction_id"] = row.transaction_id
+        if row.reference_transaction_id:
+            meta["reference_transaction_id"] = row.reference_transaction_id
+        return meta
 
-        entries = super().extract(filepath, existing)
-        read = self.read(filepath)
+    @staticmethod
+    def duplicate_keys(entry):
+        transaction_id = entry.meta.get("transaction_id")
+        if transaction_id:
+            yield ("transaction_id", transaction_id)
+        # For transactions imported without a transaction ID. The account of the first
+        # posting is often changed after importing, the amount is not.
+        yield (entry.date, entry.payee, entry.narration, entry.postings[0].units)
 
-        iter = list(zip(entries, read))
+    def merge_type(self, row) -> Optional[MergeType]:
+        if row.typ in self.lang["bank_transfer"]:
+            return MergeType.BANK_TRANSFER
+        if row.typ == self.lang["general_currency_conversion"]:
+            return MergeType.CURRENCY_CONVERSION
+        return None
+
+    def extract(self, filepath: str, existing: List[Any]) -> List[Any]:
+        if self.is_blank(filepath):
+            return []
 
+        merger = ReferenceMerger(self, filepath)
+        add = self.timed("post", merger.add)
         new_entries = []
+        for entry, row, lineno, span in self.transactions(filepath, self.resume(filepath)):
+            new_entries.extend(add(entry, row, (entry, row, lineno, span)))
 
-        i = 0
-        while i < len(iter):
-            entry, row = iter[i]
-            merges = []
-            while i + 1 < len(iter):
-                next_entry, next_row = iter[i + 1]
-                if next_row.reference_transaction_id == row.transaction_id:
-
-                    if next_row.typ in self.lang["bank_transfer"]:
-                        merges.append(MergeType.BANK_TRANSFER)
-                    elif next_row.typ == self.lang["general_currency_conversion"]:
-                        merges.append(MergeType.CURRENCY_CONVERSION)
-                    else:
-                        print(
-                            "unsupported transaction type that references a previous transaction:",
-                            next_row.typ,
-                        )
-
-                    entry = entry._replace(
-                        postings=entry.postings + next_entry.postings
-                    )
-                    i += 1
-                else:
-                    break
-
-            # Add an expense posting, derive from the first transaction.
-            paypal_account_posting = entry.postings[0]
-            payee_account = paypal_account_posting.account
-            # Maybe the payee has been set, otherwise use a placeholder
-            if payee_account == self.account(filepath):
-                payee_account = "Expenses:UnknownAccount"
-            first_entry = paypal_account_posting._replace(
-                # TODO: For clarity, use Income when money is coming in.
-                account=payee_account,
-                units=-paypal_account_posting.units,
+        # The date of the first row after the extracted rows, if any.
+        after = None
+        if self.checkpoints is None:
+            new_entries.extend(self.timed("post", merger.flush)())
+            complete = merger.previous
+        else:
+            # Stop before the rows of the open groups: they are extracted next time,
+            # when the groups are complete.
+            complete, after = merger.position()
+
+        if complete is None:
+            new_entries = self.categorize(new_entries, existing)
+            self.finish_profile(filepath)
+            return new_entries
+        entry, row, lineno, span = complete
+        self.commit(filepath, lineno, span)
+
+        # Reverse the list if the file is in descending order.
+        if len(new_entries) > 1 and not new_entries[0].date <= new_entries[-1].date:
+            new_entries.reverse()
+
+        # The balance is only known at the end of a date.
+        if row.balance_unreg is not None and after != row.date:
+            date = row.date + datetime.timedelta(days=1)
+            units = data.Amount(row.balance_unreg, self.currency)
+            meta = data.new_metadata(filepath, entry.meta["lineno"])
+            new_entries.append(
+                data.Balance(meta, date, self.account(filepath), units, None, None)
             )
-            entry = entry._replace(postings=[first_entry] + entry.postings[1:])
 
-            # If there was not a bank transfer, the money is coming from the paypal account. Add this posting (use the orinal posting).
-            if not MergeType.BANK_TRANSFER in merges:
-                paypal_account_posting = paypal_account_posting._replace(
-                    account=self.account(filepath)
-                )
-                entry = entry._replace(
-                    postings=entry.postings[:1]
-                    + [paypal_account_posting]
-                    + entry.postings[1:]
+        new_entries = self.categorize(new_entries, existing)
+        self.finish_profile(filepath)
+        return new_entries
+
+    def merge(self, filepath: str, primary, transfers: List[Any], conversions: List[Any]):
+        """Build the transaction of a group from its primary transaction and the
+        bank transfers and currency conversions that reference it."""
+        paypal_account = self.account(filepath)
+
+        # Add an expense posting, derive from the first transaction.
+        paypal_account_posting = primary.postings[0]
+        payee_account = paypal_account_posting.account
+        # Maybe the payee has been set, otherwise use a placeholder
+        if payee_account == paypal_account:
+            payee_account = categorize.UNKNOWN_ACCOUNT
+        first_posting = paypal_account_posting._replace(
+            # TODO: For clarity, use Income when money is coming in.
+            account=payee_account,
+            units=-paypal_account_posting.units,
+        )
+
+        if conversions:
+            # Conversions come in pairs: the native currency is subtracted and the
+            # currency of the expense is added. Other situations are probably possible,
+            # but not currently handled.
+            assert len(conversions) % 2 == 0
+            native = [c.postings[0].units for c in conversions]
+            foreign = [u for u in native if u.currency != self.currency]
+            native = [u for u in native if u.currency == self.currency]
+            assert len(native) == len(foreign)
+
+            # The first posting is the expense. If the converted units are identical,
+            # we can simply add the cost spec.
+            assert all(u.currency == first_posting.units.currency for u in foreign)
+            assert sum(u.number for u in foreign) == first_posting.units.number
+
+            first_posting = first_posting._replace(
+                cost=position.CostSpec(
+                    None,
+                    -sum(u.number for u in native),
+                    self.currency,
+                    None,
+                    None,
+                    None,
                 )
+            )
+
+        postings = [first_posting]
+        # If there was not a bank transfer, the money is coming from the paypal account. Add this posting (use the orinal posting).
+        if not transfers:
+            postings.append(paypal_account_posting._replace(account=paypal_account))
+        postings.extend(primary.postings[1:])
 
-            # The first transaction is the primary transaction. The others should be merged
-            while len(merges) > 0:
-                if merges[-1] == MergeType.BANK_TRANSFER:
-                    # The lowest posting is from a bank transfer. Invert the amount and add add a transfer posting.
-                    amount = -entry.postings[-1].units
-                    bank_transfer_posting = data.Posting(
-                        self.bank_account,
-                        amount,
-                        None,
-                        None,
-                        None,
-                        None,
-                    )
-                    entry = entry._replace(
-                        postings=entry.postings[:-1] + [bank_transfer_posting]
-                    )
-                    merges = merges[:-1]
-                elif merges[-1] == MergeType.CURRENCY_CONVERSION:
-                    # Assume each currency conversion comes in pairs.
-                    assert (
-                        len(merges) >= 2 and merges[-2] == MergeType.CURRENCY_CONVERSION
-                    )
-
-                    # The bottom two postings correspond to the conversion.
-
-                    # One currency gets subtracted, another added. Assume the second-last posting is the native currency.
-                    # Other situations are probably possible, but not currently handled.
-                    assert entry.postings[-2].units[1] == self.currency
-
-                    # The first entry is the expense. See if the units is identical, in which case we can simply add the
-                    # cost spec.
-                    assert entry.postings[0].units == entry.postings[-1].units
-
-                    # Add the cost spec
-                    entry.postings[0] = entry.postings[0]._replace(
-                        cost=position.CostSpec(
-                            None,
-                            -entry.postings[-2].units[0],
-                            self.currency,
-                            None,
-                            None,
-                            None,
-                        )
-                    )
-
-                    # Remove the currency conversions.
-                    entry = entry._replace(postings=entry.postings[:-2])
-
-                    merges = merges[:-2]
-
-            new_entries.append(entry)
-            i += 1
-
-        if len(iter) > 0:
-            entry, row = iter[-1]
-            if row.balance_unreg is not None:
-                date = row.date + datetime.timedelta(days=1)
-                units = data.Amount(row.balance_unreg, self.currency)
-                meta = data.new_metadata(filepath, entry.meta["lineno"])
-                new_entries.append(
-                    data.Balance(meta, date, self.account(filepath), units, None, None)
+        for transfer in transfers:
+            # The last posting is from a bank transfer. Invert the amount and add a transfer posting.
+            postings.extend(transfer.postings[:-1])
+            postings.append(
+                data.Posting(
+                    self.bank_account,
+                    -transfer.postings[-1].units,
+                    None,
+                    None,
+                    None,
+                    None,
                 )
+            )
 
-        return new_entries
+        # Keep the transaction IDs of the rows merged into this transaction.
+        merged = [
+            entry.meta["transaction_id"]
+            for entry in transfers + conversions
+            if "transaction_id" in entry.meta
+        ]
+        if merged:
+            meta = dict(primary.meta)
+            meta["merged_transaction_ids"] = " ".join(merged)
+            primary = primary._replace(meta=meta)
+
+        return primary._replace(postings=postings)
+
+
+# How far the date of a row can be from the other rows of its group.
+WINDOW = datetime.timedelta(days=1)
+
+
+class _Group:
+    __slots__ = (
+        "primary",
+        "transfers",
+        "conversions",
+        "first",
+        "last",
+        "start",
+        "date",
+        "before",
+    )
+
+    def __init__(self, first: int, before) -> None:
+        self.primary = None
+        self.transfers = []
+        self.conversions = []
+        # The indexes of the first and last row of the group, the dates of those rows
+        # and the position of the row before the group.
+        self.first = first
+        self.last = first
+        self.start = None
+        self.date = None
+        self.before = before
+
+
+class ReferenceMerger:
+    """Merge rows that reference another row into the transaction of that row.
+
+    Groups are indexed by transaction ID, so bank transfers and currency
+    conversions are attached in constant time, also when they come before
+    the row they reference or with other rows in between. The rows of a
+    group mostly have the same date, but not always: the bank deposit of a
+    payment just before midnight is dated the next day. A group is therefore
+    kept open until the rows are more than WINDOW away from its last row.
+
+    Groups are completed in the order of their first row, and only when none
+    of their rows comes after the first row of an open group. The completed
+    transactions are therefore those of the rows before position().
+    """
+
+    def __init__(self, importer: Importer, filepath: str) -> None:
+        self.importer = importer
+        self.filepath = filepath
+        self.groups = {}
+        self.date = None
+        self.count = 0
+        # The position of the last row, as given to add().
+        self.previous = None
+
+    def add(self, entry, row, position=None) -> List[Any]:
+        """Add a row and return the transactions of the groups it completed."""
+        completed = []
+        if self.date is not None and row.date != self.date:
+            completed = self.complete(row.date)
+        self.date = row.date
+
+        merge_type = self.importer.merge_type(row)
+        if merge_type is not None and row.reference_transaction_id:
+            group = self.open(row.reference_transaction_id)
+            if merge_type == MergeType.BANK_TRANSFER:
+                group.transfers.append(entry)
+            else:
+                group.conversions.append(entry)
+        else:
+            key = row.transaction_id
+            group = self.groups.get(key)
+            if not key or group is not None and group.primary is not None:
+                # Transaction IDs should be unique, do not merge into another group.
+                key = object()
+            group = self.open(key)
+            group.primary = entry
+        if group.start is None:
+            group.start = row.date
+        group.last = self.count
+        group.date = row.date
+        self.count += 1
+        self.previous = position
+        return completed
+
+    def open(self, key) -> _Group:
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = _Group(self.count, self.previous)
+        return group
+
+    def complete(self, date: datetime.date) -> List[Any]:
+        """Complete the groups that cannot get rows from this date on."""
+        groups = list(self.groups.values())
+        # The first row of the groups that can still get rows.
+        horizon = min(
+            (group.first for group in groups if abs(date - group.date) <= WINDOW),
+            default=self.count,
+        )
+        # Complete the groups before the first group that is open or that starts
+        # before the last row of a group before it.
+        cut = 0
+        end = -1
+        for i, group in enumerate(groups):
+            if end < group.first:
+                cut = i
+            if group.last >= horizon:
+                break
+            end = max(end, group.last)
+        else:
+            cut = len(groups)
+        if cut == 0:
+            return []
+        completed = []
+        for group in groups[:cut]:
+            completed.extend(self.merge(group))
+        self.groups = dict(list(self.groups.items())[cut:])
+        return completed
+
+    def position(self):
+        """The position of the last row before the open groups, and the date of the
+        row after it."""
+        for group in self.groups.values():
+            return group.before, group.start
+        return self.previous, None
+
+    def flush(self) -> List[Any]:
+        """Complete all open groups."""
+        completed = []
+        for group in self.groups.values():
+            completed.extend(self.merge(group))
+        self.groups = {}
+        return completed
+
+    def merge(self, group: _Group) -> List[Any]:
+        if group.primary is not None:
+            return [
+                self.importer.merge(
+                    self.filepath, group.primary, group.transfers, group.conversions
+                )
+            ]
+        # The referenced transaction is not in this file, keep the rows on their own.
+        return [
+            self.importer.merge(self.filepath, entry, [], [])
+            for entry in group.transfers + group.conversions
+        ]
@@ -1,6 +1,9 @@
 from typing import Optional
 from beangulp_paypal import importer
+from beangulp_importers.checkpoint import Checkpoints
 
+import os
+import tempfile
 import unittest
 
 from beancount.parser import cmptest, printer
@@ -61,6 +64,33 @@ class TestPaypal(cmptest.TestCase):
         """,
         )
 
+    @docfile
+    def test_consecutive_groups(self, filename: str) -> None:
+        """\
+"Date","Time","TimeZone","Name","Type","Status","Currency","Gross","Fee","Net","From Email Address","To Email Address","Transaction ID","Reference Txn ID","Receipt ID","Balance","Subject"
+"19/08/2020","03:00:00","PDT","Payee","Express Checkout Payment","Completed","EUR","-66,00","0,00","-66,00","email@address.com","anotheremail@address.com","transactionid23423","","","-66,00","Description"
+"19/08/2020","03:00:00","PDT","","Bank Deposit to PP Account ","Pending","EUR","66,00","0,00","66,00","","email@address.com","6324872369","transactionid23423","","0,00","Another description"
+"20/08/2020","10:00:00","PDT","Other payee","Express Checkout Payment","Completed","EUR","-5,00","0,00","-5,00","email@address.com","anotheremail@address.com","transactionid23424","","","-5,00","Second description"
+        """
+        paypal_importer = importer.Importer(
+            "EUR", "Assets:Paypal", "Liabilities:DirectDebit"
+        )
+        entries = paypal_importer.extract(filename, [])
+        self.assertEqualEntries(
+            entries,
+            """
+            2020-08-19 * "Payee" "Description"
+                Expenses:UnknownAccount   66.00 EUR
+                Liabilities:DirectDebit  -66.00 EUR
+
+            2020-08-20 * "Other payee" "Second description"
+                Expenses:UnknownAccount    5.00 EUR
+                Assets:Paypal             -5.00 EUR
+
+            2020-08-21 balance Assets:Paypal                                   -5.00 EUR
+        """,
+        )
+
     @docfile
     def test_currency_conversion(self, filename: str) -> None:
         """\
@@ -82,9 +112,50 @@ class TestPaypal(cmptest.TestCase):
 
         expected = """\
 2019-08-13 * "Grocery Store" "An apple and an egg"
+  transaction_id: "transaction_id2343"
+  reference_transaction_id: "63464334"
+  fingerprint: "3bbf8dff66826a3b"
+  merged_transaction_ids: "id1 id2 id3"
   Expenses:UnknownAccount   15.00 USD {# 13.92 EUR}
   Liabilities:DirectDebit  -13.92 EUR
 2019-08-14 balance Assets:Paypal                                   0.00 EUR
+"""
+
+        self.assertEqual(actual, expected)
+
+    @docfile
+    def test_out_of_order_references(self, filename: str) -> None:
+        """\
+"Date","Time","TimeZone","Name","Type","Status","Currency","Gross","Fee","Net","From Email Address","To Email Address","Transaction ID","Reference Txn ID","Receipt ID","Balance","Subject"
+"13/08/2019","07:00:00","PDT","","General Currency Conversion","Completed","EUR","-13,92","0,00","-13,92","email@address.com","","id2","transaction_id2343","","0,00","An apple and an egg"
+"13/08/2019","07:00:00","PDT","Bakery","Express Checkout Payment","Completed","EUR","-2,00","0,00","-2,00","email@address.com","anotheremail@address.com","transaction_id2344","","","-2,00","Bread"
+"13/08/2019","07:00:00","PDT","Grocery Store","PreApproved Payment Bill User Payment","Completed","USD","-15,00","0,00","-15,00","email@address.com","anotheremail@address.com","transaction_id2343","63464334","","-15,00","An apple and an egg"
+"13/08/2019","07:00:00","PDT","","Bank Deposit to PP Account ","Pending","EUR","13,92","0,00","13,92","","email@address.com","id1","transaction_id2343","","13,92","An apple and an egg"
+"13/08/2019","07:00:00","PDT","","General Currency Conversion","Completed","USD","15,00","0,00","15,00","","email@address.com","id3","transaction_id2343","","-2,00","An apple and an egg"
+        """
+        paypal_importer = importer.Importer(
+            "EUR", "Assets:Paypal", "Liabilities:DirectDebit"
+        )
+        entries = paypal_importer.extract(filename, [])
+
+        actual = ""
+        for entry in entries:
+            actual = actual + printer.format_entry(entry)
+
+        expected = """\
+2019-08-13 * "Grocery Store" "An apple and an egg"
+  transaction_id: "transaction_id2343"
+  reference_transaction_id: "63464334"
+  fingerprint: "3bbf8dff66826a3b"
+  merged_transaction_ids: "id1 id2 id3"
+  Expenses:UnknownAccount   15.00 USD {# 13.92 EUR}
+  Liabilities:DirectDebit  -13.92 EUR
+2019-08-13 * "Bakery" "Bread"
+  transaction_id: "transaction_id2344"
+  fingerprint: "47e819db1d5a09ee"
+  Expenses:UnknownAccount   2.00 EUR
+  Assets:Paypal            -2.00 EUR
+2019-08-14 balance Assets:Paypal                                   -2.00 EUR
 """
 
         self.assertEqual(actual, expected)
@@ -117,6 +188,87 @@ class TestPaypal(cmptest.TestCase):
         """,
         )
 
+    @docfile
+    def test_reference_next_day(self, filename: str) -> None:
+        """\
+"Date","Time","TimeZone","Name","Type","Status","Currency","Gross","Fee","Net","From Email Address","To Email Address","Transaction ID","Reference Txn ID","Receipt ID","Balance","Subject"
+"19/08/2020","23:59:00","PDT","Payee","Express Checkout Payment","Completed","EUR","-66,00","0,00","-66,00","email@address.com","anotheremail@address.com","id1","","","-66,00","Description"
+"20/08/2020","00:00:00","PDT","","Bank Deposit to PP Account ","Pending","EUR","66,00","0,00","66,00","","email@address.com","id2","id1","","0,00","Description"
+"20/08/2020","10:00:00","PDT","Other payee","Express Checkout Payment","Completed","EUR","-5,00","0,00","-5,00","email@address.com","anotheremail@address.com","id3","","","-5,00","Second description"
+        """
+        paypal_importer = importer.Importer(
+            "EUR", "Assets:Paypal", "Liabilities:DirectDebit"
+        )
+        entries = paypal_importer.extract(filename, [])
+        self.assertEqualEntries(
+            entries,
+            """
+            2020-08-19 * "Payee" "Description"
+                Expenses:UnknownAccount   66.00 EUR
+                Liabilities:DirectDebit  -66.00 EUR
+
+            2020-08-20 * "Other payee" "Second description"
+                Expenses:UnknownAccount    5.00 EUR
+                Assets:Paypal             -5.00 EUR
+
+            2020-08-21 balance Assets:Paypal                                   -5.00 EUR
+        """,
+        )
+
+    def test_incremental(self) -> None:
+        header = '"Date","Time","TimeZone","Name","Type","Status","Currency","Gross","Fee","Net","From Email Address","To Email Address","Transaction ID","Reference Txn ID","Receipt ID","Balance","Subject"\n'
+        rows = [
+            '"19/08/2020","03:00:00","PDT","Payee","Express Checkout Payment","Completed","EUR","-66,00","0,00","-66,00","email@address.com","anotheremail@address.com","id1","","","-66,00","Description"\n',
+            '"19/08/2020","03:00:00","PDT","","Bank Deposit to PP Account ","Pending","EUR","66,00","0,00","66,00","","email@address.com","id2","id1","","0,00","Description"\n',
+            '"20/08/2020","10:00:00","PDT","Other payee","Express Checkout Payment","Completed","EUR","-5,00","0,00","-5,00","email@address.com","anotheremail@address.com","id3","","","-5,00","Second description"\n',
+            '"20/08/2020","10:00:00","PDT","","Bank Deposit to PP Account ","Pending","EUR","5,00","0,00","5,00","","email@address.com","id4","id3","","0,00","Second description"\n',
+            '"21/08/2020","10:00:00","PDT","Third payee","Express Checkout Payment","Completed","EUR","-1,00","0,00","-1,00","email@address.com","anotheremail@address.com","id5","","","-1,00","Third description"\n',
+            '"22/08/2020","00:30:00","PDT","","Bank Deposit to PP Account ","Pending","EUR","1,00","0,00","1,00","","email@address.com","id6","id5","","0,00","Third description"\n',
+            '"24/08/2020","10:00:00","PDT","Fourth payee","Express Checkout Payment","Completed","EUR","-2,00","0,00","-2,00","email@address.com","anotheremail@address.com","id7","","","-2,00","Fourth description"\n',
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "Download.CSV")
+            paypal_importer = importer.Importer(
+                "EUR", "Assets:Paypal", "Liabilities:DirectDebit"
+            )
+            paypal_importer.checkpoints = Checkpoints(
+                os.path.join(directory, "checkpoints.json")
+            )
+
+            with open(filename, "w") as fd:
+                fd.write(header)
+                fd.writelines(rows[:5])
+            entries = paypal_importer.extract(filename, [])
+            # The groups of 20/08/2020 and later may still get rows.
+            self.assertEqualEntries(
+                entries,
+                """
+                2020-08-19 * "Payee" "Description"
+                    Expenses:UnknownAccount   66.00 EUR
+                    Liabilities:DirectDebit  -66.00 EUR
+
+                2020-08-20 balance Assets:Paypal                                   0.00 EUR
+            """,
+            )
+
+            with open(filename, "a") as fd:
+                fd.writelines(rows[5:])
+            entries = paypal_importer.extract(filename, [])
+            self.assertEqualEntries(
+                entries,
+                """
+                2020-08-20 * "Other payee" "Second description"
+                    Expenses:UnknownAccount    5.00 EUR
+                    Liabilities:DirectDebit   -5.00 EUR
+
+                2020-08-21 * "Third payee" "Third description"
+                    Expenses:UnknownAccount    1.00 EUR
+                    Liabilities:DirectDebit   -1.00 EUR
+
+                2020-08-23 balance Assets:Paypal                                   0.00 EUR
+            """,
+            )
+
 
 if __name__ == "__main__":
     unittest.main()
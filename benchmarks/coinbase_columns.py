@@ -0,0 +1,80 @@
+"""Compare the Coinbase amount column decoders.
+
+The old decoder ran every substitution with re.sub() on every cell. The new
+one parses a whole column with PotentiallyEmptyAmount.parse_many(). Both are
+run on the same seeded synthetic columns, with and without substitutions.
+
+Usage: python benchmarks/coinbase_columns.py [--rows 100000] [--repeat 5]
+"""
+
+import argparse
+import decimal
+import os
+import random
+import re
+import sys
+import timeit
+from typing import Dict, List
+
+# Run from a checkout without installing the package.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from beancount.core import number
+from beangulp_coinbase.importer import PotentiallyEmptyAmount
+
+# Substitutions for amounts formatted like "€1,234.56".
+SUBS = {"€": "", ",": ""}
+
+
+def per_cell(values: List[str], subs: Dict[str, str]) -> List[decimal.Decimal]:
+    """The decoder as it was: uncompiled substitutions on every cell."""
+    result = []
+    for value in values:
+        for pattern, replacement in subs.items():
+            value = re.sub(pattern, replacement, value)
+        if value == "":
+            result.append(number.D("0.00"))
+        else:
+            result.append(decimal.Decimal(value))
+    return result
+
+
+def column(rows: int, seed: int = 0) -> List[str]:
+    """A column like Fees: mostly zero or empty, some recurring amounts."""
+    rng = random.Random(seed)
+    values = []
+    for _ in range(rows):
+        kind = rng.random()
+        if kind < 0.3:
+            values.append("")
+        elif kind < 0.6:
+            values.append("0.00")
+        else:
+            values.append(f"{rng.randint(0, 5000) / 100:.2f}")
+    return values
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    values = column(args.rows)
+    formatted = ["€" + value if value else value for value in values]
+    for name, subs, cells in [("plain", {}, values), ("subs", SUBS, formatted)]:
+        decoder = PotentiallyEmptyAmount("Fees", subs)
+        if decoder.parse_many(cells) != per_cell(cells, subs):
+            print(f"FAIL: {name}: the decoders disagree")
+            return 1
+        old = min(timeit.repeat(lambda: per_cell(cells, subs), number=1, repeat=args.repeat))
+        new = min(timeit.repeat(lambda: decoder.parse_many(cells), number=1, repeat=args.repeat))
+        print(
+            f"{name:6} per cell {args.rows / old:12,.0f} cells/s"
+            f"   parse_many {args.rows / new:12,.0f} cells/s   {old / new:5.1f}x"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
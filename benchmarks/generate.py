@@ -0,0 +1,238 @@
+"""Generate synthetic exports for the benchmarks.
+
+The files look like real exports of every importer, including the rows that
+need special handling: ASN interest and fund transactions, PayPal bank
+transfers and currency conversions that reference a payment, every Coinbase
+transaction type and OV-chipkaart top-ups and free check-ins. The output only
+depends on the number of rows and the seed.
+
+Usage: python benchmarks/generate.py FORMAT ROWS OUTPUT [--seed 0]
+"""
+
+import argparse
+import csv
+import datetime
+import random
+import sys
+from typing import Callable, Dict, TextIO
+
+START = datetime.date(2015, 1, 1)
+
+# The accounts of the ASN export, with the beancount accounts the benchmark uses.
+ASN_ACCOUNTS = {
+    "NL00ASNB0000000001": "Assets:ASN:Betaalrekening",
+    "NL00ASNB0000000002": "Assets:ASN:Spaarrekening",
+    "NL00ASNB0000000003": "Assets:ASN:Beleggen",
+}
+
+ASN_FUNDS = [
+    "ASN Duurzaam Mixfonds Neutraal",
+    "ASN Duurzaam Mixfonds Offensief",
+    "ASN Groenprojectenfonds",
+]
+
+PAYEES = ["Grocery Store", "Bakery", "Book Shop", "Webshop", "Train Tickets", "Cinema"]
+
+
+def cents(rng: random.Random, low: int, high: int) -> int:
+    return rng.randint(low, high)
+
+
+def euro(amount: int, separator: str = ".") -> str:
+    """Format an amount in cents."""
+    sign = "-" if amount < 0 else ""
+    return f"{sign}{abs(amount) // 100}{separator}{abs(amount) % 100:02d}"
+
+
+def asnbank(fd: TextIO, rows: int, rng: random.Random) -> None:
+    writer = csv.writer(fd, lineterminator="\n")
+    own = "NL00ASNB0000000001"
+    balance = 1_000_000
+    day = START
+    for index in range(rows):
+        if rng.random() < 0.3:
+            day += datetime.timedelta(days=1)
+        date = day.strftime("%d-%m-%Y")
+        kind = rng.random()
+        other, payee = f"NL{rng.randint(10, 99)}BANK0{rng.randint(100000000, 999999999)}", ""
+        if kind < 0.05:
+            code, amount, other = "RNT", cents(rng, 1, 500), ""
+            narration = f"CREDITRENTE TOT {date}"
+        elif kind < 0.10:
+            code, amount, other = "EFF", -cents(rng, 1000, 50000), ""
+            shares = rng.randint(1, 999)
+            direction = "verkocht" if rng.random() < 0.3 else "gekocht"
+            if direction == "verkocht":
+                amount = -amount
+            narration = (
+                f"Voor u {direction} via Euronext Fund Services: 0 {shares:04d} Participaties "
+                f"{rng.choice(ASN_FUNDS)} a EUR {rng.randint(20, 80)} {rng.randint(0, 99):02d}. "
+                f"Valutadatum: {date}. (Trans.nr. {index:08d})"
+            )
+        elif kind < 0.20:
+            code, amount = "OVB", -cents(rng, 100, 100000)
+            other, payee = "NL00ASNB0000000002", "Spaarrekening"
+            narration = "Naar spaarrekening"
+        else:
+            code, amount = "ACC", -cents(rng, 100, 20000)
+            if rng.random() < 0.2:
+                amount = cents(rng, 100, 300000)
+            payee = rng.choice(PAYEES)
+            narration = f"Betaling {index}"
+        writer.writerow(
+            [
+                date, own, other, payee, "", "", "", "EUR", euro(balance), "EUR", euro(amount),
+                date, date, "0000", code, f"{index:08d}", "", f"'{narration}'", "0",
+            ]
+        )
+        balance += amount
+
+
+def paypal(fd: TextIO, rows: int, rng: random.Random) -> None:
+    writer = csv.writer(fd, quoting=csv.QUOTE_ALL, lineterminator="\n")
+    writer.writerow(
+        [
+            "Date", "Time", "TimeZone", "Name", "Type", "Status", "Currency", "Gross",
+            "Fee", "Net", "From Email Address", "To Email Address", "Transaction ID",
+            "Reference Txn ID", "Receipt ID", "Balance", "Subject",
+        ]
+    )
+    day = START
+    written = 0
+    ids = iter(range(10**9))
+
+    def row(name, typ, currency, amount, transaction_id, reference, subject):
+        nonlocal written
+        net = euro(amount, ",")
+        writer.writerow(
+            [
+                day.strftime("%d/%m/%Y"), "12:00:00", "CET", name, typ, "Completed",
+                currency, net, "0,00", net, "me@example.com", "shop@example.com",
+                transaction_id, reference, "", "0,00", subject,
+            ]
+        )
+        written += 1
+
+    while written < rows:
+        if rng.random() < 0.3:
+            day += datetime.timedelta(days=1)
+        payment = f"P{next(ids):012d}"
+        payee = rng.choice(PAYEES)
+        subject = f"Order {payment}"
+        amount = cents(rng, 100, 20000)
+        kind = rng.random()
+        if kind < 0.5:
+            # Paid from the PayPal balance.
+            row(payee, "Express Checkout Payment", "EUR", -amount, payment, "", subject)
+        elif kind < 0.85:
+            # Paid with a bank transfer that references the payment.
+            row(payee, "Express Checkout Payment", "EUR", -amount, payment, "", subject)
+            row("", "Bank Deposit to PP Account ", "EUR", amount, f"B{next(ids):012d}", payment, subject)
+        else:
+            # Paid in another currency, converted from a bank transfer in euros.
+            native = amount * rng.randint(80, 95) // 100
+            row(payee, "PreApproved Payment Bill User Payment", "USD", -amount, payment, "", subject)
+            row("", "Bank Deposit to PP Account ", "EUR", native, f"B{next(ids):012d}", payment, subject)
+            row("", "General Currency Conversion", "EUR", -native, f"C{next(ids):012d}", payment, subject)
+            row("", "General Currency Conversion", "USD", amount, f"C{next(ids):012d}", payment, subject)
+
+
+COINBASE_ASSETS = {"BTC": 30000, "ETH": 2000, "DAI": 1, "ADA": 1}
+
+
+def coinbase(fd: TextIO, rows: int, rng: random.Random) -> None:
+    fd.write(
+        '"You can use this transaction report to inform your likely tax obligations."\n'
+        "\n\n\nTransactions\nUser,me@example.com,0000000000\n\n"
+    )
+    writer = csv.writer(fd, lineterminator="\n")
+    writer.writerow(
+        [
+            "Timestamp", "Transaction Type", "Asset", "Quantity Transacted",
+            "Spot Price Currency", "Spot Price at Transaction", "Subtotal",
+            "Total (inclusive of fees)", "Fees", "Notes",
+        ]
+    )
+    moment = datetime.datetime(2019, 1, 1)
+    types = ["Buy", "Sell", "Send", "Receive", "Convert", "Rewards Income", "Coinbase Earn"]
+    weights = [40, 20, 5, 5, 10, 15, 5]
+    for _ in range(rows):
+        moment += datetime.timedelta(seconds=rng.randint(1, 20000))
+        typ = rng.choices(types, weights)[0]
+        asset = rng.choice(list(COINBASE_ASSETS))
+        price = COINBASE_ASSETS[asset] * rng.uniform(0.5, 1.5)
+        quantity = round(rng.uniform(0.001, 2), 6)
+        subtotal = round(quantity * price, 2)
+        fees = round(subtotal * 0.015, 2) if typ in ("Buy", "Sell") else 0
+        total = subtotal + fees if typ == "Buy" else subtotal - fees
+        if typ == "Convert":
+            to = rng.choice([other for other in COINBASE_ASSETS if other != asset])
+            to_quantity = round(subtotal / COINBASE_ASSETS[to], 6)
+            notes = f"Converted {quantity:.6f} {asset} to {to_quantity:.6f} {to}"
+        else:
+            notes = f"{typ} {quantity:.6f} {asset}"
+        amounts = [f"{subtotal:.2f}", f"{total:.2f}", f"{fees:.2f}"]
+        if typ in ("Send", "Receive"):
+            amounts = ["", "", ""]
+        writer.writerow(
+            [
+                moment.strftime("%Y-%m-%dT%H:%M:%SZ"), typ, asset, f"{quantity:.6f}",
+                "EUR", f"{price:.2f}", *amounts, notes,
+            ]
+        )
+
+
+def ovchipkaart(fd: TextIO, rows: int, rng: random.Random) -> None:
+    writer = csv.writer(fd, delimiter=";", quoting=csv.QUOTE_ALL, lineterminator="\n")
+    writer.writerow(
+        [
+            "Datum", "Check-in", "Vertrek", "Check-uit", "Bestemming", "Bedrag",
+            "Transactie", "Klasse", "Product", "Opmerkingen", "Naam", "Kaartnummer",
+        ]
+    )
+    stations = ["Eindhoven Centraal", "Nijmegen", "Utrecht Centraal", "Amsterdam Centraal"]
+    day = START
+    for _ in range(rows):
+        if rng.random() < 0.5:
+            day += datetime.timedelta(days=1)
+        date = day.strftime("%d-%m-%Y")
+        kind = rng.random()
+        if kind < 0.1:
+            row = [date, "08:00", "", "", "bij NS", euro(cents(rng, 1000, 5000), ","),
+                   "Saldo automatisch opgeladen", "", "", ""]
+        elif kind < 0.3:
+            # Check-ins cost nothing, the importer leaves them out.
+            row = [date, "08:00", rng.choice(stations), "", "", "0,00", "Check-in", "", "", ""]
+        else:
+            row = [date, "", rng.choice(stations), "09:00", rng.choice(stations),
+                   euro(cents(rng, 100, 3000), ","), "Check-uit", "2", "Reizen op saldo", ""]
+        writer.writerow(row + ["Card owner name", "1234 5678 9012 3456"])
+
+
+FORMATS: Dict[str, Callable[[TextIO, int, random.Random], None]] = {
+    "asnbank": asnbank,
+    "coinbase": coinbase,
+    "ovchipkaart": ovchipkaart,
+    "paypal": paypal,
+}
+
+
+def generate(name: str, rows: int, path: str, seed: int = 0) -> None:
+    """Write a synthetic export with about the given number of rows."""
+    with open(path, "w", encoding="utf8", newline="") as fd:
+        FORMATS[name](fd, rows, random.Random(seed))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("format", choices=sorted(FORMATS))
+    parser.add_argument("rows", type=int)
+    parser.add_argument("output")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate(args.format, args.rows, args.output, args.seed)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""Check the import time of the importer modules.
+
+Every module is imported in a fresh interpreter with `python -X importtime`.
+The check fails if a module takes longer than the budget to import, or if it
+pulls in modules that an importer never needs, such as GUI toolkits.
+
+Usage: python benchmarks/importtime.py [--budget-ms 1000]
+"""
+
+import argparse
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+MODULES = [
+    "beangulp_asnbank.importer",
+    "beangulp_coinbase.importer",
+    "beangulp_ovchipkaart.importer",
+    "beangulp_paypal.importer",
+]
+
+# Modules that should never be imported by an importer.
+FORBIDDEN = {
+    "_tkinter",
+    "tkinter",
+    "turtle",
+    "turtledemo",
+    "idlelib",
+    "pydoc",
+    "doctest",
+    "pdb",
+    "unittest",
+}
+
+# Cumulative import time budget per module, including beancount and beangulp.
+BUDGET_MS = 1000
+
+
+def measure(module: str) -> Tuple[float, Dict[str, float]]:
+    """Import the module in a new interpreter.
+
+    Returns the cumulative import time of the module in milliseconds and the
+    cumulative time of every module that was imported along the way.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + module],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imported = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if not cumulative.strip().isdigit():
+            # The header line.
+            continue
+        imported[name.strip()] = int(cumulative) / 1000
+    return imported[module], imported
+
+
+def check(module: str, budget_ms: float) -> List[str]:
+    """Return the problems found for a module, if any."""
+    elapsed, imported = measure(module)
+    print(f"{module:32} {elapsed:8.1f} ms")
+    problems = []
+    if elapsed > budget_ms:
+        problems.append(f"{module} took {elapsed:.1f} ms, budget is {budget_ms} ms")
+    for name in sorted(FORBIDDEN.intersection(imported)):
+        problems.append(f"{module} imports {name}")
+    return problems
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS)
+    args = parser.parse_args()
+
+    problems = []
+    for module in MODULES:
+        problems.extend(check(module, args.budget_ms))
+    for problem in problems:
+        print("FAIL:", problem)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+"""Benchmark the importers on synthetic exports.
+
+Every importer extracts a generated file of each size in a new interpreter,
+so that the peak memory of one run does not hide that of another. Reported
+per run:
+
+- rows/s: data rows per second of extract().
+- peak RSS: maximum resident memory of the interpreter, in MB.
+- read: reading the rows and parsing all their columns.
+- finalize: building and finalizing the transactions, beyond read.
+- post: the rest of extract(), such as the PayPal merge or the ASN balances.
+
+The stages are timed as separate passes over the file. With --baseline, the
+run fails if an importer got more than --threshold slower than the baseline
+saved with --save on the same machine.
+
+Usage: python benchmarks/suite.py [--sizes 1000,100000] [--importers asnbank,paypal]
+                                  [--save FILE] [--baseline FILE] [--threshold 0.2]
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+# Run from a checkout without installing the package.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import generate
+
+SIZES = [1_000, 100_000, 1_000_000]
+DEFAULT_SIZES = [1_000, 100_000]
+THRESHOLD = 0.2
+SEED = 0
+
+
+def create(name: str):
+    """An importer as the benchmark configures it."""
+    if name == "asnbank":
+        from beangulp_asnbank.importer import Importer
+
+        return Importer(
+            generate.ASN_ACCOUNTS,
+            interest_account="Income:Rente",
+            investment_account="Assets:Beleggen",
+            profit_loss_account="Income:PL",
+        )
+    if name == "coinbase":
+        from beangulp_coinbase.importer import Importer
+
+        return Importer(
+            "Assets:Coinbase",
+            "Income:CoinbaseEarn",
+            "Income:PL",
+            "Expenses:TradingFees",
+            "Income:CoinbaseRewards",
+        )
+    if name == "ovchipkaart":
+        from beangulp_ovchipkaart.importer import Importer
+
+        return Importer("Assets:OvChipkaart", "Liabilities:OvIncasso")
+    if name == "paypal":
+        from beangulp_paypal.importer import Importer
+
+        return Importer("EUR", "Assets:Paypal", "Liabilities:DirectDebit")
+    raise KeyError(name)
+
+
+def timed(function) -> float:
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def measure(name: str, filepath: str) -> Dict[str, float]:
+    """Extract the file and time the stages, in this interpreter."""
+    importer = create(name)
+    rows = 0
+
+    def read():
+        nonlocal rows
+        rows = 0
+        for _, row, _ in importer.read_rows(filepath):
+            if row is None:
+                continue
+            rows += 1
+            for column in importer.columns:
+                getattr(row, column)
+
+    def transactions():
+        for _ in importer.transactions(filepath):
+            pass
+
+    # Extract first, so that the peak memory is that of extract().
+    extract = timed(lambda: importer.extract(filepath, []))
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != "darwin":
+        # Linux reports kilobytes, macOS bytes.
+        peak *= 1024
+    read_time = timed(read)
+    transactions_time = timed(transactions)
+    return {
+        "rows": rows,
+        "rows_per_second": rows / extract,
+        "peak_rss_mb": peak / 2**20,
+        "read": read_time,
+        "finalize": max(transactions_time - read_time, 0.0),
+        "post": max(extract - transactions_time, 0.0),
+        "extract": extract,
+    }
+
+
+def export(name: str, size: int, directory: str) -> str:
+    """The path of the generated export, generated once per size and seed."""
+    filepath = os.path.join(directory, f"{name}-{size}-{SEED}.csv")
+    if not os.path.exists(filepath):
+        generate.generate(name, size, filepath + ".tmp", SEED)
+        os.replace(filepath + ".tmp", filepath)
+    return filepath
+
+
+def run(name: str, filepath: str) -> Dict[str, float]:
+    """Measure in a new interpreter."""
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--measure", name, filepath],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[str]:
+    """Return the runs that are slower than the baseline by more than the threshold."""
+    problems = []
+    for key, result in results.items():
+        before = baseline.get(key)
+        if before is None:
+            continue
+        minimum = before["rows_per_second"] * (1 - threshold)
+        if result["rows_per_second"] < minimum:
+            problems.append(
+                f"{key}: {result['rows_per_second']:,.0f} rows/s, "
+                f"baseline {before['rows_per_second']:,.0f} rows/s"
+            )
+    return problems
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)))
+    parser.add_argument("--importers", default=",".join(sorted(generate.FORMATS)))
+    parser.add_argument("--directory", default=os.path.join(tempfile.gettempdir(), "beangulp-benchmarks"))
+    parser.add_argument("--save", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare with the results in this file")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--measure", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(*args.measure)))
+        return 0
+
+    os.makedirs(args.directory, exist_ok=True)
+    results = {}
+    print(
+        f"{'run':24} {'rows/s':>12} {'peak MB':>9} {'read s':>8} {'finalize s':>11} {'post s':>8}"
+    )
+    for name in args.importers.split(","):
+        for size in map(int, args.sizes.split(",")):
+            key = f"{name}-{size}"
+            result = results[key] = run(name, export(name, size, args.directory))
+            print(
+                f"{key:24} {result['rows_per_second']:12,.0f} {result['peak_rss_mb']:9.1f} "
+                f"{result['read']:8.3f} {result['finalize']:11.3f} {result['post']:8.3f}"
+            )
+
+    if args.save:
+        with open(args.save, "w") as fd:
+            json.dump(results, fd, indent=1)
+    if args.baseline:
+        with open(args.baseline) as fd:
+            problems = compare(results, json.load(fd), args.threshold)
+        for problem in problems:
+            print("FAIL:", problem)
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())